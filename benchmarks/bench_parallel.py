@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+"""Measures how ParallelExecutor throughput scales with worker processes.
+
+A synthetic catalogue (see synthetic.py) is indexed in a temporary
+directory, and a set of query locations is searched in-process and then
+with 1, 2, 4, ... workers up to the number of CPUs.
+
+Usage:
+  python benchmarks/bench_parallel.py [--stores=<n>] [--queries=<n>]
+
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from synthetic import (
+    query_set,
+    write_catalogue
+)
+
+from storelocator.csv_parser import StoresParser  # noqa: E402
+from storelocator.parallel import ParallelExecutor  # noqa: E402
+
+
+def main(argv):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--stores", type=int, default=1000000)
+    parser.add_argument("--queries", type=int, default=200000)
+    parser.add_argument("--chunk-size", type=int, default=2000)
+    args = parser.parse_args(argv[1:])
+
+    directory = tempfile.mkdtemp()
+    try:
+        stores_csv = os.path.join(directory, 'stores.csv')
+        write_catalogue(stores_csv, args.stores, 0)
+        sp = StoresParser.get_StoresParser(stores_csv)
+        lat_lngs = query_set(args.queries)
+
+        start = time.perf_counter()
+        sp.nearest_many(lat_lngs)
+        serial = time.perf_counter() - start
+        print('in-process  {:10.0f} queries/sec'.format(
+            args.queries / serial
+        ))
+        workers = 1
+        while workers <= (os.cpu_count() or 1):
+            with ParallelExecutor(sp, workers, args.chunk_size) as executor:
+                executor.nearest_many(lat_lngs[:workers])
+                start = time.perf_counter()
+                executor.nearest_many(lat_lngs)
+                elapsed = time.perf_counter() - start
+            print('{:2} workers  {:10.0f} queries/sec  ({:.2f}x)'.format(
+                workers, args.queries / elapsed, serial / elapsed
+            ))
+            workers *= 2
+    finally:
+        shutil.rmtree(directory)
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+"""Compares the spatial backends of StoresParser.
+
+For each backend, reports build time, single-query and batch-query latency
+of nearest and radius queries, and pickled size, over random store
+coordinates.
+
+Usage:
+  python benchmarks/bench_spatial_index.py [--stores=<n>] [--queries=<n>]
+
+"""
+
+import argparse
+import numpy
+import os
+import pickle
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from storelocator.csv_parser import _chord_bound  # noqa: E402
+from storelocator.spatial_index import BACKENDS  # noqa: E402
+from storelocator.util import geodetic2ecef  # noqa: E402
+
+
+def random_ecef(n, seed):
+    """Returns (n, 3) ECEF coords of random points on the earth.
+
+    """
+
+    rng = numpy.random.default_rng(seed)
+    lats = numpy.degrees(numpy.arcsin(rng.uniform(-1, 1, n)))
+    lngs = rng.uniform(-180, 180, n)
+    return geodetic2ecef(lats, lngs)
+
+
+def timed(func, repeat=1):
+    """Returns the best wall time (s) of repeat calls to func.
+
+    """
+
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench(backend, stores, targets, radius):
+    """Returns timings (ms) and pickled size (bytes) of one backend.
+
+    """
+
+    index = [None]
+
+    def build():
+        index[0] = backend.build(stores)
+
+    results = {'build_ms': timed(build, 3) * 1000}
+    index = index[0]
+    single = targets[:200]
+    results['query_ms'] = timed(
+        lambda: [index.query(target[None, :], 1) for target in single]
+    ) * 1000 / len(single)
+    results['batch_query_ms'] = timed(lambda: index.query(targets, 1)) * 1000
+    results['ball_ms'] = timed(
+        lambda: [index.query_ball_point(target[None, :], radius)
+                 for target in single]
+    ) * 1000 / len(single)
+    results['batch_ball_ms'] = timed(
+        lambda: index.query_ball_point(targets, radius)
+    ) * 1000
+    results['pickle_bytes'] = len(pickle.dumps(index, protocol=-1))
+    return results
+
+
+def main(argv):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--stores", type=int, default=1000000)
+    parser.add_argument("--queries", type=int, default=10000)
+    parser.add_argument("--radius", type=float, default=50.0,
+                        help="Radius (km) of ball queries.")
+    args = parser.parse_args(argv[1:])
+
+    stores = random_ecef(args.stores, 0)
+    targets = random_ecef(args.queries, 1)
+    radius = _chord_bound(args.radius)
+    print('{} stores, {} queries'.format(args.stores, args.queries))
+    for name, backend in sorted(BACKENDS.items()):
+        results = bench(backend, stores, targets, radius)
+        print('{:8} '.format(name) + '  '.join(
+            '{} {:.4g}'.format(key, value)
+            for key, value in sorted(results.items())
+        ))
+
+if __name__ == '__main__':
+    main(sys.argv)
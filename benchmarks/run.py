@@ -0,0 +1,354 @@
+#!/usr/bin/env python
+"""Benchmarks every stage of StoreLocator on synthetic catalogues.
+
+For each catalogue size, a synthetic CSV is written to a temporary
+directory and each stage is timed: parsing (get_stores), indexing
+(build_tree, save, ingest), loading (get_StoresParser), searching (query,
+filter_stores, find_nearest_store, nearest, nearest_many), formatting
+(format_result, format_many) and find_store end to end.  Geocoding is
+stubbed, so nothing leaves the machine.
+
+Every stage reports p50/p99/mean latency, throughput and peak RSS, and
+the results are written as JSON so that runs on different commits can be
+compared with --compare.
+
+Usage:
+  python benchmarks/run.py [--sizes=1000,10000,...] [--queries=<n>]
+                           [--output=<results.json>]
+                           [--compare=<baseline.json>]
+
+"""
+
+import argparse
+import datetime
+import importlib.machinery
+import importlib.util
+import json
+import numpy
+import os
+import platform
+import resource
+import scipy
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from synthetic import (
+    ROOT,
+    query_set,
+    write_catalogue
+)
+
+from storelocator.constants import (  # noqa: E402
+    INC_RADIUS,
+    INITIAL_RADIUS
+)
+from storelocator.csv_parser import StoresParser  # noqa: E402
+from storelocator.formatter import ResultFormatter  # noqa: E402
+from storelocator.providers import GeocoderProvider  # noqa: E402
+from storelocator.util import (  # noqa: E402
+    filter_stores,
+    find_nearest_store,
+    format_result,
+    geodetic2ecef
+)
+
+
+DEFAULT_SIZES = [1000, 10000, 100000, 1000000, 10000000]
+BRUTE_FORCE_OPS = 10 ** 8
+
+
+class StubProvider(GeocoderProvider):
+    """StubProvider geocodes 'lat,lng' strings without a network.
+
+    """
+
+    name = 'stub'
+    remote = False
+
+    def geocode(self, query):
+        lat, lng = query.split(',')
+        return [float(lat), float(lng)]
+
+
+def load_find_store():
+    """Imports scripts/find_store, which has no .py suffix, as a module.
+
+    """
+
+    path = os.path.join(ROOT, 'scripts', 'find_store')
+    loader = importlib.machinery.SourceFileLoader('find_store', path)
+    spec = importlib.util.spec_from_loader('find_store', loader)
+    module = importlib.util.module_from_spec(spec)
+    loader.exec_module(module)
+    return module
+
+
+def reset_peak_rss():
+    """Resets the peak RSS of this process, where Linux allows it.
+
+    """
+
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except (IOError, OSError):
+        pass
+
+
+def peak_rss_mb():
+    """Returns the peak RSS (MB) of this process since the last reset.
+
+    """
+
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024.0
+    except (IOError, OSError):
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        return peak / 1024.0 / 1024.0
+    return peak / 1024.0
+
+
+def measure(results, size, stage, func, args, items=None):
+    """Times func once per entry of args and records the stage.
+
+    Args:
+        results (list(dict)): Results to append to.
+        size (int): Number of stores in the catalogue.
+        stage (str): Name of the stage.
+        func (callable): Function to time.
+        args (list(tuple)): Positional arguments of each call.
+        items (int, optional): Items (rows or queries) handled per call,
+            for throughput.  Defaults to 1.
+    Returns:
+        Return value of the last call.
+
+    """
+
+    reset_peak_rss()
+    latencies = []
+    value = None
+    for call_args in args:
+        start = time.perf_counter()
+        value = func(*call_args)
+        latencies.append(time.perf_counter() - start)
+    latencies = numpy.array(latencies) * 1000
+    total = latencies.sum() / 1000
+    record = {
+        'stores': size,
+        'stage': stage,
+        'calls': len(latencies),
+        'p50_ms': float(numpy.percentile(latencies, 50)),
+        'p99_ms': float(numpy.percentile(latencies, 99)),
+        'mean_ms': float(latencies.mean()),
+        'throughput_per_s': (
+            (items or 1) * len(latencies) / total if total > 0 else None
+        ),
+        'peak_rss_mb': peak_rss_mb()
+    }
+    results.append(record)
+    print('{:>9} {:22} p50 {:10.3f} ms  p99 {:10.3f} ms  {:12.1f}/s  '
+          '{:8.1f} MB'.format(
+              size, stage, record['p50_ms'], record['p99_ms'],
+              record['throughput_per_s'] or 0, record['peak_rss_mb']
+          ))
+    sys.stdout.flush()
+    return value
+
+
+def bench_size(results, size, queries, find_store, directory):
+    """Runs every stage on one synthetic catalogue.
+
+    """
+
+    stores_csv = os.path.join(directory, 'stores-{}.csv'.format(size))
+    write_catalogue(stores_csv, size)
+    lat_lngs = query_set(queries)
+    targets = [geodetic2ecef(lat, lng) for lat, lng in lat_lngs]
+
+    sp = StoresParser(stores_csv)
+    measure(results, size, 'get_stores', sp.get_stores, [()], size)
+    measure(results, size, 'build_tree', sp.build_tree, [()], size)
+    measure(results, size, 'save', sp.save, [()], size)
+    measure(
+        results, size, 'get_StoresParser',
+        StoresParser.get_StoresParser, [(stores_csv,)] * 5
+    )
+    measure(
+        results, size, 'ingest', StoresParser(stores_csv).ingest, [()], size
+    )
+    sp = StoresParser.get_StoresParser(stores_csv)
+
+    measure(
+        results, size, 'query',
+        sp.query, [(target, INITIAL_RADIUS) for target in targets]
+    )
+    candidates = measure(
+        results, size, 'filter_stores',
+        lambda target: filter_stores(sp, target, INITIAL_RADIUS, INC_RADIUS),
+        [(target,) for target in targets]
+    )
+    filtered = [
+        filter_stores(sp, target, INITIAL_RADIUS, INC_RADIUS)
+        for target in targets
+    ]
+    measure(
+        results, size, 'find_nearest_store',
+        find_nearest_store,
+        [(lat_lng, stores, 'mi') for lat_lng, stores in zip(
+            lat_lngs, filtered)]
+    )
+    brute = max(1, min(queries, BRUTE_FORCE_OPS // size))
+    measure(
+        results, size, 'find_nearest_store_all',
+        find_nearest_store,
+        [(lat_lng, sp.stores, 'mi') for lat_lng in lat_lngs[:brute]]
+    )
+    del candidates, filtered
+    measure(
+        results, size, 'nearest',
+        sp.nearest, [(lat_lng,) for lat_lng in lat_lngs]
+    )
+    nearest_many = measure(
+        results, size, 'nearest_many',
+        sp.nearest_many, [(lat_lngs,)] * 3, queries
+    )
+    measure(
+        results, size, 'format_result',
+        lambda: [
+            format_result(store, distance, 'mi', 'json')
+            for nearest in nearest_many for store, distance in nearest
+        ],
+        [()] * 3, queries
+    )
+    for output in ['text', 'json', 'csv', 'binary']:
+        measure(
+            results, size, 'format_many_' + output,
+            ResultFormatter(output, 'mi').format_many,
+            [(nearest_many,)] * 3, queries
+        )
+
+    provider = StubProvider()
+    text_queries = ['{!r},{!r}'.format(lat, lng) for lat, lng in lat_lngs]
+    measure(
+        results, size, 'find_store',
+        lambda query: find_store.find_store(
+            query, stores_csv=stores_csv, provider=provider
+        ),
+        [(query,) for query in text_queries[:max(1, queries // 10)]]
+    )
+    measure(
+        results, size, 'find_stores',
+        lambda: list(find_store.find_stores(
+            text_queries, stores_csv=stores_csv, provider=provider
+        )),
+        [()], queries
+    )
+    for name in os.listdir(directory):
+        os.remove(os.path.join(directory, name))
+
+
+def environment():
+    """Describes the commit and platform the benchmark ran on.
+
+    """
+
+    try:
+        commit = subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'],
+            cwd=ROOT,
+            stderr=subprocess.DEVNULL
+        ).decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'date': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'numpy': numpy.__version__,
+        'scipy': scipy.__version__,
+        'platform': platform.platform(),
+        'cpus': os.cpu_count()
+    }
+
+
+def compare(results, queries, baseline_path):
+    """Prints the p50 latency of each stage relative to a baseline run.
+
+    """
+
+    with open(baseline_path) as f:
+        baseline_run = json.load(f)
+    baseline = {
+        (record['stores'], record['stage']): record
+        for record in baseline_run['results']
+    }
+    if baseline_run.get('queries') != queries:
+        print('\nWarning: the baseline ran {} queries per catalogue, not {}; '
+              'batch stages are not comparable.'.format(
+                  baseline_run.get('queries'), queries
+              ))
+    print('\nCompared to {} (p50 ratio, > 1 is slower):'.format(
+        baseline_path
+    ))
+    for record in results:
+        old = baseline.get((record['stores'], record['stage']))
+        if old is None or not old['p50_ms']:
+            continue
+        print('{:>9} {:22} {:8.2f}x'.format(
+            record['stores'], record['stage'],
+            record['p50_ms'] / old['p50_ms']
+        ))
+
+
+def main(argv):
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--sizes",
+        help="Comma-separated catalogue sizes (up to 10000000).",
+        default=','.join(str(size) for size in DEFAULT_SIZES),
+    )
+    parser.add_argument(
+        "--queries",
+        help="Number of query locations per catalogue.",
+        type=int,
+        default=1000,
+    )
+    parser.add_argument(
+        "--output",
+        help="JSON file to write results to.",
+        default='benchmark-results.json',
+    )
+    parser.add_argument(
+        "--compare",
+        help="JSON results of an earlier run to compare against.",
+    )
+    args = parser.parse_args(argv[1:])
+
+    find_store = load_find_store()
+    results = []
+    directory = tempfile.mkdtemp()
+    try:
+        for size in [int(size) for size in args.sizes.split(',')]:
+            bench_size(results, size, args.queries, find_store, directory)
+    finally:
+        shutil.rmtree(directory)
+    with open(args.output, 'w') as f:
+        json.dump({
+            'environment': environment(),
+            'queries': args.queries,
+            'results': results
+        }, f, indent=2)
+    print('Results written to {}.'.format(args.output))
+    if args.compare is not None:
+        compare(results, args.queries, args.compare)
+
+if __name__ == '__main__':
+    main(sys.argv)
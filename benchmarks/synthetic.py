@@ -0,0 +1,132 @@
+"""Synthetic store catalogues and query sets for the benchmarks.
+
+Stores cluster around cities whose sizes follow a Zipf distribution, with
+a share of rural stores spread uniformly over the contiguous US, so that
+tree depth, ball sizes and nearest distances vary the way they do in a
+real catalogue.  Queries are drawn from the same mix.
+
+"""
+
+import csv
+import numpy
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from storelocator.constants import STORE_FIELDS  # noqa: E402
+
+
+CONUS = (24.5, 49.0, -124.7, -66.9)
+CITIES = 300
+CITY_SEED = 42
+STATES = [
+    'AL', 'AZ', 'AR', 'CA', 'CO', 'CT', 'DE', 'FL', 'GA', 'ID', 'IL', 'IN',
+    'IA', 'KS', 'KY', 'LA', 'ME', 'MD', 'MA', 'MI', 'MN', 'MS', 'MO', 'MT',
+    'NE', 'NV', 'NH', 'NJ', 'NM', 'NY', 'NC', 'ND', 'OH', 'OK', 'OR', 'PA',
+    'RI', 'SC', 'SD', 'TN', 'TX', 'UT', 'VT', 'VA', 'WA', 'WV', 'WI', 'WY'
+]
+
+
+def cities():
+    """Returns the centres, weights and spreads (degrees) of the cities.
+
+    The cities are the same for every catalogue and query set.
+
+    """
+
+    rng = numpy.random.default_rng(CITY_SEED)
+    lats = rng.uniform(CONUS[0], CONUS[1], CITIES)
+    lngs = rng.uniform(CONUS[2], CONUS[3], CITIES)
+    weights = 1 / numpy.arange(1, CITIES + 1) ** 1.07
+    weights /= weights.sum()
+    spreads = 0.03 + 0.3 * numpy.sqrt(weights / weights[0])
+    return lats, lngs, weights, spreads
+
+
+def synthetic_coords(n, seed, urban_share=0.8):
+    """Draws n coordinates, urban_share of them around cities.
+
+    Args:
+        n (int): Number of coordinates.
+        seed (int): Random seed.
+        urban_share (float, optional): Share of coordinates near cities.
+    Returns:
+        (n, 2) array of latitudes and longitudes.
+
+    """
+
+    rng = numpy.random.default_rng(seed)
+    city_lats, city_lngs, weights, spreads = cities()
+    urban = rng.random(n) < urban_share
+    city = rng.choice(CITIES, size=n, p=weights)
+    lats = numpy.where(
+        urban,
+        city_lats[city] + rng.normal(0, 1, n) * spreads[city],
+        rng.uniform(CONUS[0], CONUS[1], n)
+    )
+    lngs = numpy.where(
+        urban,
+        city_lngs[city] + rng.normal(0, 1, n) * spreads[city],
+        rng.uniform(CONUS[2], CONUS[3], n)
+    )
+    return numpy.column_stack([
+        numpy.clip(lats, -90, 90),
+        numpy.clip(lngs, -180, 180)
+    ])
+
+
+def write_catalogue(path, n, seed=0):
+    """Writes a CSV of n synthetic stores with every store-locations field.
+
+    Args:
+        path (str): Path of the CSV.
+        n (int): Number of stores.
+        seed (int, optional): Random seed.
+
+    """
+
+    fields = [
+        STORE_FIELDS['NAME'],
+        STORE_FIELDS['LOCATION'],
+        STORE_FIELDS['ADDRESS'],
+        STORE_FIELDS['CITY'],
+        STORE_FIELDS['STATE'],
+        STORE_FIELDS['ZIP_CODE'],
+        STORE_FIELDS['LATITUDE'],
+        STORE_FIELDS['LONGITUDE'],
+        STORE_FIELDS['COUNTY']
+    ]
+    chunk = 100000
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(fields)
+        for start in range(0, n, chunk):
+            coords = synthetic_coords(min(chunk, n - start), seed + start)
+            for i, (lat, lng) in enumerate(coords.tolist(), start):
+                writer.writerow([
+                    'Store {}'.format(i % 5000),
+                    'SEC Main St & {} Ave'.format(i % 997),
+                    '{} Main St'.format(i),
+                    'City {}'.format(i % 3000),
+                    STATES[i % len(STATES)],
+                    '{:05d}'.format(i % 99999),
+                    '{:.7f}'.format(lat),
+                    '{:.7f}'.format(lng),
+                    'County {}'.format(i % 800)
+                ])
+
+
+def query_set(n, seed=1):
+    """Draws n query locations, more of them rural than stores are.
+
+    Args:
+        n (int): Number of queries.
+        seed (int, optional): Random seed.
+    Returns:
+        List of latitudes and longitudes (lists of floats).
+
+    """
+
+    return synthetic_coords(n, seed, urban_share=0.7).tolist()
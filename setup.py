@@ -20,5 +20,8 @@ setuptools.setup(
         'numpy>=1.15.0',
         'scipy>=1.1.0'
     ],
+    extras_require={
+        'karney': ['geographiclib>=1.49']
+    },
     include_package_data=True
 )
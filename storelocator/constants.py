@@ -1,31 +1,91 @@
-import pkg_resources
+import os
 
 
+package_path = os.path.dirname(os.path.abspath(__file__))
 path = 'csv/store-locations.csv'
-DEFAULT_CSV = pkg_resources.resource_filename(__name__, path)
+DEFAULT_CSV = os.path.join(package_path, *path.split('/'))
+zip_path = 'csv/zip-centroids.csv'
+DEFAULT_ZIP_CSV = os.path.join(package_path, *zip_path.split('/'))
 
 # Don't Change
 
 KILOMETERS_TO_MILES = 0.621371
 DISTANCE_RADIUS = 6371
 UNITS = ['mi', 'km']
+DISTANCE_MODELS = ['haversine', 'vincenty', 'karney']
 OUTPUT = ['text', 'json']
+BULK_OUTPUT = ['csv', 'binary']
+PROFILE_MODES = ['cprofile', 'tracemalloc']
 
 # Constants defined by the World Geodetic System 1984 (WGS84)
 A = 6378.137
 B = 6356.7523142
 ESQ = 6.69437999014 * 0.001
+F = 1 / 298.257223563
 
 # Config
 
 STORES_CSV = DEFAULT_CSV
+ZIP_CENTROIDS_CSV = DEFAULT_ZIP_CSV
 DEFAULT_OUTPUT = 'text'
 DEFAULT_UNITS = 'mi'
 DEFAULT_ENCODING = 'utf-8-sig'
 DEFAULT_DELIMITER = ','
 DISTANCE_PRECISION = 2
+DISTANCE_MODEL = 'haversine'
+SPHERICAL_ERROR = 0.0075
+VINCENTY_ITERATIONS = 200
+VINCENTY_TOLERANCE = 1e-12
+VINCENTY_SCALAR_MAX = 32
 INITIAL_RADIUS = 100
 INC_RADIUS = 100
+BATCH_SIZE = 10000
+RANGE_LIMIT = 100
+FILTER_BRUTE_MAX = 50000
+FILTER_OVERSAMPLE = 4
+INGEST_CHUNK_SIZE = 20000
+INDEX_SUFFIX = '.idx'
+INDEX_VERIFY = False
+COMPACT_THRESHOLD = 1000
+SPATIAL_BACKEND = 'ckdtree'
+AUTO_BACKEND = 'auto'
+BRUTE_FORCE_MAX = 1000000
+BRUTE_FORCE_CHUNK = 4000000
+GRID_K = 1
+GRID_CELLS_PER_STORE = 4
+GRID_MIN_CELL = 0.01
+GRID_MAX_CELL = 1.0
+GRID_MAX_CELLS = 4000000
+GRID_MARGIN = 1.0
+GRID_SLACK = 1e-9
+GRID_BUILD_CHUNK = 10000
+TREE_LEAFSIZE = 16
+TREE_BALANCED = False
+TREE_COMPACT = True
+TREE_WORKERS = -1
+TREE_PARALLEL_MIN = 256
+SHARD_PRECISION = 2
+PARALLEL_WORKERS = None
+PARALLEL_CHUNK_SIZE = 2000
+SHARD_MANIFEST = 'manifest.idx'
+PROFILE_LINES = 25
+SERVER_HOST = '127.0.0.1'
+SERVER_PORT = 8080
+SERVER_WORKERS = 8
+SERVER_IDLE_TIMEOUT = 10
+SERVER_REQUEST_TIMEOUT = 10
+SERVER_MAX_K = 1000
+GEOCODE_PROVIDER = 'google'
+GEOCODE_CACHE_PATH = None
+GEOCODE_CACHE_SIZE = 10000
+GEOCODE_CACHE_DISK_SIZE = 1000000
+GEOCODE_CACHE_DISK_SLACK = 10000
+GEOCODE_CACHE_TTL = 30 * 24 * 60 * 60
+GEOCODE_NEGATIVE_TTL = 60 * 60
+GEOCODE_CONCURRENCY = 8
+GEOCODE_RATE = 50
+GEOCODE_RETRIES = 3
+GEOCODE_BACKOFF = 0.5
 
 # CSV Field Names
 STORE_FIELDS = {
@@ -38,5 +98,27 @@ STORE_FIELDS = {
     'ZIP_CODE': 'Zip Code',
     'LATITUDE': 'Latitude',
     'LONGITUDE': 'Longitude',
-    'DISTANCE': 'Distance'
+    'DISTANCE': 'Distance',
+    'TIMINGS': 'Timings'
 }
+
+# Store fields written by csv and binary output, in csv order
+OUTPUT_FIELDS = [
+    STORE_FIELDS['NAME'],
+    STORE_FIELDS['LOCATION'],
+    STORE_FIELDS['ADDRESS'],
+    STORE_FIELDS['CITY'],
+    STORE_FIELDS['STATE'],
+    STORE_FIELDS['ZIP_CODE'],
+    STORE_FIELDS['LATITUDE'],
+    STORE_FIELDS['LONGITUDE'],
+    STORE_FIELDS['COUNTY']
+]
+
+# Store fields with few distinct values, stored dictionary-encoded
+CATEGORICAL_FIELDS = [
+    STORE_FIELDS['NAME'],
+    STORE_FIELDS['CITY'],
+    STORE_FIELDS['STATE'],
+    STORE_FIELDS['COUNTY']
+]
@@ -1,22 +1,65 @@
 import codecs
 from storelocator.constants import (
+    A,
+    B,
+    COMPACT_THRESHOLD,
     DEFAULT_DELIMITER,
     DEFAULT_ENCODING,
+    DEFAULT_UNITS,
+    DISTANCE_MODEL,
+    FILTER_BRUTE_MAX,
+    FILTER_OVERSAMPLE,
+    INDEX_SUFFIX,
+    INDEX_VERIFY,
+    INGEST_CHUNK_SIZE,
+    KILOMETERS_TO_MILES,
+    SPATIAL_BACKEND,
     STORE_FIELDS
 )
 import csv
+from storelocator.ingest import ingest_csv
+import math
+from storelocator.nearest_grid import NearestGrid
+from storelocator.index_file import (
+    IndexFormatError,
+    StaleIndexError,
+    read_index,
+    source_matches,
+    source_meta,
+    write_index
+)
 import numpy
 import os
-import pickle
-from scipy.spatial import KDTree
+import shutil
+from storelocator.spatial_index import (
+    BruteForceIndex,
+    get_backend
+)
+from storelocator.store_table import (
+    StoreFilter,
+    StoreTable,
+    StoreTableBuilder
+)
+import tempfile
 from storelocator.util import (
+    bbox_circle,
+    calculate_distance,
+    distance_function,
     euclidean_distance,
-    geodetic2ecef
+    geodetic2ecef,
+    haversine_bound,
+    haversine_distances,
+    in_bbox,
+    points_in_polygon,
+    polygon_bbox
 )
 
 
+CHORD_SLACK = 1.01
+
+
 class StoresParser(object):
-    """StoresParser converts a CSV of stores data into a list of stores.
+    """StoresParser converts a CSV of stores data into a table of stores.
 
     """
 
@@ -24,37 +67,152 @@ class StoresParser(object):
             self,
             file_path,
             encoding=DEFAULT_ENCODING,
-            delimiter=DEFAULT_DELIMITER
+            delimiter=DEFAULT_DELIMITER,
+            backend=SPATIAL_BACKEND,
+            grid=False
             ):
         """Initialization creates a StoresParser instance to parse provided CSV.
 
         StoresParser is initialized with a relative file path to a CSV
         containing data about stores.  Optionally, the encoding of the CSV
         and the field delimiter may be passed to dictate how the CSV will
-        be parsed.
+        be parsed, and the spatial backend the stores are indexed with.
 
         Args:
             file_path (str): Relative path to the CSV.
             encoding (str, optional): Encoding of the CSV.
             delimiter (str, optional): Field delimiter of the CSV.
+            backend (str, optional): Spatial backend (ckdtree, kdtree,
+                brute or auto).
+            grid (bool, optional): Whether to build a NearestGrid along
+                with the tree, answering nearest store lookups without it.
 
         """
         self.file_path = file_path
         self.encoding = encoding
         self.delimiter = delimiter
+        self.backend = backend
         self.stores = None
         self.tree = None
+        self.grid_enabled = grid
+        self.grid = None
+        self.source = None
+        self.delta = {}
+        self.removed = set()
+        self.compact_threshold = COMPACT_THRESHOLD
+        self._delta_stores = None
+        self._next_id = 0
+        self._dirty = False
 
     @staticmethod
-    def get_StoresParser(stores_csv):
-        if os.path.exists('{}.pkl'.format(stores_csv)):
-            with open('{}.pkl'.format(stores_csv), 'rb') as input:
-                sp = pickle.load(input)
-        else:
-            sp = StoresParser(stores_csv)
-            sp.get_stores()
-            sp.build_tree()
-            sp.save()
+    def get_StoresParser(
+            stores_csv,
+            encoding=DEFAULT_ENCODING,
+            delimiter=DEFAULT_DELIMITER,
+            backend=SPATIAL_BACKEND,
+            grid=None,
+            verify=INDEX_VERIFY
+            ):
+        """Loads the StoresParser for a CSV from its index file.
+
+        The CSV is streamed into a new index file with ingest when no
+        usable index file exists: it is missing, corrupt, from another
+        version, built with other parser settings or built from an older
+        version of the CSV.
+
+        Args:
+            stores_csv (str): Relative path to the CSV.
+            encoding (str, optional): Encoding of the CSV.
+            delimiter (str, optional): Field delimiter of the CSV.
+            backend (str, optional): Spatial backend (ckdtree, kdtree,
+                brute or auto).
+            grid (bool, optional): Whether the index file should hold a
+                NearestGrid.  Defaults to keeping whatever the existing
+                index file holds, so a grid is rebuilt when the CSV changes.
+            verify (bool, optional): Whether to check the checksum of the
+                index file's data, which reads every page of it once.
+        Returns:
+            StoresParser instance with stores and tree populated.
+
+        """
+
+        try:
+            sp = StoresParser.load(
+                stores_csv, encoding, delimiter, backend, verify
+            )
+            if grid is None or (sp.grid is not None) == grid:
+                return sp
+        except (IOError, IndexFormatError):
+            if grid is None:
+                grid = _has_grid(stores_csv + INDEX_SUFFIX)
+        sp = StoresParser(stores_csv, encoding, delimiter, backend, grid)
+        sp.ingest()
+        return sp
+
+    @staticmethod
+    def load(
+            stores_csv,
+            encoding=DEFAULT_ENCODING,
+            delimiter=DEFAULT_DELIMITER,
+            backend=SPATIAL_BACKEND,
+            verify=INDEX_VERIFY
+            ):
+        """Opens the index file of a CSV as a StoresParser.
+
+        Store columns are memory mapped from the index file.  The tree is
+        restored from its saved nodes when the file was written with the
+        same backend and version of scipy, and rebuilt from the saved ECEF
+        coords otherwise.  A NearestGrid saved with the stores is memory
+        mapped too.  The next store id is restored as well, so ids of
+        removed stores are never handed out again.
+
+        The index file records the size, modification time and SHA-256 hash
+        of the CSV it was built from.  The hash is only recalculated when the
+        size matches but the modification time does not.
+
+        Args:
+            stores_csv (str): Relative path to the CSV.
+            encoding (str, optional): Encoding of the CSV.
+            delimiter (str, optional): Field delimiter of the CSV.
+            backend (str, optional): Spatial backend (ckdtree, kdtree,
+                brute or auto).
+            verify (bool, optional): Whether to check the checksum of the
+                index file's data, which reads every page of it once.  The
+                header is checked either way.
+        Returns:
+            StoresParser instance with stores and tree populated.
+        Raises:
+            IOError: If the index file cannot be read.
+            IndexFormatError: If the index file is corrupt or outdated.
+            StaleIndexError: If the CSV or parser settings have changed since
+                the index file was saved.
+
+        """
+
+        arrays, meta = read_index(stores_csv + INDEX_SUFFIX, verify)
+        try:
+            if (meta['encoding'], meta['delimiter']) != (encoding, delimiter):
+                raise StaleIndexError(
+                    'Index file was built with other parser settings.'
+                )
+            if not source_matches(stores_csv, meta['source']):
+                raise StaleIndexError(
+                    'Index file was built from another version of the CSV.'
+                )
+            sp = StoresParser(stores_csv, encoding, delimiter, backend)
+            sp.source = meta['source']
+            sp.stores = StoreTable.from_arrays(arrays, meta['table'])
+            sp.tree = get_backend(backend, len(sp.stores)).from_arrays(
+                arrays, meta['tree'], sp.stores.ecef
+            )
+            sp.grid = NearestGrid.from_arrays(arrays, meta.get('grid'))
+            sp.grid_enabled = sp.grid is not None
+            sp._next_id = max(
+                meta.get('next_id', 0),
+                int(sp.stores.ids[-1]) + 1 if len(sp.stores) else 0
+            )
+        except KeyError as e:
+            raise IndexFormatError('Index file is missing {}.'.format(e))
         return sp
 
     @property
@@ -121,6 +279,22 @@ class StoresParser(object):
 
         self.__stores = stores
 
+    @property
+    def backend(self):
+        """Getter for backend.
+
+        """
+
+        return self.__backend
+
+    @backend.setter
+    def backend(self, backend):
+        """Setter for backend.
+
+        """
+
+        self.__backend = backend
+
     @property
     def tree(self):
         """Getter for tree.
@@ -137,60 +311,1212 @@ class StoresParser(object):
 
         self.__tree = tree
 
+    @property
+    def source(self):
+        """Getter for source.
+
+        """
+
+        return self.__source
+
+    @source.setter
+    def source(self, source):
+        """Setter for source.
+
+        """
+
+        self.__source = source
+
+    @property
+    def delta(self):
+        """Getter for delta.
+
+        """
+
+        return self.__delta
+
+    @delta.setter
+    def delta(self, delta):
+        """Setter for delta.
+
+        """
+
+        self.__delta = delta
+
+    @property
+    def removed(self):
+        """Getter for removed.
+
+        """
+
+        return self.__removed
+
+    @removed.setter
+    def removed(self, removed):
+        """Setter for removed.
+
+        """
+
+        self.__removed = removed
+
+    @property
+    def compact_threshold(self):
+        """Getter for compact_threshold.
+
+        """
+
+        return self.__compact_threshold
+
+    @compact_threshold.setter
+    def compact_threshold(self, threshold):
+        """Setter for compact_threshold.
+
+        """
+
+        self.__compact_threshold = threshold
+
+    @property
+    def pending(self):
+        """Number of updates not yet compacted into stores and tree.
+
+        """
+
+        return len(self.delta) + len(self.removed)
+
+    @property
+    def dirty(self):
+        """Whether stores or tree changed since the index file was saved.
+
+        """
+
+        return self._dirty
+
     def save(self):
-        """Saves StoresParser instance to .pkl file.
+        """Saves StoresParser stores and tree to an index file.
+
+        Pending updates are compacted first, so they are saved too.  The
+        brute backend has no tree to save, so a SPATIAL_BACKEND tree is
+        built and saved in its place for the processes that load the file
+        with a tree backend.  The NearestGrid is built first when it is
+        enabled but missing.
 
         """
 
-        with open('{}.pkl'.format(self.file_path), 'wb') as output:
-            pickle.dump(self, output, pickle.HIGHEST_PROTOCOL)
+        if self.pending:
+            self.compact()
+        if self.grid_enabled and self.grid is None:
+            self.build_grid()
+        arrays, table_meta = self.stores.to_arrays()
+        tree_arrays, tree_meta = {}, None
+        if self.tree is not None:
+            tree_arrays, tree_meta = self.tree.to_arrays()
+            if tree_meta is None and len(self.stores):
+                tree_arrays, tree_meta = get_backend().build(
+                    self.stores.ecef
+                ).to_arrays()
+        arrays.update(tree_arrays)
+        grid_meta = None
+        if self.grid is not None:
+            grid_arrays, grid_meta = self.grid.to_arrays()
+            arrays.update(grid_arrays)
+        write_index(
+            self.file_path + INDEX_SUFFIX,
+            arrays,
+            {
+                'encoding': self.encoding,
+                'delimiter': self.delimiter,
+                'source': self.source,
+                'table': table_meta,
+                'tree': tree_meta,
+                'grid': grid_meta,
+                'next_id': self._next_id
+            }
+        )
+        self._dirty = False
 
     def build_tree(self):
-        """Creates KDTree representation of coordinate data.
+        """Creates spatial index of coordinate data with the backend.
 
         """
 
         if self.stores is not None:
-            stores_ecef = []
-            for store in self.stores:
-                store_ecef = geodetic2ecef(
-                    float(store[STORE_FIELDS['LATITUDE']]),
-                    float(store[STORE_FIELDS['LONGITUDE']])
-                )
-                store['ecef'] = store_ecef
-                stores_ecef.append(store_ecef)
-            self.tree = KDTree(numpy.array(stores_ecef))
+            self.stores.ecef = _table_ecef(self.stores)
+            self.tree = get_backend(self.backend, len(self.stores)).build(
+                self.stores.ecef
+            )
+            self.grid = None
+            self._dirty = True
+            if self.grid_enabled:
+                self.build_grid()
+
+    def build_grid(self):
+        """Creates the NearestGrid of the stores from the tree.
+
+        The grid is built with a SPATIAL_BACKEND tree when the backend is
+        brute, which would compare every cell with every store.
+
+        """
+
+        tree = self.tree
+        if isinstance(tree, BruteForceIndex):
+            tree = get_backend().build(self.stores.ecef)
+        self.grid = NearestGrid.build(
+            self.stores.lats, self.stores.lngs, tree
+        )
+
+    def get_store(self, store_id):
+        """Looks up a store (dict) by id, including pending updates.
+
+        Args:
+            store_id (int): Id of the store.
+        Returns:
+            Store (dict).
+        Raises:
+            KeyError: If no store has the id.
+
+        """
+
+        if store_id in self.delta:
+            return dict(self.delta[store_id])
+        row = self._static_row(store_id)
+        if row is None:
+            raise KeyError(store_id)
+        return self.stores[row]
+
+    def add_store(self, store):
+        """Adds a store without rebuilding the tree.
+
+        The store is kept in a small delta buffer that queries search by
+        brute force until the next compaction.
+
+        Args:
+            store (dict): Store to add.  Fields missing from the CSV's field
+                names are ignored, and absent fields are left empty.
+        Returns:
+            Id (int) of the new store.
+        Raises:
+            ValueError: If the store's latitude or longitude is not a number.
+
+        """
+
+        store_id = self._next_id
+        self._set_delta(store_id, store)
+        self._next_id += 1
+        self._maybe_compact()
+        return store_id
+
+    def remove_store(self, store_id):
+        """Removes a store without rebuilding the tree.
+
+        Args:
+            store_id (int): Id of the store.
+        Raises:
+            KeyError: If no store has the id.
+
+        """
+
+        if store_id in self.delta:
+            del self.delta[store_id]
+            self._delta_stores = None
+        else:
+            row = self._static_row(store_id)
+            if row is None:
+                raise KeyError(store_id)
+            self.removed.add(row)
+        self._maybe_compact()
+
+    def update_store(self, store_id, fields):
+        """Changes fields of a store (including moving it) without rebuilding.
+
+        Args:
+            store_id (int): Id of the store.
+            fields (dict): Field names and their new values.
+        Raises:
+            KeyError: If no store has the id.
+            ValueError: If the new latitude or longitude is not a number.
+
+        """
+
+        store = self.get_store(store_id)
+        store.update(fields)
+        self._set_delta(store_id, store)
+        row = self._static_row(store_id)
+        if row is not None:
+            self.removed.add(row)
+        self._maybe_compact()
+
+    def compact(self):
+        """Merges pending updates into stores and rebuilds the tree and grid.
+
+        """
+
+        if not self.pending:
+            return
+        keep = numpy.ones(len(self.stores), dtype=bool)
+        keep[list(self.removed)] = False
+        tables = [self.stores.select(numpy.flatnonzero(keep))]
+        if len(self.delta):
+            tables.append(self._get_delta_stores())
+        stores = StoreTable.concat(tables)
+        order = numpy.argsort(stores.ids, kind='stable')
+        if numpy.any(order != numpy.arange(len(stores))):
+            stores = stores.select(order)
+        self.stores = stores
+        self.delta = {}
+        self.removed = set()
+        self._delta_stores = None
+        self.tree = get_backend(self.backend, len(self.stores)).build(
+            self.stores.ecef
+        )
+        self.grid = None
+        self._dirty = True
+        if self.grid_enabled:
+            self.build_grid()
+
+    def _maybe_compact(self):
+        if (
+                self.compact_threshold is not None and
+                self.pending > self.compact_threshold):
+            self.compact()
+
+    def _static_row(self, store_id):
+        """Returns the row of a store id in stores, or None if removed.
+
+        """
+
+        row = int(numpy.searchsorted(self.stores.ids, store_id))
+        if (
+                row < len(self.stores) and
+                self.stores.ids[row] == store_id and
+                row not in self.removed):
+            return row
+        return None
+
+    def _set_delta(self, store_id, store):
+        store = {
+            fieldname: store.get(fieldname, '')
+            for fieldname in self.stores.fieldnames
+        }
+        float(store[STORE_FIELDS['LATITUDE']])
+        float(store[STORE_FIELDS['LONGITUDE']])
+        self.delta[store_id] = store
+        self._delta_stores = None
+
+    def _get_delta_stores(self):
+        """Returns pending added and updated stores as a StoreTable.
+
+        """
+
+        if self._delta_stores is None:
+            builder = StoreTableBuilder(self.stores.fieldnames)
+            for store_id in sorted(self.delta):
+                builder.append(self.delta[store_id], store_id)
+            self._delta_stores = builder.build()
+            self._delta_stores.ecef = _table_ecef(self._delta_stores)
+        return self._delta_stores
 
     def query(self, target_ecef, radius):
         """Searches for stores within a given radius of a location.
 
+        Pending updates are taken into account: removed stores are dropped
+        from the tree's matches and the delta buffer is searched by brute
+        force.
+
         Args:
             target_ecef (float): XYZ ECEF coords to search against.
             radius (float): Search radius.
         Returns:
-            List of stores within a given radius of a location.
+            StoreRows view of stores within a given radius of a location.
 
         """
 
         results = None
         if self.tree is not None:
-            matches = self.tree.query_ball_point(
+            [(rows, delta_rows)] = self._ball_rows(
                 [target_ecef],
-                r=euclidean_distance(radius)
+                [euclidean_distance(radius)]
             )
-            if len(matches):
-                results = [self.stores[match] for match in matches[0]]
+            if not self.pending:
+                return self.stores.take(rows)
+            table = StoreTable.concat([
+                self.stores.select(rows),
+                self._get_delta_stores().select(delta_rows)
+            ])
+            results = table.take(numpy.arange(len(table)))
         return results
 
+    def nearest(
+            self,
+            lat_lng,
+            k=1,
+            units=DEFAULT_UNITS,
+            timings=None,
+            include=None,
+            exclude=None,
+            model=DISTANCE_MODEL
+            ):
+        """Finds the k stores closest to a location.
+
+        See nearest_many.
+
+        Args:
+            lat_lng (list(float)): Latitude and longitude being compared to.
+            k (int, optional): Number of stores to find.
+            units (str, optional): Distance metric (mi or km).
+            timings (obj, optional): Timings instance to record stages in.
+            include (dict, optional): Value(s) of categorical fields stores
+                must have (see StoreFilter).
+            exclude (dict, optional): Value(s) of categorical fields stores
+                must not have.
+            model (str, optional): Distance model (haversine, vincenty or
+                karney) stores are ranked and measured by.
+        Returns:
+            List of store (dict) and distance (float) tuples, closest first.
+
+        """
+
+        return self.nearest_many(
+            [lat_lng], k, units, timings, include, exclude, model
+        )[0]
+
+    def nearest_many(
+            self,
+            lat_lngs,
+            k=1,
+            units=DEFAULT_UNITS,
+            timings=None,
+            include=None,
+            exclude=None,
+            model=DISTANCE_MODEL
+            ):
+        """Finds the k stores closest to each of many locations.
+
+        See nearest_candidates.
+
+        Args:
+            lat_lngs (list(list(float) or None)): Latitudes and longitudes
+                being compared to.  Entries that failed to geocode may be
+                None.
+            k (int, optional): Number of stores to find per location.
+            units (str, optional): Distance metric (mi or km).
+            timings (obj, optional): Timings instance to record stages in.
+            include (dict, optional): Value(s) of categorical fields stores
+                must have (see StoreFilter).
+            exclude (dict, optional): Value(s) of categorical fields stores
+                must not have.
+            model (str, optional): Distance model (haversine, vincenty or
+                karney) stores are ranked and measured by.
+        Returns:
+            List, in the same order as lat_lngs, of lists of store (dict) and
+            distance (float) tuples, closest first (ties go to the lowest
+            store id).
+        Raises:
+            ValueError: If a filtered field is not categorical or model is
+                not a known distance model.
+
+        """
+
+        candidates = self.nearest_candidates(
+            lat_lngs, k, units, timings, include, exclude, model
+        )
+        if timings is not None:
+            start = timings.clock()
+        results = [
+            [
+                (
+                    store,
+                    calculate_distance(lat_lng, [lat, lng], units, model)
+                )
+                for store, _, lat, lng in location_candidates
+            ]
+            for lat_lng, location_candidates in zip(lat_lngs, candidates)
+        ]
+        if timings is not None:
+            timings.lap('distance', start)
+        return results
+
+    def nearest_candidates(
+            self,
+            lat_lngs,
+            k=1,
+            units=DEFAULT_UNITS,
+            timings=None,
+            include=None,
+            exclude=None,
+            model=DISTANCE_MODEL
+            ):
+        """Finds the k stores closest to each of many locations, with ids.
+
+        The k nearest stores in ECEF space are found with one tree query, and
+        the farthest of them by haversine distance bounds the search: every
+        store that could be closer by haversine distance lies within a
+        slightly larger ECEF ball, which is searched next.  The few stores in
+        that ball are then ranked exactly, so the number of tree queries does
+        not depend on how dense or distant the stores are.  With include or
+        exclude, see filtered_candidates.
+
+        With an ellipsoidal model, the ball is widened by haversine_bound,
+        and the stores in it are prefiltered by haversine distance so that
+        model only measures the few that can be among the k nearest.
+
+        Args:
+            lat_lngs (list(list(float) or None)): Latitudes and longitudes
+                being compared to.  Entries that failed to geocode may be
+                None.
+            k (int, optional): Number of stores to find per location.
+            units (str, optional): Distance metric (mi or km) stores are
+                ranked by.
+            timings (obj, optional): Timings instance to record the knn, ball
+                and rank stages and the number of candidates ranked in.
+            include (dict, optional): Value(s) of categorical fields stores
+                must have (see StoreFilter).
+            exclude (dict, optional): Value(s) of categorical fields stores
+                must not have.
+            model (str, optional): Distance model (haversine, vincenty or
+                karney) stores are ranked by.
+        Returns:
+            List, in the same order as lat_lngs, of lists of store (dict),
+            store id (int), latitude and longitude (floats) tuples, closest
+            first (ties go to the lowest store id).
+        Raises:
+            ValueError: If a filtered field is not categorical or model is
+                not a known distance model.
+
+        """
+
+        distance_function(model)
+        store_filter = StoreFilter(include, exclude)
+        if store_filter:
+            return self.filtered_candidates(
+                lat_lngs, store_filter, k, units, timings, model
+            )
+        if (self.grid is not None and not self.pending and
+                k <= self.grid.k and model == 'haversine'):
+            return self.grid_candidates(lat_lngs, k, units, timings)
+        return self._tree_candidates(lat_lngs, k, units, timings, model)
+
+    def _tree_candidates(
+            self,
+            lat_lngs,
+            k,
+            units,
+            timings=None,
+            model=DISTANCE_MODEL
+            ):
+        """Finds the k stores closest to many locations with the tree.
+
+        See nearest_candidates.
+
+        """
+
+        if timings is not None:
+            start = timings.clock()
+        results = [[] for _ in lat_lngs]
+        located = [
+            i for i, lat_lng in enumerate(lat_lngs) if lat_lng is not None
+        ]
+        targets = numpy.array(
+            [lat_lngs[i] for i in located], dtype=numpy.float64
+        ).reshape(-1, 2)
+        targets_ecef = geodetic2ecef(targets[:, 0], targets[:, 1])
+        candidates = self.query_nearest(targets_ecef, k)
+        if timings is not None:
+            start = timings.lap('knn', start)
+        if candidates is None or k < 1:
+            return results
+        table, rows = candidates
+        bounds = numpy.max(haversine_distances(
+            targets[:, 0:1],
+            targets[:, 1:2],
+            numpy.asarray(table.lats)[rows],
+            numpy.asarray(table.lngs)[rows],
+            'km'
+        ), axis=1)
+        balls = self._ball_rows(targets_ecef, [
+            _chord_bound(bound)
+            for bound in haversine_bound(bounds, model).tolist()
+        ])
+        if timings is not None:
+            start = timings.lap('ball', start)
+            timings.count('candidates', sum(
+                len(rows) + len(delta_rows) for rows, delta_rows in balls
+            ))
+        for i, lat_lng, (rows, delta_rows) in zip(
+                located, targets.tolist(), balls):
+            results[i] = self._rank(
+                lat_lng, rows, delta_rows, k, units, model
+            )
+        if timings is not None:
+            timings.lap('rank', start)
+        return results
+
+    def grid_candidates(
+            self,
+            lat_lngs,
+            k=1,
+            units=DEFAULT_UNITS,
+            timings=None
+            ):
+        """Finds the k stores closest to many locations with the grid.
+
+        Each location's cell lists every store that can be among its
+        grid.k nearest, so ranking that list gives the same answer as
+        nearest_candidates.  Locations off the grid are searched with the
+        tree instead.
+
+        Args:
+            lat_lngs (list(list(float) or None)): Latitudes and longitudes
+                being compared to.  Entries that failed to geocode may be
+                None.
+            k (int, optional): Number of stores to find per location, at
+                most grid.k.
+            units (str, optional): Distance metric (mi or km) stores are
+                ranked by.
+            timings (obj, optional): Timings instance to record the grid
+                and rank stages and the number of candidates ranked in.
+        Returns:
+            List, in the same order as lat_lngs, of lists of store (dict),
+            store id (int), latitude and longitude (floats) tuples, closest
+            first (ties go to the lowest store id).
+
+        """
+
+        if timings is not None:
+            start = timings.clock()
+        results = [[] for _ in lat_lngs]
+        located = [
+            i for i, lat_lng in enumerate(lat_lngs) if lat_lng is not None
+        ]
+        if k < 1 or not len(located):
+            return results
+        targets = numpy.array(
+            [lat_lngs[i] for i in located], dtype=numpy.float64
+        ).reshape(-1, 2)
+        cells = self.grid.cells_of(targets[:, 0], targets[:, 1]).tolist()
+        rows = [
+            None if cell < 0 else self.grid.candidates(cell)
+            for cell in cells
+        ]
+        if timings is not None:
+            start = timings.lap('grid', start)
+            timings.count('candidates', sum(
+                len(cell_rows) for cell_rows in rows if cell_rows is not None
+            ))
+        no_rows = numpy.array([], dtype=numpy.int64)
+        off_grid = []
+        for i, lat_lng, cell_rows in zip(located, targets.tolist(), rows):
+            if cell_rows is None:
+                off_grid.append(i)
+            else:
+                results[i] = self._rank(lat_lng, cell_rows, no_rows, k, units)
+        if timings is not None:
+            timings.lap('rank', start)
+        if len(off_grid):
+            found = self._tree_candidates(
+                [lat_lngs[i] for i in off_grid], k, units, timings
+            )
+            for i, candidates in zip(off_grid, found):
+                results[i] = candidates
+        return results
+
+    def filtered_candidates(
+            self,
+            lat_lngs,
+            store_filter,
+            k=1,
+            units=DEFAULT_UNITS,
+            timings=None,
+            model=DISTANCE_MODEL
+            ):
+        """Finds the k stores passing a filter closest to many locations.
+
+        When the filter matches at most FILTER_BRUTE_MAX stores (going by
+        the row index of its most selective field), the matching stores
+        are found from the row index and ranked directly, without a tree
+        query.  Otherwise enough nearest stores to expect FILTER_OVERSAMPLE
+        times k matches among them are found with one tree query, and the
+        k-th closest match bounds a ball that is filtered and ranked as in
+        nearest_candidates.  Locations with fewer than k matches among
+        their nearest stores fall back to ranking every matching store.
+
+        Args:
+            lat_lngs (list(list(float) or None)): Latitudes and longitudes
+                being compared to.  Entries that failed to geocode may be
+                None.
+            store_filter (obj): StoreFilter instance stores must pass.
+            k (int, optional): Number of stores to find per location.
+            units (str, optional): Distance metric (mi or km) stores are
+                ranked by.
+            timings (obj, optional): Timings instance to record the knn, ball
+                and rank stages, the number of candidates ranked and the
+                number of locations ranked over every match in.
+            model (str, optional): Distance model (haversine, vincenty or
+                karney) stores are ranked by.
+        Returns:
+            List, in the same order as lat_lngs, of lists of store (dict),
+            store id (int), latitude and longitude (floats) tuples, closest
+            first (ties go to the lowest store id).
+        Raises:
+            ValueError: If a filtered field is not categorical.
+
+        """
+
+        if timings is not None:
+            start = timings.clock()
+        results = [[] for _ in lat_lngs]
+        located = [
+            i for i, lat_lng in enumerate(lat_lngs) if lat_lng is not None
+        ]
+        if self.stores is None or k < 1 or not len(located):
+            return results
+        targets = numpy.array(
+            [lat_lngs[i] for i in located], dtype=numpy.float64
+        ).reshape(-1, 2)
+        delta = self._get_delta_stores()
+        delta_matches = numpy.flatnonzero(
+            store_filter.test(delta, numpy.arange(len(delta)))
+        )
+        estimate = store_filter.estimate(self.stores)
+        balls = [None] * len(targets)
+        if estimate > FILTER_BRUTE_MAX and self.tree is not None:
+            targets_ecef = geodetic2ecef(targets[:, 0], targets[:, 1])
+            nearest_k = min(
+                len(self.stores),
+                len(self.removed) + int(math.ceil(
+                    k * FILTER_OVERSAMPLE * len(self.stores) / estimate
+                ))
+            )
+            _, matches = self.tree.query(targets_ecef, k=nearest_k)
+            matches = numpy.reshape(matches, (len(targets), nearest_k))
+            bounded, chords = [], []
+            for t, rows in enumerate(matches):
+                rows = rows[rows < len(self.stores)]
+                if len(self.removed):
+                    rows = rows[~numpy.isin(rows, list(self.removed))]
+                rows = rows[store_filter.test(self.stores, rows)][:k]
+                distances = numpy.concatenate([
+                    haversine_distances(
+                        targets[t, 0], targets[t, 1],
+                        self.stores.lats[rows], self.stores.lngs[rows], 'km'
+                    ),
+                    haversine_distances(
+                        targets[t, 0], targets[t, 1],
+                        delta.lats[delta_matches], delta.lngs[delta_matches],
+                        'km'
+                    )
+                ])
+                if len(distances) >= k:
+                    bounded.append(t)
+                    chords.append(_chord_bound(haversine_bound(
+                        float(numpy.partition(distances, k - 1)[k - 1]),
+                        model
+                    )))
+            if timings is not None:
+                start = timings.lap('knn', start)
+            if len(bounded):
+                found = self._ball_rows(targets_ecef[bounded], chords)
+                for t, (rows, delta_rows) in zip(bounded, found):
+                    balls[t] = (
+                        rows[store_filter.test(self.stores, rows)],
+                        delta_rows[numpy.isin(delta_rows, delta_matches)]
+                    )
+            if timings is not None:
+                start = timings.lap('ball', start)
+        unbounded = [t for t, ball in enumerate(balls) if ball is None]
+        if len(unbounded):
+            rows = store_filter.rows(self.stores)
+            if len(self.removed):
+                rows = rows[~numpy.isin(rows, list(self.removed))]
+            for t in unbounded:
+                balls[t] = (rows, delta_matches)
+            if timings is not None:
+                timings.count('filter_scans', len(unbounded))
+        if timings is not None:
+            timings.count('candidates', sum(
+                len(rows) + len(delta_rows) for rows, delta_rows in balls
+            ))
+        for i, lat_lng, (rows, delta_rows) in zip(
+                located, targets.tolist(), balls):
+            results[i] = self._rank(
+                lat_lng, rows, delta_rows, k, units, model
+            )
+        if timings is not None:
+            timings.lap('rank', start)
+        return results
+
+    def _rank(
+            self,
+            lat_lng,
+            rows,
+            delta_rows,
+            k,
+            units,
+            model=DISTANCE_MODEL
+            ):
+        """Ranks stores and pending stores by distance.
+
+        With an ellipsoidal model, only the stores whose haversine distance
+        is within haversine_bound of the k-th smallest one are measured
+        with model and ranked.
+
+        Args:
+            lat_lng (list(float)): Latitude and longitude being compared to.
+            rows (array(int)): Rows of stores to rank.
+            delta_rows (array(int)): Rows of pending added or updated stores
+                to rank.
+            k (int): Number of stores to keep.
+            units (str): Distance metric (mi or km).
+            model (str, optional): Distance model (haversine, vincenty or
+                karney).
+        Returns:
+            List of store (dict), store id (int), latitude and longitude
+            (floats) tuples, closest first (ties go to the lowest store id).
+
+        """
+
+        delta = self._get_delta_stores()
+        lats = numpy.concatenate([
+            numpy.asarray(self.stores.lats)[rows], delta.lats[delta_rows]
+        ])
+        lngs = numpy.concatenate([
+            numpy.asarray(self.stores.lngs)[rows], delta.lngs[delta_rows]
+        ])
+        ids = numpy.concatenate([
+            numpy.asarray(self.stores.ids)[rows], delta.ids[delta_rows]
+        ])
+        distances = haversine_distances(
+            lat_lng[0], lat_lng[1], lats, lngs, units
+        )
+        positions = None
+        if model != 'haversine' and len(distances):
+            kth = min(k, len(distances)) - 1
+            positions = numpy.flatnonzero(distances <= haversine_bound(
+                numpy.partition(distances, kth)[kth], model
+            ))
+            lats, lngs, ids = lats[positions], lngs[positions], ids[positions]
+            distances = distance_function(model)(
+                lat_lng[0], lat_lng[1], lats, lngs, units
+            )
+        ranked = []
+        for p in numpy.lexsort((ids, distances))[:k].tolist():
+            j = p if positions is None else int(positions[p])
+            if j < len(rows):
+                store = self.stores[int(rows[j])]
+            else:
+                store = delta[int(delta_rows[j - len(rows)])]
+            ranked.append(
+                (store, int(ids[p]), float(lats[p]), float(lngs[p]))
+            )
+        return ranked
+
+    def _ball_rows(self, targets_ecef, chords):
+        """Searches for live stores within ECEF distances of many locations.
+
+        Args:
+            targets_ecef (list(tuple)): XYZ ECEF coords to search against.
+            chords (list(float)): ECEF search radius of each location.
+        Returns:
+            List of (rows of stores, rows of pending added or updated stores)
+            tuples of row index arrays, one per location.
+
+        """
+
+        targets_ecef = numpy.array(targets_ecef, dtype=numpy.float64)
+        chords = numpy.array(chords, dtype=numpy.float64)
+        matches = self.tree.query_ball_point(targets_ecef, r=chords)
+        delta = self._get_delta_stores()
+        if len(delta):
+            within = numpy.linalg.norm(
+                targets_ecef[:, None, :] - delta.ecef[None, :, :], axis=2
+            ) <= chords[:, None]
+        results = []
+        for i, match in enumerate(matches):
+            rows = numpy.array(sorted(match), dtype=numpy.int64)
+            if len(self.removed):
+                rows = rows[~numpy.isin(rows, list(self.removed))]
+            if len(delta):
+                delta_rows = numpy.flatnonzero(within[i])
+            else:
+                delta_rows = numpy.array([], dtype=numpy.int64)
+            results.append((rows, delta_rows))
+        return results
+
+    def within_radius(
+            self,
+            lat_lng,
+            radius,
+            units=DEFAULT_UNITS,
+            limit=None,
+            offset=0
+            ):
+        """Finds the stores within a distance of a location, closest first.
+
+        Args:
+            lat_lng (list(float)): Latitude and longitude of the center.
+            radius (float): Distance (mi or km) stores must be within.
+            units (str, optional): Distance metric (mi or km).
+            limit (int, optional): Maximum number of stores to return.
+                Defaults to all of them.
+            offset (int, optional): Number of closest stores to skip, for
+                pagination.
+        Returns:
+            List of store (dict) and distance (float) tuples, closest first
+            (ties go to the lowest store id).
+
+        """
+
+        radius_km = radius if units == 'km' else radius / KILOMETERS_TO_MILES
+        return paginate(
+            [self.range_candidates(
+                lat_lng,
+                radius_km,
+                lambda lats, lngs: haversine_distances(
+                    lat_lng[0], lat_lng[1], lats, lngs, units
+                ) <= radius
+            )],
+            lat_lng,
+            units,
+            limit,
+            offset
+        )
+
+    def within_bbox(
+            self,
+            bbox,
+            origin=None,
+            units=DEFAULT_UNITS,
+            limit=None,
+            offset=0
+            ):
+        """Finds the stores in a latitude/longitude bounding box.
+
+        The tree is searched with a circle enclosing the box, and the
+        stores found are then tested against the box exactly.
+
+        Args:
+            bbox (list(float)): Minimum latitude, minimum longitude, maximum
+                latitude and maximum longitude.  A minimum longitude greater
+                than the maximum wraps across the antimeridian.
+            origin (list(float), optional): Latitude and longitude stores
+                are sorted by distance from.  Defaults to the middle of the
+                box.
+            units (str, optional): Distance metric (mi or km).
+            limit (int, optional): Maximum number of stores to return.
+                Defaults to all of them.
+            offset (int, optional): Number of closest stores to skip, for
+                pagination.
+        Returns:
+            List of store (dict) and distance (float) tuples, closest to
+            origin first (ties go to the lowest store id).
+
+        """
+
+        center, radius_km = bbox_circle(bbox)
+        return paginate(
+            [self.range_candidates(
+                center,
+                radius_km,
+                lambda lats, lngs: in_bbox(lats, lngs, bbox)
+            )],
+            center if origin is None else origin,
+            units,
+            limit,
+            offset
+        )
+
+    def within_polygon(
+            self,
+            polygon,
+            origin=None,
+            units=DEFAULT_UNITS,
+            limit=None,
+            offset=0
+            ):
+        """Finds the stores in a polygon, such as a delivery zone.
+
+        The tree is searched with a circle enclosing the polygon's bounding
+        box, and the stores found are then tested against the polygon
+        exactly (see points_in_polygon).
+
+        Args:
+            polygon (list(list(float))): Latitudes and longitudes of the
+                vertices, in order.
+            origin (list(float), optional): Latitude and longitude stores
+                are sorted by distance from.  Defaults to the middle of the
+                polygon's bounding box.
+            units (str, optional): Distance metric (mi or km).
+            limit (int, optional): Maximum number of stores to return.
+                Defaults to all of them.
+            offset (int, optional): Number of closest stores to skip, for
+                pagination.
+        Returns:
+            List of store (dict) and distance (float) tuples, closest to
+            origin first (ties go to the lowest store id).
+
+        """
+
+        center, radius_km = bbox_circle(polygon_bbox(polygon))
+        return paginate(
+            [self.range_candidates(
+                center,
+                radius_km,
+                lambda lats, lngs: points_in_polygon(lats, lngs, polygon)
+            )],
+            center if origin is None else origin,
+            units,
+            limit,
+            offset
+        )
+
+    def range_candidates(self, center, radius_km, test):
+        """Finds the live stores near a location that pass an exact test.
+
+        Stores within radius_km of center are found with one ball query of
+        the tree (every store when radius_km is None), and test is then
+        applied to all of their coords at once.
+
+        Args:
+            center (list(float)): Latitude and longitude of the center.
+            radius_km (float or None): Distance (km) every store that can
+                pass test is within.
+            test (callable): Takes arrays of latitudes and longitudes and
+                returns an array (bool) of the stores to keep.
+        Returns:
+            Arrays of the ids, latitudes and longitudes of the stores kept,
+            and a function that returns the store (dict) at an index into
+            them.
+
+        """
+
+        delta = self._get_delta_stores()
+        if radius_km is not None and self.tree is not None:
+            rows, delta_rows = self._ball_rows(
+                [geodetic2ecef(center[0], center[1])],
+                [_chord_bound(radius_km)]
+            )[0]
+        else:
+            rows = numpy.arange(len(self.stores), dtype=numpy.int64)
+            if len(self.removed):
+                rows = rows[~numpy.isin(rows, list(self.removed))]
+            delta_rows = numpy.arange(len(delta), dtype=numpy.int64)
+        lats = numpy.concatenate(
+            [self.stores.lats[rows], delta.lats[delta_rows]]
+        )
+        lngs = numpy.concatenate(
+            [self.stores.lngs[rows], delta.lngs[delta_rows]]
+        )
+        ids = numpy.concatenate(
+            [self.stores.ids[rows], delta.ids[delta_rows]]
+        )
+        keep = numpy.flatnonzero(test(lats, lngs))
+
+        def fetch(j):
+            j = int(keep[j])
+            if j < len(rows):
+                return self.stores[int(rows[j])]
+            return delta[int(delta_rows[j - len(rows)])]
+
+        return ids[keep], lats[keep], lngs[keep], fetch
+
+    def query_nearest(self, targets_ecef, k):
+        """Searches for the k closest stores to each of many locations at once.
+
+        Args:
+            targets_ecef (list(tuple)): XYZ ECEF coords to search against.
+            k (int): Number of candidate stores to return per location.
+        Returns:
+            StoreTable of candidate stores, and array of candidate row indices
+            (ints) into it shaped (locations, k).  The StoreTable is stores
+            itself unless updates are pending.
+
+        """
+
+        results = None
+        if self.tree is not None and len(targets_ecef):
+            targets_ecef = numpy.array(targets_ecef).reshape(-1, 3)
+            live = len(self.stores) - len(self.removed) + len(self.delta)
+            k = min(k, live)
+            if not self.pending:
+                _, matches = self.tree.query(targets_ecef, k=k)
+                return (
+                    self.stores,
+                    numpy.reshape(matches, (len(targets_ecef), k))
+                )
+            static_k = min(k + len(self.removed), len(self.stores))
+            distances, matches = self.tree.query(targets_ecef, k=static_k)
+            distances = numpy.reshape(distances, (len(targets_ecef), static_k))
+            matches = numpy.reshape(matches, (len(targets_ecef), static_k))
+            distances[numpy.isin(matches, list(self.removed))] = numpy.inf
+            delta = self._get_delta_stores()
+            rows = numpy.unique(matches)
+            if len(delta):
+                distances = numpy.hstack([
+                    distances,
+                    numpy.linalg.norm(
+                        targets_ecef[:, None, :] - delta.ecef[None, :, :],
+                        axis=2
+                    )
+                ])
+                matches = numpy.hstack([
+                    numpy.searchsorted(rows, matches),
+                    numpy.broadcast_to(
+                        len(rows) + numpy.arange(len(delta)),
+                        (len(targets_ecef), len(delta))
+                    )
+                ])
+            else:
+                matches = numpy.searchsorted(rows, matches)
+            order = numpy.argsort(distances, axis=1, kind='stable')[:, :k]
+            results = (
+                StoreTable.concat([self.stores.select(rows), delta]),
+                numpy.take_along_axis(matches, order, axis=1)
+            )
+        return results
+
+    def ingest(self, chunk_size=INGEST_CHUNK_SIZE):
+        """Streams stores data from CSV into a new index file.
+
+        Unlike get_stores, columns are written to temporary array files
+        chunk_size rows at a time and the tree is built from their memory
+        map, so the CSV does not have to fit in memory.  The index file is
+        then saved and opened in place of the temporary files.  Malformed
+        rows are skipped and counted.
+
+        Args:
+            chunk_size (int, optional): Number of rows written at a time.
+        Returns:
+            IngestStats of the rows ingested and skipped.
+
+        """
+
+        self.source = source_meta(self.file_path)
+        directory = tempfile.mkdtemp(
+            prefix='.ingest.',
+            dir=os.path.dirname(os.path.abspath(self.file_path))
+        )
+        try:
+            stores, stats = ingest_csv(
+                self.file_path,
+                directory,
+                self.encoding,
+                self.delimiter,
+                chunk_size
+            )
+            self.stores = stores
+            self.delta = {}
+            self.removed = set()
+            self._delta_stores = None
+            self._next_id = len(self.stores)
+            self.tree = get_backend(self.backend, len(self.stores)).build(
+                self.stores.ecef
+            )
+            self.grid = None
+            self._dirty = True
+            self.save()
+            sp = StoresParser.load(
+                self.file_path, self.encoding, self.delimiter, self.backend
+            )
+            self.stores = sp.stores
+            self.tree = sp.tree
+            self.grid = sp.grid
+        finally:
+            shutil.rmtree(directory)
+        return stats
+
     def get_stores(self):
-        """Parses stores data from CSV and returns a list of stores (dicts).
+        """Parses stores data from CSV and returns a table of stores.
 
-        The list of stores that is returned is sorted by latitude and then
-        longitude.
+        Rows are added to the StoreTable as they are read, so a list of
+        stores (dicts) is never held in memory.  The size, modification time
+        and hash of the CSV are recorded in source before it is read.
 
         """
 
+        self.source = source_meta(self.file_path)
+        self.delta = {}
+        self.removed = set()
+        self._delta_stores = None
         with codecs.open(self.file_path, 'r', encoding=self.encoding) as f:
             reader = csv.DictReader(f, delimiter=self.delimiter)
-            self.stores = list(reader)
+            builder = StoreTableBuilder(reader.fieldnames or [])
+            for store in reader:
+                builder.append(store)
+            self.stores = builder.build()
+        self._next_id = len(self.stores)
         return self.stores
+
+
+def paginate(candidates, origin, units=DEFAULT_UNITS, limit=None, offset=0):
+    """Sorts range query candidates by distance and returns one page.
+
+    Only the stores on the page are built, and their distances are
+    recalculated with calculate_distance like nearest_many's.
+
+    Args:
+        candidates (list(tuple)): Results of range_candidates, e.g. one per
+            shard searched.
+        origin (list(float)): Latitude and longitude stores are sorted by
+            distance from.
+        units (str, optional): Distance metric (mi or km).
+        limit (int, optional): Maximum number of stores to return.
+        offset (int, optional): Number of closest stores to skip.
+    Returns:
+        List of store (dict) and distance (float) tuples, closest first
+        (ties go to the lowest store id).
+
+    """
+
+    if not len(candidates):
+        return []
+    ids = numpy.concatenate([part[0] for part in candidates])
+    lats = numpy.concatenate([part[1] for part in candidates])
+    lngs = numpy.concatenate([part[2] for part in candidates])
+    starts = numpy.cumsum([0] + [len(part[0]) for part in candidates])
+    distances = haversine_distances(origin[0], origin[1], lats, lngs, units)
+    order = numpy.lexsort((ids, distances))
+    end = None if limit is None else offset + limit
+    results = []
+    for j in order[offset:end].tolist():
+        part = int(numpy.searchsorted(starts, j, side='right')) - 1
+        results.append((
+            candidates[part][3](j - int(starts[part])),
+            calculate_distance(origin, [lats[j], lngs[j]], units)
+        ))
+    return results
+
+
+def _chord_bound(distance):
+    """Returns an ECEF distance covering every store within distance (km).
+
+    euclidean_distance is widened by CHORD_SLACK to absorb the difference
+    between the spherical haversine model and the ellipsoidal ECEF
+    coordinates, and is capped at the diameter of the earth.
+
+    """
+
+    if distance * CHORD_SLACK >= math.pi * B:
+        return 2 * A * CHORD_SLACK
+    return euclidean_distance(distance * CHORD_SLACK) * CHORD_SLACK
+
+
+def _table_ecef(table):
+    """Returns the XYZ ECEF coords of every store in a StoreTable.
+
+    """
+
+    return geodetic2ecef(
+        numpy.asarray(table.lats, dtype=numpy.float64),
+        numpy.asarray(table.lngs, dtype=numpy.float64)
+    ).reshape(len(table), 3)
+
+
+def _has_grid(index_path):
+    """Checks whether an index file, even a stale one, holds a NearestGrid.
+
+    """
+
+    try:
+        _, meta = read_index(index_path, verify=False)
+    except (IOError, IndexFormatError):
+        return False
+    return meta.get('grid') is not None
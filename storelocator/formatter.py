@@ -0,0 +1,337 @@
+from storelocator.constants import (
+    BULK_OUTPUT,
+    DEFAULT_OUTPUT,
+    DEFAULT_UNITS,
+    DISTANCE_PRECISION,
+    OUTPUT,
+    OUTPUT_FIELDS,
+    STORE_FIELDS
+)
+import csv
+import io
+import json
+from json.encoder import encode_basestring_ascii
+import numpy
+from operator import itemgetter
+import struct
+from storelocator.util import format_distance
+
+
+MAGIC = b'STORRES\n'
+FORMAT_VERSION = 1
+PREAMBLE = struct.Struct('<8sII')
+RECORD = struct.Struct('<Id')
+LENGTH = struct.Struct('<H')
+# Relative distance from a half below which float rounding is not trusted.
+HALF_TOLERANCE = 1e-9
+TEXT_FIELDS = [
+    STORE_FIELDS['NAME'],
+    STORE_FIELDS['LOCATION'],
+    STORE_FIELDS['COUNTY'],
+    STORE_FIELDS['ADDRESS'],
+    STORE_FIELDS['CITY'],
+    STORE_FIELDS['STATE'],
+    STORE_FIELDS['ZIP_CODE']
+]
+NOT_FOUND = 'Unable to locate closest store.'
+
+
+def format_distances(distances, precision=DISTANCE_PRECISION):
+    """Formats many distances like format_distance, in one pass.
+
+    format_distance rounds the exact binary value of each float half up.
+    Here distances are scaled and rounded with NumPy instead, which gives
+    the same digits unless a scaled distance lies within HALF_TOLERANCE of
+    a half, where the float product may have rounded across it; those few
+    distances (and any that are not finite or too large to hold exactly)
+    are formatted with format_distance.
+
+    Args:
+        distances (array(float)): Distances to format.
+        precision (int, optional): Number of decimal places.
+    Returns:
+        List of formatted distances (str), e.g. '1.10'.
+
+    """
+
+    distances = numpy.asarray(distances, dtype=numpy.float64).ravel()
+    scale = 10 ** precision
+    with numpy.errstate(invalid='ignore', over='ignore'):
+        scaled = numpy.abs(distances) * scale
+        rounded = numpy.floor(scaled + 0.5)
+        unsure = ~(scaled < 2 ** 52) | (
+            numpy.abs(scaled - numpy.floor(scaled) - 0.5) <=
+            HALF_TOLERANCE * numpy.maximum(scaled, 1.0)
+        )
+    rounded[unsure] = 0
+    signs = numpy.where(numpy.signbit(distances), '-', '').tolist()
+    counts = rounded.astype(numpy.int64)
+    if precision > 0:
+        formatted = list(map(('%%s%%d.%%0%dd' % precision).__mod__, zip(
+            signs, (counts // scale).tolist(), (counts % scale).tolist()
+        )))
+    else:
+        formatted = list(map('%s%d'.__mod__, zip(signs, counts.tolist())))
+    for i in numpy.flatnonzero(unsure).tolist():
+        formatted[i] = str(format_distance(float(distances[i]), precision))
+    return formatted
+
+
+class ResultFormatter(object):
+    """ResultFormatter formats nearest store results in bulk.
+
+    Results are formatted a batch at a time: distances are rounded together
+    with format_distances, and each record is written from a template
+    compiled once per output and field layout, so no dict is copied and no
+    Decimal is built per result.  Outputs are:
+
+    text: The sentence format_result writes, one line per store.
+    json: One JSON object per line (JSON Lines), identical to format_result
+        when every field is written.
+    csv: A header row, then one row per store, with the distance as a
+        number in a "Distance (<units>)" column.
+    binary: PREAMBLE (MAGIC, FORMAT_VERSION and the length of a JSON header
+        naming the fields and units), then per store a RECORD (query index
+        and unrounded distance) followed by each field as a LENGTH-prefixed
+        UTF-8 string.  See read_results.
+
+    Queries without a store get a NOT_FOUND line in text, {} in json and an
+    empty row in csv, and no record in binary output.
+
+    """
+
+    def __init__(
+            self,
+            output=DEFAULT_OUTPUT,
+            units=DEFAULT_UNITS,
+            fields=None,
+            precision=DISTANCE_PRECISION
+            ):
+        """Initialization compiles the templates of an output.
+
+        Args:
+            output (str, optional): Output format (text, json, csv or
+                binary).
+            units (str, optional): Distance metric (mi or km) distances are
+                in.
+            fields (list(str), optional): Store fields to write, in order.
+                Defaults to every field of each store for json and to
+                OUTPUT_FIELDS for csv and binary.  Text output always
+                writes its sentence.
+            precision (int, optional): Number of decimal places of
+                formatted distances.
+        Raises:
+            ValueError: If output is not a known format.
+
+        """
+
+        if output not in OUTPUT + BULK_OUTPUT:
+            raise ValueError(
+                'output must be one of the following: {}'.format(
+                    OUTPUT + BULK_OUTPUT
+                )
+            )
+        self.output = output
+        self.units = units
+        self.fields = None if fields is None else list(fields)
+        self.precision = precision
+        if self.fields is None and output in BULK_OUTPUT:
+            self.fields = list(OUTPUT_FIELDS)
+        self._json_templates = {}
+        self._text = (
+            'Closest store is {} - {}, located in {} at {}, {}, {} {}. '
+            '({} ' + units.replace('{', '{{').replace('}', '}}') + ')'
+        ).format
+        self._text_fields = itemgetter(*TEXT_FIELDS)
+        if self.fields is not None:
+            self.fields = tuple(self.fields)
+            self._values = _getter(self.fields)
+
+    def header(self):
+        """Returns what is written before the first batch.
+
+        Returns:
+            The csv header row (str) or binary preamble (bytes), or an
+            empty str for text and json.
+
+        """
+
+        if self.output == 'csv':
+            return self._csv_rows([list(self.fields) + [
+                '{} ({})'.format(STORE_FIELDS['DISTANCE'], self.units)
+            ]])
+        if self.output == 'binary':
+            header = json.dumps({
+                'fields': list(self.fields),
+                'units': self.units
+            }).encode('utf-8')
+            return PREAMBLE.pack(MAGIC, FORMAT_VERSION, len(header)) + header
+        return ''
+
+    def format_many(self, nearest_many, start=0):
+        """Formats a batch of nearest_many results.
+
+        Args:
+            nearest_many (list(list(tuple))): Per query, store (dict) and
+                distance (float) tuples, as returned by nearest_many.
+            start (int, optional): Index of the batch's first query, written
+                with each binary record.
+        Returns:
+            Formatted batch, each line ending in a newline (str), or binary
+            records (bytes).
+
+        """
+
+        distances = [
+            distance for nearest in nearest_many
+            for _, distance in nearest
+        ]
+        formatted = iter(
+            format_distances(distances, self.precision)
+            if self.output != 'binary' else distances
+        )
+        if self.output == 'binary':
+            return b''.join(
+                self._record(start + i, store, next(formatted))
+                for i, nearest in enumerate(nearest_many)
+                for store, _ in nearest
+            )
+        if self.output == 'csv':
+            empty = [''] * (len(self.fields) + 1)
+            return self._csv_rows(
+                list(self._values(store)) + [next(formatted)]
+                if store is not None else empty
+                for store in _stores(nearest_many)
+            )
+        if self.output == 'json':
+            line = self._json
+            missing = '{}'
+        else:
+            line = self._text_line
+            missing = NOT_FOUND
+        lines = [
+            line(store, next(formatted)) if store is not None else missing
+            for store in _stores(nearest_many)
+        ]
+        lines.append('')
+        return '\n'.join(lines)
+
+    def _text_line(self, store, distance):
+        return self._text(*(self._text_fields(store) + (distance,)))
+
+    def _json(self, store, distance):
+        """Writes a store and its distance as a JSON object.
+
+        """
+
+        layout = self.fields
+        if layout is None:
+            layout = tuple(store)
+        template = self._json_templates.get(layout)
+        if template is None:
+            template = self._json_templates[layout] = _json_template(layout)
+        line, getter, position = template
+        values = getter(store)
+        try:
+            values = tuple(map(encode_basestring_ascii, values))
+        except TypeError:
+            values = tuple(json.dumps(value) for value in values)
+        distance = encode_basestring_ascii(
+            '{} {}'.format(distance, self.units)
+        )
+        return line % (values[:position] + (distance,) + values[position:])
+
+    def _csv_rows(self, rows):
+        buffer = io.StringIO()
+        csv.writer(buffer, lineterminator='\n').writerows(rows)
+        return buffer.getvalue()
+
+    def _record(self, index, store, distance):
+        """Writes a store and its distance as a binary record.
+
+        """
+
+        parts = [RECORD.pack(index, distance)]
+        for value in self._values(store):
+            encoded = str(value).encode('utf-8')
+            parts.append(LENGTH.pack(len(encoded)))
+            parts.append(encoded)
+        return b''.join(parts)
+
+
+def read_results(stream):
+    """Reads binary output written by ResultFormatter.
+
+    Args:
+        stream (file): Binary file positioned at the preamble.
+    Returns:
+        Generator of query index (int), store (dict of the written fields)
+        and distance (float) tuples.
+    Raises:
+        ValueError: If the stream is not binary ResultFormatter output.
+
+    """
+
+    preamble = stream.read(PREAMBLE.size)
+    if len(preamble) < PREAMBLE.size:
+        raise ValueError('Not binary store results: too short.')
+    magic, version, header_size = PREAMBLE.unpack(preamble)
+    if magic != MAGIC or version != FORMAT_VERSION:
+        raise ValueError('Not binary store results: bad magic or version.')
+    fields = json.loads(stream.read(header_size).decode('utf-8'))['fields']
+    while True:
+        record = stream.read(RECORD.size)
+        if not record:
+            return
+        index, distance = RECORD.unpack(record)
+        store = {}
+        for fieldname in fields:
+            (size,) = LENGTH.unpack(stream.read(LENGTH.size))
+            store[fieldname] = stream.read(size).decode('utf-8')
+        yield index, store, distance
+
+
+def _stores(nearest_many):
+    """Yields the store of each result, or None for a query without one.
+
+    """
+
+    for nearest in nearest_many:
+        if not len(nearest):
+            yield None
+        for store, _ in nearest:
+            yield store
+
+
+def _json_template(keys):
+    """Compiles the JSON object template of a field layout.
+
+    Returns:
+        The object with a %s for each value (str), a getter of the store's
+        values and the position of the distance among the values.
+
+    """
+
+    distance = STORE_FIELDS['DISTANCE']
+    keys = list(keys)
+    if distance not in keys:
+        keys.append(distance)
+    position = keys.index(distance)
+    line = '{%s}' % ', '.join(
+        encode_basestring_ascii(key).replace('%', '%%') + ': %s'
+        for key in keys
+    )
+    return line, _getter([key for key in keys if key != distance]), position
+
+
+def _getter(fields):
+    """Returns a function that gets the values (tuple) of fields of a store.
+
+    """
+
+    if not len(fields):
+        return lambda store: ()
+    if len(fields) == 1:
+        fieldname = fields[0]
+        return lambda store: (store[fieldname],)
+    return itemgetter(*fields)
@@ -0,0 +1,231 @@
+from collections import OrderedDict
+from storelocator.constants import (
+    GEOCODE_CACHE_DISK_SIZE,
+    GEOCODE_CACHE_DISK_SLACK,
+    GEOCODE_CACHE_SIZE,
+    GEOCODE_CACHE_TTL,
+    GEOCODE_NEGATIVE_TTL
+)
+import sqlite3
+import threading
+import time
+
+
+def normalize_query(query):
+    """Normalizes an address or zip code into a cache key.
+
+    Case and runs of whitespace are ignored, so '94115', 94115 and
+    ' 94115 ' share one entry.
+
+    Args:
+        query (str, int): Address or zip code.
+    Returns:
+        Normalized query (str).
+
+    """
+
+    return ' '.join(str(query).lower().split())
+
+
+class GeocodeCache(object):
+    """GeocodeCache remembers geocoding results in front of a geocoder.
+
+    Results are kept in an in-process LRU of up to max_size entries and,
+    when a path is given, in a SQLite database shared between processes.
+    Successful results expire after ttl seconds, and misses (None) are
+    cached for negative_ttl seconds.  hits and misses count lookups that
+    were and were not answered from the cache.
+
+    The database is only trimmed once it holds more than disk_size plus
+    disk_slack entries, and then back down to disk_size at once, soonest
+    to expire first, so most writes are a single insert.  The LRU and the
+    database have separate locks, so cached lookups do not wait for a
+    write to commit.
+
+    """
+
+    def __init__(
+            self,
+            path=None,
+            max_size=GEOCODE_CACHE_SIZE,
+            disk_size=GEOCODE_CACHE_DISK_SIZE,
+            disk_slack=GEOCODE_CACHE_DISK_SLACK,
+            ttl=GEOCODE_CACHE_TTL,
+            negative_ttl=GEOCODE_NEGATIVE_TTL,
+            clock=time.time
+            ):
+        """Initialization creates an empty GeocodeCache.
+
+        Args:
+            path (str, optional): Path of a SQLite database for persistent
+                entries.  Only the in-process LRU is used when None.
+            max_size (int, optional): Maximum entries in the LRU.
+            disk_size (int, optional): Entries the database is trimmed to.
+            disk_slack (int, optional): Entries the database may hold above
+                disk_size before it is trimmed.
+            ttl (float, optional): Seconds successful results are kept.
+            negative_ttl (float, optional): Seconds misses are kept.
+            clock (callable, optional): Returns the current time in seconds.
+
+        """
+
+        self.path = path
+        self.max_size = max_size
+        self.disk_size = disk_size
+        self.disk_slack = disk_slack
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+        self._db_lock = threading.Lock()
+        self._db = None
+        self._rows = 0
+        if path is not None:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS geocodes ('
+                'query TEXT PRIMARY KEY, lat REAL, lng REAL, expires REAL)'
+            )
+            self._db.execute(
+                'CREATE INDEX IF NOT EXISTS geocodes_expires '
+                'ON geocodes (expires)'
+            )
+            self._db.commit()
+            self._rows = self._count()
+
+    def get(self, query):
+        """Looks up a query without counting a hit or miss.
+
+        Args:
+            query (str, int): Address or zip code.
+        Returns:
+            Whether the query is cached (bool), and its latitude and
+            longitude (list of floats or None).
+
+        """
+
+        key = normalize_query(query)
+        now = self.clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                lat_lng, expires = entry
+                if expires > now:
+                    self._entries.move_to_end(key)
+                    return True, lat_lng
+                del self._entries[key]
+        if self._db is not None:
+            with self._db_lock:
+                row = self._db.execute(
+                    'SELECT lat, lng, expires FROM geocodes WHERE query = ?',
+                    (key,)
+                ).fetchone()
+            if row is not None and row[2] > now:
+                lat_lng = None if row[0] is None else [row[0], row[1]]
+                with self._lock:
+                    self._remember(key, lat_lng, row[2])
+                return True, lat_lng
+        return False, None
+
+    def set(self, query, lat_lng):
+        """Caches the latitude and longitude (or None) of a query.
+
+        Args:
+            query (str, int): Address or zip code.
+            lat_lng (list(float) or None): Geocoding result.
+
+        """
+
+        key = normalize_query(query)
+        ttl = self.ttl if lat_lng is not None else self.negative_ttl
+        expires = self.clock() + ttl
+        with self._lock:
+            self._remember(key, lat_lng, expires)
+        if self._db is None:
+            return
+        lat, lng = lat_lng if lat_lng is not None else (None, None)
+        with self._db_lock:
+            self._db.execute(
+                'INSERT OR REPLACE INTO geocodes VALUES (?, ?, ?, ?)',
+                (key, lat, lng, expires)
+            )
+            self._rows += 1
+            if self._rows > self.disk_size + self.disk_slack:
+                self._trim()
+            self._db.commit()
+
+    def geocode(self, query, geocoder):
+        """Returns the cached result of a query, geocoding it on a miss.
+
+        Args:
+            query (str, int): Address or zip code.
+            geocoder (callable): Converts a query to a latitude and longitude
+                (list of floats) or None.
+        Returns:
+            Latitude and longitude (list of floats) or None.
+
+        """
+
+        found, lat_lng = self.get(query)
+        with self._lock:
+            if found:
+                self.hits += 1
+            else:
+                self.misses += 1
+        if found:
+            return lat_lng
+        lat_lng = geocoder(query)
+        self.set(query, lat_lng)
+        return lat_lng
+
+    def clear(self):
+        """Removes every entry from the LRU and the database.
+
+        """
+
+        with self._lock:
+            self._entries.clear()
+        if self._db is not None:
+            with self._db_lock:
+                self._db.execute('DELETE FROM geocodes')
+                self._db.commit()
+                self._rows = 0
+
+    def close(self):
+        """Closes the database, if any.
+
+        """
+
+        with self._db_lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def _count(self):
+        return self._db.execute('SELECT COUNT(*) FROM geocodes').fetchone()[0]
+
+    def _trim(self):
+        """Deletes the soonest to expire entries above disk_size.
+
+        The running row count also counts replaced entries and entries
+        other processes removed, so the table is counted first.
+
+        """
+
+        self._rows = self._count()
+        if self._rows > self.disk_size + self.disk_slack:
+            self._db.execute(
+                'DELETE FROM geocodes WHERE query IN ('
+                'SELECT query FROM geocodes ORDER BY expires LIMIT ?)',
+                (self._rows - self.disk_size,)
+            )
+            self._rows = self.disk_size
+
+    def _remember(self, key, lat_lng, expires):
+        self._entries[key] = (lat_lng, expires)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
@@ -0,0 +1,234 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from storelocator.constants import (
+    BATCH_SIZE,
+    DEFAULT_UNITS,
+    GEOCODE_BACKOFF,
+    GEOCODE_CONCURRENCY,
+    GEOCODE_RATE,
+    GEOCODE_RETRIES
+)
+from storelocator.geocache import normalize_query
+import time
+from storelocator.util import geocode
+
+
+class TokenBucket(object):
+    """TokenBucket limits how often an operation may start.
+
+    Tokens refill at rate per second up to capacity, and every acquire
+    takes one token, waiting for it if the bucket is empty.
+
+    """
+
+    def __init__(self, rate, capacity=1, clock=time.monotonic):
+        """Initialization creates a full TokenBucket.
+
+        Args:
+            rate (float): Tokens added per second.
+            capacity (float, optional): Maximum tokens, i.e. the largest
+                burst allowed.
+            clock (callable, optional): Returns the current time in seconds.
+
+        """
+
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self.tokens = capacity
+        self.updated = clock()
+
+    async def acquire(self):
+        """Waits until a token is available and takes it.
+
+        """
+
+        while True:
+            now = self.clock()
+            self.tokens = min(
+                self.capacity,
+                self.tokens + (now - self.updated) * self.rate
+            )
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class GeocodePipeline(object):
+    """GeocodePipeline geocodes many queries concurrently.
+
+    A blocking geocoder runs on a thread pool with at most concurrency calls
+    in flight, started no faster than rate per second.  Calls that raise are
+    retried with exponential backoff, and identical queries that are in
+    flight at the same time share one call.
+
+    """
+
+    def __init__(
+            self,
+            geocoder=geocode,
+            concurrency=GEOCODE_CONCURRENCY,
+            rate=GEOCODE_RATE,
+            retries=GEOCODE_RETRIES,
+            backoff=GEOCODE_BACKOFF
+            ):
+        """Initialization creates a GeocodePipeline around a geocoder.
+
+        Args:
+            geocoder (callable, optional): Converts an address or zip code to
+                a latitude and longitude (list of floats) or None.
+            concurrency (int, optional): Maximum calls in flight.
+            rate (float, optional): Maximum calls started per second, or None
+                for no limit.
+            retries (int, optional): Retries of a call that raises.
+            backoff (float, optional): Seconds before the first retry,
+                doubling for every retry after it.
+
+        """
+
+        self.geocoder = geocoder
+        self.concurrency = concurrency
+        self.rate = rate
+        self.retries = retries
+        self.backoff = backoff
+        self.failures = 0
+
+    async def stream(self, queries):
+        """Geocodes queries, yielding results as they complete.
+
+        Queries are read lazily, a few times concurrency at a time, so the
+        iterable may be much larger than memory.
+
+        Args:
+            queries (iterable(str, int)): Addresses or zip codes.
+        Returns:
+            Async generator of (index, query, lat_lng) tuples in completion
+            order.  lat_lng is None for queries that could not be geocoded.
+
+        """
+
+        loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(self.concurrency)
+        bucket = None if self.rate is None else TokenBucket(self.rate)
+        in_flight = {}
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+
+            async def call(query):
+                for attempt in range(self.retries + 1):
+                    async with semaphore:
+                        if bucket is not None:
+                            await bucket.acquire()
+                        try:
+                            return await loop.run_in_executor(
+                                executor, self.geocoder, query
+                            )
+                        except Exception:
+                            if attempt == self.retries:
+                                self.failures += 1
+                                return None
+                    await asyncio.sleep(self.backoff * 2 ** attempt)
+
+            async def resolve(index, query):
+                key = normalize_query(query)
+                if key not in in_flight:
+                    in_flight[key] = asyncio.ensure_future(call(query))
+                    in_flight[key].add_done_callback(
+                        lambda _: in_flight.pop(key, None)
+                    )
+                return index, query, await asyncio.shield(in_flight[key])
+
+            queries = enumerate(queries)
+            pending = set()
+            exhausted = False
+            while True:
+                while not exhausted and len(pending) < self.concurrency * 4:
+                    try:
+                        index, query = next(queries)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    pending.add(asyncio.ensure_future(resolve(index, query)))
+                if not len(pending):
+                    break
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    yield task.result()
+
+    def geocode_all(self, queries):
+        """Geocodes queries concurrently and returns results in order.
+
+        Args:
+            queries (list(str, int)): Addresses or zip codes.
+        Returns:
+            List of latitudes and longitudes (lists of floats or None), in
+            the same order as queries.
+
+        """
+
+        async def collect():
+            results = [None] * len(queries)
+            async for index, _, lat_lng in self.stream(queries):
+                results[index] = lat_lng
+            return results
+
+        return asyncio.run(collect())
+
+
+async def nearest_stream(
+        sp,
+        queries,
+        pipeline=None,
+        k=1,
+        units=DEFAULT_UNITS,
+        batch_size=BATCH_SIZE
+        ):
+    """Finds nearest stores for queries as their geocoding completes.
+
+    Geocoded queries are searched together in batches of whatever has
+    completed (up to batch_size) while the remaining queries are still
+    being geocoded.
+
+    Args:
+        sp (obj): StoresParser instance.
+        queries (iterable(str, int)): Addresses or zip codes.
+        pipeline (obj, optional): GeocodePipeline instance.
+        k (int, optional): Number of stores to find per query.
+        units (str, optional): Distance metric (mi or km).
+        batch_size (int, optional): Maximum queries searched together.
+    Returns:
+        Async generator of (index, query, nearest) tuples in completion
+        order, where nearest is a list of store (dict) and distance (float)
+        tuples, closest first.
+
+    """
+
+    if pipeline is None:
+        pipeline = GeocodePipeline()
+    queue = asyncio.Queue()
+    done = object()
+
+    async def produce():
+        async for result in pipeline.stream(queries):
+            await queue.put(result)
+        await queue.put(done)
+
+    producer = asyncio.ensure_future(produce())
+    finished = False
+    while not finished:
+        batch = [await queue.get()]
+        while len(batch) < batch_size and not queue.empty():
+            batch.append(queue.get_nowait())
+        if batch[-1] is done:
+            batch.pop()
+            finished = True
+        if len(batch):
+            nearest = sp.nearest_many(
+                [lat_lng for _, _, lat_lng in batch], k, units
+            )
+            for (index, query, _), stores in zip(batch, nearest):
+                yield index, query, stores
+    await producer
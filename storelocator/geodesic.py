@@ -0,0 +1,234 @@
+from storelocator.constants import (
+    A,
+    DEFAULT_UNITS,
+    F,
+    KILOMETERS_TO_MILES,
+    VINCENTY_ITERATIONS,
+    VINCENTY_SCALAR_MAX,
+    VINCENTY_TOLERANCE
+)
+import math
+import numpy
+from storelocator.util import (
+    calculate_distance,
+    haversine_distances
+)
+
+
+_geodesic = None
+
+
+def vincenty_distances(lats_a, lngs_a, lats_b, lngs_b, units=DEFAULT_UNITS):
+    """Calculates distances in (mi or km) on the WGS84 ellipsoid.
+
+    Vectorized Vincenty inverse formula, iterated until the longitude on
+    the auxiliary sphere changes by less than VINCENTY_TOLERANCE radians.
+    Each pair stops iterating once it converges, so its distance does not
+    depend on the other pairs in the call.  Nearly antipodal pairs, for
+    which the formula does not converge, get their haversine distance.
+    Inputs are broadcast against each other like haversine_distances.
+    Up to VINCENTY_SCALAR_MAX pairs, such as the finalists of a lookup,
+    are solved one at a time with math, which is much cheaper than a dozen
+    NumPy calls per iteration on tiny arrays.
+
+    Args:
+        lats_a (array(float)): Latitudes of points A.
+        lngs_a (array(float)): Longitudes of points A.
+        lats_b (array(float)): Latitudes of points B.
+        lngs_b (array(float)): Longitudes of points B.
+        units (str, optional): Distance metric used for calculation (mi or km).
+    Returns:
+        Array of distances (float) in provided units (mi or km).
+
+    """
+
+    lats_a, lngs_a, lats_b, lngs_b = numpy.broadcast_arrays(
+        numpy.asarray(lats_a, dtype=numpy.float64),
+        numpy.asarray(lngs_a, dtype=numpy.float64),
+        numpy.asarray(lats_b, dtype=numpy.float64),
+        numpy.asarray(lngs_b, dtype=numpy.float64)
+    )
+    shape = lats_a.shape
+    lats_a, lngs_a, lats_b, lngs_b = [
+        values.ravel() for values in (lats_a, lngs_a, lats_b, lngs_b)
+    ]
+    if len(lats_a) <= VINCENTY_SCALAR_MAX:
+        distances = numpy.array([
+            _vincenty(lat_a, lng_a, lat_b, lng_b)
+            for lat_a, lng_a, lat_b, lng_b in zip(
+                lats_a.tolist(), lngs_a.tolist(),
+                lats_b.tolist(), lngs_b.tolist()
+            )
+        ], dtype=numpy.float64).reshape(shape)[()]
+        if units == 'mi':
+            return distances * KILOMETERS_TO_MILES
+        return distances
+    b = A * (1 - F)
+    lng_diff = numpy.radians(lngs_b - lngs_a)
+    lng_diff = (lng_diff + numpy.pi) % (2 * numpy.pi) - numpy.pi
+    u_a = numpy.arctan((1 - F) * numpy.tan(numpy.radians(lats_a)))
+    u_b = numpy.arctan((1 - F) * numpy.tan(numpy.radians(lats_b)))
+    sin_u_a, cos_u_a = numpy.sin(u_a), numpy.cos(u_a)
+    sin_u_b, cos_u_b = numpy.sin(u_b), numpy.cos(u_b)
+    lam = lng_diff.copy()
+    sin_sigma = numpy.zeros(lam.shape)
+    cos_sigma = numpy.ones(lam.shape)
+    sigma = numpy.zeros(lam.shape)
+    cos_sq_alpha = numpy.ones(lam.shape)
+    cos_2sigma_m = numpy.zeros(lam.shape)
+    active = numpy.ones(lam.shape, dtype=bool)
+    for _ in range(VINCENTY_ITERATIONS):
+        if not active.any():
+            break
+        sin_lam, cos_lam = numpy.sin(lam[active]), numpy.cos(lam[active])
+        s_a, c_a = sin_u_a[active], cos_u_a[active]
+        s_b, c_b = sin_u_b[active], cos_u_b[active]
+        sin_s = numpy.hypot(c_b * sin_lam, c_a * s_b - s_a * c_b * cos_lam)
+        cos_s = s_a * s_b + c_a * c_b * cos_lam
+        s = numpy.arctan2(sin_s, cos_s)
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            sin_alpha = numpy.where(
+                sin_s == 0, 0.0, c_a * c_b * sin_lam / sin_s
+            )
+            cos_sq = 1 - sin_alpha ** 2
+            cos_2m = numpy.where(
+                cos_sq == 0, 0.0, cos_s - 2 * s_a * s_b / cos_sq
+            )
+        c = F / 16 * cos_sq * (4 + F * (4 - 3 * cos_sq))
+        previous = lam[active]
+        lam_next = lng_diff[active] + (1 - c) * F * sin_alpha * (
+            s + c * sin_s * (cos_2m + c * cos_s * (-1 + 2 * cos_2m ** 2))
+        )
+        sin_sigma[active] = sin_s
+        cos_sigma[active] = cos_s
+        sigma[active] = s
+        cos_sq_alpha[active] = cos_sq
+        cos_2sigma_m[active] = cos_2m
+        lam[active] = lam_next
+        converged = numpy.abs(lam_next - previous) < VINCENTY_TOLERANCE
+        indices = numpy.flatnonzero(active)
+        active[indices[converged]] = False
+    u_sq = cos_sq_alpha * (A ** 2 - b ** 2) / b ** 2
+    big_a = 1 + u_sq / 16384 * (
+        4096 + u_sq * (-768 + u_sq * (320 - 175 * u_sq))
+    )
+    big_b = u_sq / 1024 * (256 + u_sq * (-128 + u_sq * (74 - 47 * u_sq)))
+    delta_sigma = big_b * sin_sigma * (
+        cos_2sigma_m + big_b / 4 * (
+            cos_sigma * (-1 + 2 * cos_2sigma_m ** 2) -
+            big_b / 6 * cos_2sigma_m * (-3 + 4 * sin_sigma ** 2) *
+            (-3 + 4 * cos_2sigma_m ** 2)
+        )
+    )
+    distances = b * big_a * (sigma - delta_sigma)
+    if active.any():
+        distances[active] = haversine_distances(
+            lats_a[active], lngs_a[active], lats_b[active], lngs_b[active],
+            'km'
+        )
+    distances = distances.reshape(shape)[()]
+    if units == 'mi':
+        return distances * KILOMETERS_TO_MILES
+    return distances
+
+
+def _vincenty(lat_a, lng_a, lat_b, lng_b):
+    """Calculates one distance (km) with the Vincenty inverse formula.
+
+    See vincenty_distances.
+
+    """
+
+    b = A * (1 - F)
+    lng_diff = math.radians(lng_b - lng_a)
+    lng_diff = (lng_diff + math.pi) % (2 * math.pi) - math.pi
+    u_a = math.atan((1 - F) * math.tan(math.radians(lat_a)))
+    u_b = math.atan((1 - F) * math.tan(math.radians(lat_b)))
+    sin_u_a, cos_u_a = math.sin(u_a), math.cos(u_a)
+    sin_u_b, cos_u_b = math.sin(u_b), math.cos(u_b)
+    lam = lng_diff
+    for _ in range(VINCENTY_ITERATIONS):
+        sin_lam, cos_lam = math.sin(lam), math.cos(lam)
+        sin_sigma = math.hypot(
+            cos_u_b * sin_lam, cos_u_a * sin_u_b - sin_u_a * cos_u_b * cos_lam
+        )
+        if sin_sigma == 0:
+            return 0.0
+        cos_sigma = sin_u_a * sin_u_b + cos_u_a * cos_u_b * cos_lam
+        sigma = math.atan2(sin_sigma, cos_sigma)
+        sin_alpha = cos_u_a * cos_u_b * sin_lam / sin_sigma
+        cos_sq_alpha = 1 - sin_alpha ** 2
+        cos_2sigma_m = 0.0
+        if cos_sq_alpha != 0:
+            cos_2sigma_m = cos_sigma - 2 * sin_u_a * sin_u_b / cos_sq_alpha
+        c = F / 16 * cos_sq_alpha * (4 + F * (4 - 3 * cos_sq_alpha))
+        previous = lam
+        lam = lng_diff + (1 - c) * F * sin_alpha * (
+            sigma + c * sin_sigma * (
+                cos_2sigma_m + c * cos_sigma * (-1 + 2 * cos_2sigma_m ** 2)
+            )
+        )
+        if abs(lam - previous) < VINCENTY_TOLERANCE:
+            break
+    else:
+        return calculate_distance([lat_a, lng_a], [lat_b, lng_b], 'km')
+    u_sq = cos_sq_alpha * (A ** 2 - b ** 2) / b ** 2
+    big_a = 1 + u_sq / 16384 * (
+        4096 + u_sq * (-768 + u_sq * (320 - 175 * u_sq))
+    )
+    big_b = u_sq / 1024 * (256 + u_sq * (-128 + u_sq * (74 - 47 * u_sq)))
+    delta_sigma = big_b * sin_sigma * (
+        cos_2sigma_m + big_b / 4 * (
+            cos_sigma * (-1 + 2 * cos_2sigma_m ** 2) -
+            big_b / 6 * cos_2sigma_m * (-3 + 4 * sin_sigma ** 2) *
+            (-3 + 4 * cos_2sigma_m ** 2)
+        )
+    )
+    return b * big_a * (sigma - delta_sigma)
+
+
+def karney_distances(lats_a, lngs_a, lats_b, lngs_b, units=DEFAULT_UNITS):
+    """Calculates distances in (mi or km) on the WGS84 ellipsoid.
+
+    Uses Karney's geodesic algorithm from the optional geographiclib
+    package, which is accurate to nanometers and converges for every pair
+    of points.  Each pair is solved separately, so it suits the few
+    finalists of a lookup rather than whole catalogues.  Inputs are
+    broadcast against each other like haversine_distances.
+
+    Args:
+        lats_a (array(float)): Latitudes of points A.
+        lngs_a (array(float)): Longitudes of points A.
+        lats_b (array(float)): Latitudes of points B.
+        lngs_b (array(float)): Longitudes of points B.
+        units (str, optional): Distance metric used for calculation (mi or km).
+    Returns:
+        Array of distances (float) in provided units (mi or km).
+    Raises:
+        ImportError: If geographiclib is not installed.
+
+    """
+
+    global _geodesic
+    if _geodesic is None:
+        from geographiclib.geodesic import Geodesic
+        _geodesic = Geodesic(A * 1000, F)
+    lats_a, lngs_a, lats_b, lngs_b = numpy.broadcast_arrays(
+        numpy.asarray(lats_a, dtype=numpy.float64),
+        numpy.asarray(lngs_a, dtype=numpy.float64),
+        numpy.asarray(lats_b, dtype=numpy.float64),
+        numpy.asarray(lngs_b, dtype=numpy.float64)
+    )
+    distances = numpy.empty(lats_a.shape)
+    for index in numpy.ndindex(*lats_a.shape):
+        distances[index] = _geodesic.Inverse(
+            float(lats_a[index]),
+            float(lngs_a[index]),
+            float(lats_b[index]),
+            float(lngs_b[index]),
+            _geodesic.DISTANCE
+        )['s12'] / 1000
+    distances = distances[()]
+    if units == 'mi':
+        return distances * KILOMETERS_TO_MILES
+    return distances
@@ -0,0 +1,222 @@
+import hashlib
+import json
+import numpy
+import os
+import struct
+import tempfile
+import zlib
+
+
+MAGIC = b'STORIDX\n'
+# Version 2 recomputes ECEF coordinates with the WGS84 sin(lat) ** 2 term.
+# Version 3 adds a CRC32 checksum of the header to the preamble.
+FORMAT_VERSION = 3
+ALIGNMENT = 64
+PREAMBLE = struct.Struct('<8sIII')
+
+
+class IndexFormatError(Exception):
+    """Raised when an index file is corrupt or was written in another format.
+
+    """
+
+
+class StaleIndexError(IndexFormatError):
+    """Raised when an index file no longer matches the CSV it was built from.
+
+    """
+
+
+def _align(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def _chunks(arrays, layout):
+    """Yields the padding and raw bytes of arrays in layout order.
+
+    """
+
+    position = 0
+    for name, array in arrays.items():
+        yield b'\0' * (layout[name]['offset'] - position)
+        if array.nbytes:
+            yield memoryview(array).cast('B')
+        position = layout[name]['offset'] + array.nbytes
+
+
+def write_index(path, arrays, meta=None):
+    """Writes named NumPy arrays and a metadata dict to an index file.
+
+    The file starts with a preamble (magic bytes, format version, header
+    length and a CRC32 checksum of the header) followed by a JSON header
+    describing every array, and then the raw array data.  Each array is
+    aligned to ALIGNMENT bytes so that it can be memory mapped in place.
+    The header also carries a CRC32 checksum of the data, which is only
+    checked by read_index(verify=True).  The file is written to a temporary
+    file in the same directory and renamed into place, so readers never see
+    a half-written index.
+
+    Args:
+        path (str): Path of the index file.
+        arrays (dict): NumPy array of each name.
+        meta (dict, optional): JSON-serializable metadata.
+
+    """
+
+    arrays = {
+        name: numpy.ascontiguousarray(array) for name, array in arrays.items()
+    }
+    layout = {}
+    size = 0
+    for name, array in arrays.items():
+        size = _align(size)
+        layout[name] = {
+            'offset': size,
+            'dtype': array.dtype.str,
+            'shape': list(array.shape)
+        }
+        size += array.nbytes
+    checksum = 0
+    for chunk in _chunks(arrays, layout):
+        checksum = zlib.crc32(chunk, checksum)
+    header = json.dumps({
+        'arrays': layout,
+        'checksum': checksum,
+        'meta': meta or {},
+        'size': size
+    }).encode('utf-8')
+    data_start = _align(PREAMBLE.size + len(header))
+    fd, tmp_path = tempfile.mkstemp(
+        prefix='.{}.'.format(os.path.basename(path)),
+        dir=os.path.dirname(os.path.abspath(path))
+    )
+    try:
+        with os.fdopen(fd, 'wb') as output:
+            output.write(PREAMBLE.pack(
+                MAGIC, FORMAT_VERSION, len(header), zlib.crc32(header)
+            ))
+            output.write(header)
+            output.write(b'\0' * (data_start - PREAMBLE.size - len(header)))
+            for chunk in _chunks(arrays, layout):
+                output.write(chunk)
+            output.flush()
+            os.fsync(output.fileno())
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def read_index(path, verify=True):
+    """Opens an index file written by write_index with numpy.memmap.
+
+    Arrays are returned as read-only views of the memory-mapped file, so only
+    the pages that are actually used get read from disk, and processes that
+    open the same file share one copy in the page cache.  The header is
+    always checked against its checksum; the data only when verify is set.
+
+    Args:
+        path (str): Path of the index file.
+        verify (bool, optional): Whether to check the data checksum.  This
+            reads every page of the file once, so lookups leave it off.
+    Returns:
+        NumPy array of each name (dict) and metadata (dict).
+    Raises:
+        IndexFormatError: If the file is truncated, has the wrong magic bytes
+            or format version, or fails a checksum.
+
+    """
+
+    with open(path, 'rb') as f:
+        preamble = f.read(PREAMBLE.size)
+        if len(preamble) != PREAMBLE.size:
+            raise IndexFormatError('{} is truncated.'.format(path))
+        magic, version, header_length, header_checksum = PREAMBLE.unpack(
+            preamble
+        )
+        if magic != MAGIC:
+            raise IndexFormatError('{} is not an index file.'.format(path))
+        if version != FORMAT_VERSION:
+            raise IndexFormatError(
+                '{} has format version {}, expected {}.'.format(
+                    path, version, FORMAT_VERSION
+                )
+            )
+        header = f.read(header_length)
+        if zlib.crc32(header) != header_checksum:
+            raise IndexFormatError('{} has a corrupt header.'.format(path))
+        try:
+            header = json.loads(header.decode('utf-8'))
+        except ValueError:
+            raise IndexFormatError('{} has a corrupt header.'.format(path))
+    data_start = _align(PREAMBLE.size + header_length)
+    mapped = numpy.memmap(path, dtype=numpy.uint8, mode='r')
+    data = mapped[data_start:]
+    if len(data) != header['size']:
+        raise IndexFormatError('{} is truncated.'.format(path))
+    if verify and zlib.crc32(data) != header['checksum']:
+        raise IndexFormatError('{} failed its checksum.'.format(path))
+    arrays = {}
+    for name, layout in header['arrays'].items():
+        dtype = numpy.dtype(layout['dtype'])
+        count = int(numpy.prod(layout['shape'], dtype=numpy.int64))
+        start = layout['offset']
+        arrays[name] = data[start:start + count * dtype.itemsize].view(
+            dtype
+        ).reshape(layout['shape'])
+    return arrays, header['meta']
+
+
+def _file_hash(file_path):
+    """Returns the SHA-256 hex digest of a file's contents.
+
+    """
+
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def source_meta(file_path):
+    """Returns the size, modification time and hash of a source file.
+
+    Args:
+        file_path (str): Path of the file an index is built from.
+    Returns:
+        Size, modification time (ns) and SHA-256 hex digest (dict).
+
+    """
+
+    stat = os.stat(file_path)
+    return {
+        'size': stat.st_size,
+        'mtime': stat.st_mtime_ns,
+        'sha256': _file_hash(file_path)
+    }
+
+
+def source_matches(file_path, source):
+    """Checks whether a source file is unchanged since source was recorded.
+
+    The hash is only recalculated when the size matches but the
+    modification time does not.
+
+    Args:
+        file_path (str): Path of the file an index is built from.
+        source (dict or None): Output of source_meta.
+    Returns:
+        Whether the file is unchanged (bool).
+
+    """
+
+    if source is None:
+        return False
+    stat = os.stat(file_path)
+    if stat.st_size != source['size']:
+        return False
+    if stat.st_mtime_ns == source['mtime']:
+        return True
+    return _file_hash(file_path) == source['sha256']
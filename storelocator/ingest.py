@@ -0,0 +1,329 @@
+import codecs
+from storelocator.constants import (
+    CATEGORICAL_FIELDS,
+    DEFAULT_DELIMITER,
+    DEFAULT_ENCODING,
+    INGEST_CHUNK_SIZE,
+    STORE_FIELDS
+)
+import csv
+import math
+import numpy
+import os
+from storelocator.store_table import StoreTable
+import time
+from storelocator.util import geodetic2ecef
+
+
+class GrowableArray(object):
+    """GrowableArray is an append-only NumPy array kept in a file.
+
+    Values are written to the file as they are appended, so only the chunk
+    being appended is held in memory.  open returns the finished array
+    memory mapped from the file.
+
+    """
+
+    def __init__(self, path, dtype, row_shape=()):
+        """Initialization creates an empty array file.
+
+        Args:
+            path (str): Path of the array file.
+            dtype (str or numpy.dtype): Type of the values.
+            row_shape (tuple(int), optional): Shape of each row, for arrays
+                of more than one dimension.
+
+        """
+
+        self.path = path
+        self.dtype = numpy.dtype(dtype)
+        self.row_shape = tuple(row_shape)
+        self.length = 0
+        self._file = open(path, 'wb')
+
+    def __len__(self):
+        return self.length
+
+    def extend(self, values):
+        """Appends rows to the array file.
+
+        Args:
+            values (array-like): Rows to append.
+
+        """
+
+        values = numpy.ascontiguousarray(values, dtype=self.dtype).reshape(
+            (-1,) + self.row_shape
+        )
+        if values.nbytes:
+            self._file.write(memoryview(values).cast('B'))
+        self.length += len(values)
+
+    def open(self):
+        """Closes the array file and memory maps it.
+
+        Returns:
+            Read-only NumPy array of every row appended.
+
+        """
+
+        if not self._file.closed:
+            self._file.close()
+        shape = (self.length,) + self.row_shape
+        if not self.length or not self.dtype.itemsize:
+            return numpy.empty(shape, dtype=self.dtype)
+        return numpy.memmap(self.path, dtype=self.dtype, mode='r', shape=shape)
+
+
+class IngestStats(object):
+    """IngestStats counts the rows an ingestion read, kept and skipped.
+
+    """
+
+    def __init__(self, rows=0, skipped=0, seconds=0.0):
+        """Initialization creates IngestStats from counts and elapsed time.
+
+        Args:
+            rows (int, optional): Number of stores ingested.
+            skipped (int, optional): Number of malformed rows skipped.
+            seconds (float, optional): Time taken.
+
+        """
+
+        self.rows = rows
+        self.skipped = skipped
+        self.seconds = seconds
+
+    @property
+    def rows_per_second(self):
+        """Rows read (ingested or skipped) per second.
+
+        """
+
+        if self.seconds <= 0:
+            return 0.0
+        return (self.rows + self.skipped) / self.seconds
+
+    def __str__(self):
+        return '{} stores ingested, {} malformed rows skipped in {:.2f} s ' \
+            '({:.0f} rows/sec).'.format(
+                self.rows, self.skipped, self.seconds, self.rows_per_second
+            )
+
+
+class StoreTableWriter(object):
+    """StoreTableWriter streams stores into array files of a StoreTable.
+
+    It is the on-disk counterpart of StoreTableBuilder: stores are buffered
+    chunk_size at a time and each chunk is appended to one GrowableArray per
+    column, along with its ECEF coords, so memory stays bounded by the
+    chunk size and the distinct values of categorical fields.
+
+    """
+
+    def __init__(
+            self,
+            directory,
+            fieldnames,
+            categorical_fields=CATEGORICAL_FIELDS,
+            chunk_size=INGEST_CHUNK_SIZE
+            ):
+        """Initialization creates empty array files in directory.
+
+        Args:
+            directory (str): Directory for the array files.
+            fieldnames (list(str)): CSV field names, in order.
+            categorical_fields (list(str), optional): Field names to
+                dictionary-encode.  All other fields are stored as text.
+            chunk_size (int, optional): Number of stores buffered between
+                writes.
+
+        """
+
+        self.fieldnames = list(fieldnames)
+        self.chunk_size = chunk_size
+        self.arrays = {
+            'lats': GrowableArray(os.path.join(directory, 'lats'), 'f8'),
+            'lngs': GrowableArray(os.path.join(directory, 'lngs'), 'f8'),
+            'ecef': GrowableArray(
+                os.path.join(directory, 'ecef'), 'f8', (3,)
+            )
+        }
+        self.values = {}
+        self._text_sizes = {}
+        for i, fieldname in enumerate(self.fieldnames):
+            if fieldname in categorical_fields:
+                self.values[fieldname] = {}
+                self.arrays['codes/{}'.format(fieldname)] = GrowableArray(
+                    os.path.join(directory, 'codes{}'.format(i)), 'i4'
+                )
+            else:
+                self._text_sizes[fieldname] = 0
+                self.arrays['offsets/{}'.format(fieldname)] = GrowableArray(
+                    os.path.join(directory, 'offsets{}'.format(i)), 'i8'
+                )
+                self.arrays['offsets/{}'.format(fieldname)].extend([0])
+                self.arrays['data/{}'.format(fieldname)] = GrowableArray(
+                    os.path.join(directory, 'data{}'.format(i)), 'u1'
+                )
+        self._lats = []
+        self._lngs = []
+        self._columns = {fieldname: [] for fieldname in self.fieldnames}
+
+    def __len__(self):
+        return len(self.arrays['lats']) + len(self._lats)
+
+    def append(self, lat, lng, store):
+        """Adds a store (dict) with parsed coordinates to the table.
+
+        Args:
+            lat (float): Latitude of the store.
+            lng (float): Longitude of the store.
+            store (dict): Store to add.
+
+        """
+
+        self._lats.append(lat)
+        self._lngs.append(lng)
+        for fieldname, column in self._columns.items():
+            column.append(store.get(fieldname) or '')
+        if len(self._lats) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        """Appends the buffered stores to the array files.
+
+        """
+
+        if not len(self._lats):
+            return
+        lats = numpy.array(self._lats, dtype='f8')
+        lngs = numpy.array(self._lngs, dtype='f8')
+        self.arrays['lats'].extend(lats)
+        self.arrays['lngs'].extend(lngs)
+        self.arrays['ecef'].extend(geodetic2ecef(lats, lngs))
+        for fieldname, column in self._columns.items():
+            if fieldname in self.values:
+                values = self.values[fieldname]
+                codes = []
+                for value in column:
+                    code = values.get(value)
+                    if code is None:
+                        code = values[value] = len(values)
+                    codes.append(code)
+                self.arrays['codes/{}'.format(fieldname)].extend(codes)
+            else:
+                encoded = [value.encode('utf-8') for value in column]
+                offsets = numpy.cumsum(
+                    [len(value) for value in encoded], dtype=numpy.int64
+                ) + self._text_sizes[fieldname]
+                data = b''.join(encoded)
+                self._text_sizes[fieldname] += len(data)
+                self.arrays['offsets/{}'.format(fieldname)].extend(offsets)
+                self.arrays['data/{}'.format(fieldname)].extend(
+                    numpy.frombuffer(data, dtype=numpy.uint8)
+                )
+            del column[:]
+        self._lats = []
+        self._lngs = []
+
+    def build(self):
+        """Creates a StoreTable memory mapped from the array files.
+
+        Returns:
+            StoreTable instance, with ECEF coords.
+
+        """
+
+        self.flush()
+        arrays = {name: array.open() for name, array in self.arrays.items()}
+        return StoreTable.from_arrays(arrays, {
+            'fieldnames': self.fieldnames,
+            'categories': {
+                fieldname: list(values)
+                for fieldname, values in self.values.items()
+            }
+        })
+
+
+def parse_coords(store):
+    """Parses the latitude and longitude of a store (dict) read from a CSV.
+
+    Args:
+        store (dict): Row of a csv.DictReader.
+    Returns:
+        Latitude and longitude (tuple of floats), or None if the row is
+        malformed: it has too many or too few fields, or its coordinates
+        are missing, not numbers or out of range.
+
+    """
+
+    if None in store or None in store.values():
+        return None
+    try:
+        lat = float(store[STORE_FIELDS['LATITUDE']])
+        lng = float(store[STORE_FIELDS['LONGITUDE']])
+    except (KeyError, TypeError, ValueError):
+        return None
+    if not (math.isfinite(lat) and math.isfinite(lng)):
+        return None
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        return None
+    return lat, lng
+
+
+def ingest_csv(
+        file_path,
+        directory,
+        encoding=DEFAULT_ENCODING,
+        delimiter=DEFAULT_DELIMITER,
+        chunk_size=INGEST_CHUNK_SIZE,
+        categorical_fields=CATEGORICAL_FIELDS
+        ):
+    """Streams a CSV of stores into a StoreTable backed by array files.
+
+    The CSV is read chunk_size rows at a time and each chunk is appended
+    to array files in directory, so peak memory does not grow with the
+    number of rows.  Malformed rows are counted and skipped.
+
+    Args:
+        file_path (str): Relative path to the CSV.
+        directory (str): Existing directory for the array files.  The
+            returned StoreTable is memory mapped from them, so it must
+            outlive the table.
+        encoding (str, optional): Encoding of the CSV.
+        delimiter (str, optional): Field delimiter of the CSV.
+        chunk_size (int, optional): Number of rows written at a time.
+        categorical_fields (list(str), optional): Field names to
+            dictionary-encode.
+    Returns:
+        StoreTable instance and IngestStats.
+
+    """
+
+    start = time.perf_counter()
+    skipped = 0
+    with codecs.open(file_path, 'r', encoding=encoding) as f:
+        reader = csv.DictReader(f, delimiter=delimiter)
+        writer = StoreTableWriter(
+            directory,
+            reader.fieldnames or [],
+            categorical_fields,
+            chunk_size
+        )
+        while True:
+            try:
+                store = next(reader)
+            except StopIteration:
+                break
+            except csv.Error:
+                skipped += 1
+                continue
+            coords = parse_coords(store)
+            if coords is None:
+                skipped += 1
+                continue
+            writer.append(coords[0], coords[1], store)
+        stores = writer.build()
+    stats = IngestStats(len(stores), skipped, time.perf_counter() - start)
+    return stores, stats
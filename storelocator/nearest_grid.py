@@ -0,0 +1,213 @@
+from storelocator.constants import (
+    GRID_BUILD_CHUNK,
+    GRID_CELLS_PER_STORE,
+    GRID_K,
+    GRID_MARGIN,
+    GRID_MAX_CELL,
+    GRID_MAX_CELLS,
+    GRID_MIN_CELL,
+    GRID_SLACK
+)
+import math
+import numpy
+from storelocator.util import (
+    geodetic2ecef,
+    haversine_distances
+)
+
+
+class NearestGrid(object):
+    """NearestGrid lists, per latitude/longitude cell, the possible nearest.
+
+    The cells cover the stores' bounding box plus GRID_MARGIN degrees.
+    For the center c of each cell, with r the haversine distance from c to
+    the cell's farthest corner and d the distance from c to its k-th
+    nearest store, every store within d + 2r of c is listed: any point p
+    of the cell has k stores within d + r, so none of its k nearest stores
+    can be farther than d + 2r from c.  A lookup then hashes a location to
+    its cell and ranks that short list exactly, without a tree.
+
+    Cells are stored as a CSR pair: the rows of cell i are
+    rows[starts[i]:starts[i + 1]], in ascending order.
+
+    """
+
+    def __init__(self, lat0, lng0, cell, shape, k, starts, rows):
+        """Initialization wraps a built grid.
+
+        Args:
+            lat0 (float): Latitude of the grid's south edge.
+            lng0 (float): Longitude of the grid's west edge.
+            cell (float): Height and width of a cell, in degrees.
+            shape (tuple(int)): Number of cell rows and columns.
+            k (int): Number of nearest stores every cell's list covers.
+            starts (array(int)): Start of each cell's rows, followed by the
+                number of rows.
+            rows (array(int)): Store rows of every cell.
+
+        """
+
+        self.lat0 = lat0
+        self.lng0 = lng0
+        self.cell = cell
+        self.shape = tuple(shape)
+        self.k = k
+        self.starts = starts
+        self.rows = rows
+
+    def __len__(self):
+        return self.shape[0] * self.shape[1]
+
+    @classmethod
+    def build(cls, lats, lngs, tree, k=GRID_K):
+        """Builds a grid over stores with a tree of their ECEF coords.
+
+        Cells are sized so that there are about GRID_CELLS_PER_STORE of
+        them per store, between GRID_MIN_CELL and GRID_MAX_CELL degrees
+        and at most GRID_MAX_CELLS in all.
+
+        Args:
+            lats (array(float)): Latitude of each store.
+            lngs (array(float)): Longitude of each store.
+            tree (obj): SpatialIndex instance over the stores.
+            k (int, optional): Number of nearest stores to cover.
+        Returns:
+            NearestGrid instance, or None when there are no stores.
+
+        """
+
+        from storelocator.csv_parser import _chord_bound
+
+        lats = numpy.asarray(lats, dtype=numpy.float64)
+        lngs = numpy.asarray(lngs, dtype=numpy.float64)
+        if not len(lats):
+            return None
+        k = min(k, len(lats))
+        lat0 = max(-90.0, float(lats.min()) - GRID_MARGIN)
+        lat1 = min(90.0, float(lats.max()) + GRID_MARGIN)
+        lng0 = max(-180.0, float(lngs.min()) - GRID_MARGIN)
+        lng1 = min(180.0, float(lngs.max()) + GRID_MARGIN)
+        area = (lat1 - lat0) * (lng1 - lng0)
+        cell = min(GRID_MAX_CELL, max(
+            GRID_MIN_CELL,
+            math.sqrt(area / (len(lats) * GRID_CELLS_PER_STORE)),
+            math.sqrt(area / GRID_MAX_CELLS)
+        ))
+        shape = (
+            max(1, int(math.ceil((lat1 - lat0) / cell))),
+            max(1, int(math.ceil((lng1 - lng0) / cell)))
+        )
+        south = lat0 + numpy.arange(shape[0]) * cell
+        north = numpy.minimum(south + cell, 90.0)
+        middle = (south + north) / 2
+        half = cell / 2
+        reach = numpy.maximum(
+            haversine_distances(middle, 0.0, south, half, 'km'),
+            haversine_distances(middle, 0.0, north, half, 'km')
+        )
+        counts = numpy.zeros(len(middle) * shape[1], dtype=numpy.int64)
+        rows = []
+        centers = numpy.arange(len(counts))
+        for start in range(0, len(centers), GRID_BUILD_CHUNK):
+            chunk = centers[start:start + GRID_BUILD_CHUNK]
+            c_lats = middle[chunk // shape[1]]
+            c_lngs = lng0 + (chunk % shape[1] + 0.5) * cell
+            c_reach = reach[chunk // shape[1]]
+            targets = geodetic2ecef(c_lats, c_lngs)
+            _, nearest = tree.query(targets, k=k)
+            nearest = numpy.reshape(nearest, (len(chunk), k))
+            bounds = numpy.max(haversine_distances(
+                c_lats[:, None], c_lngs[:, None],
+                lats[nearest], lngs[nearest], 'km'
+            ), axis=1)
+            limits = (bounds + 2 * c_reach) * (1 + GRID_SLACK) + GRID_SLACK
+            balls = tree.query_ball_point(
+                targets, r=[_chord_bound(limit) for limit in limits.tolist()]
+            )
+            for i, ball in enumerate(balls):
+                ball = numpy.array(sorted(ball), dtype=numpy.int64)
+                ball = ball[haversine_distances(
+                    c_lats[i], c_lngs[i], lats[ball], lngs[ball], 'km'
+                ) <= limits[i]]
+                counts[start + i] = len(ball)
+                rows.append(ball)
+        starts = numpy.zeros(len(counts) + 1, dtype=numpy.int64)
+        numpy.cumsum(counts, out=starts[1:])
+        return cls(lat0, lng0, cell, shape, k, starts, numpy.concatenate(rows))
+
+    def cells_of(self, lats, lngs):
+        """Finds the cell of each of many locations.
+
+        Args:
+            lats (array(float)): Latitudes.
+            lngs (array(float)): Longitudes.
+        Returns:
+            Array of cell indices (int), -1 for locations off the grid.
+
+        """
+
+        i = numpy.floor((numpy.asarray(lats) - self.lat0) / self.cell)
+        j = numpy.floor((numpy.asarray(lngs) - self.lng0) / self.cell)
+        inside = (
+            (i >= 0) & (i < self.shape[0]) & (j >= 0) & (j < self.shape[1])
+        )
+        return numpy.where(
+            inside, i * self.shape[1] + j, -1
+        ).astype(numpy.int64)
+
+    def candidates(self, cell):
+        """Returns the store rows that can be nearest to a point of a cell.
+
+        Args:
+            cell (int): Cell index, from cells_of.
+        Returns:
+            Ascending array of store rows (int).
+
+        """
+
+        return numpy.asarray(self.rows)[
+            self.starts[cell]:self.starts[cell + 1]
+        ]
+
+    def to_arrays(self):
+        """Splits the grid into named NumPy arrays and metadata.
+
+        Returns:
+            NumPy array of each name (dict) and metadata (dict).
+
+        """
+
+        return {
+            'grid/starts': self.starts,
+            'grid/rows': self.rows
+        }, {
+            'lat0': self.lat0,
+            'lng0': self.lng0,
+            'cell': self.cell,
+            'shape': list(self.shape),
+            'k': self.k
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays, meta):
+        """Restores a grid from the output of to_arrays.
+
+        Args:
+            arrays (dict): NumPy array of each name.
+            meta (dict or None): Grid metadata, None when no grid was saved.
+        Returns:
+            NearestGrid instance, or None.
+
+        """
+
+        if meta is None:
+            return None
+        return cls(
+            meta['lat0'],
+            meta['lng0'],
+            meta['cell'],
+            meta['shape'],
+            meta['k'],
+            arrays['grid/starts'],
+            arrays['grid/rows']
+        )
@@ -0,0 +1,197 @@
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from storelocator.constants import (
+    DEFAULT_UNITS,
+    DISTANCE_MODEL,
+    INDEX_SUFFIX,
+    PARALLEL_CHUNK_SIZE,
+    PARALLEL_WORKERS
+)
+from storelocator.csv_parser import StoresParser
+from storelocator.index_file import (
+    IndexFormatError,
+    read_index
+)
+from itertools import islice
+import os
+
+
+_worker_sp = None
+
+
+def _init_worker(file_path, encoding, delimiter, backend):
+    """Opens the index file once in each worker process.
+
+    """
+
+    global _worker_sp
+    _worker_sp = StoresParser.load(
+        file_path, encoding, delimiter, backend, verify=False
+    )
+
+
+def _nearest_chunk(
+        lat_lngs, k, units, include=None, exclude=None,
+        model=DISTANCE_MODEL):
+    """Searches one chunk of locations in a worker process.
+
+    """
+
+    return _worker_sp.nearest_many(
+        lat_lngs, k, units, include=include, exclude=exclude, model=model
+    )
+
+
+class ParallelExecutor(object):
+    """ParallelExecutor spreads nearest store lookups over worker processes.
+
+    Every worker opens the StoresParser's index file with numpy.memmap, so
+    the store columns, coordinates and tree arrays live once in the page
+    cache and are shared by all workers instead of being pickled to each of
+    them.  Locations are split into chunks of chunk_size, a bounded number
+    of chunks is kept in flight, and results are yielded in the order of
+    the locations.
+
+    """
+
+    def __init__(
+            self,
+            sp,
+            workers=PARALLEL_WORKERS,
+            chunk_size=PARALLEL_CHUNK_SIZE
+            ):
+        """Initialization starts the worker processes.
+
+        sp is saved to its index file first unless the file already holds
+        it, so the workers see pending and compacted updates too.
+
+        Args:
+            sp (obj): StoresParser instance with stores and tree populated.
+            workers (int, optional): Number of worker processes.  Defaults to
+                the number of CPUs.
+            chunk_size (int, optional): Number of locations per task.
+
+        """
+
+        if sp.pending or sp.dirty or not _index_matches(sp):
+            sp.save()
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self.pool = ProcessPoolExecutor(
+            max_workers=self.workers,
+            initializer=_init_worker,
+            initargs=(sp.file_path, sp.encoding, sp.delimiter, sp.backend)
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """Stops the worker processes.
+
+        """
+
+        self.pool.shutdown()
+
+    def nearest_stream(
+            self,
+            lat_lngs,
+            k=1,
+            units=DEFAULT_UNITS,
+            timings=None,
+            include=None,
+            exclude=None,
+            model=DISTANCE_MODEL
+            ):
+        """Yields the k stores closest to each of many locations, in order.
+
+        lat_lngs may be any iterable; it is consumed a chunk at a time, and
+        at most two chunks per worker are queued at once.
+
+        Args:
+            lat_lngs (iterable(list(float) or None)): Latitudes and
+                longitudes being compared to.  Entries that failed to
+                geocode may be None.
+            k (int, optional): Number of stores to find per location.
+            units (str, optional): Distance metric (mi or km).
+            timings (obj, optional): Timings instance to count chunks in.
+                Stages run in the workers and are not recorded.
+            include (dict, optional): Value(s) of categorical fields stores
+                must have (see StoreFilter).
+            exclude (dict, optional): Value(s) of categorical fields stores
+                must not have.
+            model (str, optional): Distance model (haversine, vincenty or
+                karney) stores are ranked and measured by.
+        Returns:
+            Generator, in the same order as lat_lngs, of lists of store
+            (dict) and distance (float) tuples, closest first.
+
+        """
+
+        lat_lngs = iter(lat_lngs)
+        pending = deque()
+        while True:
+            while len(pending) < 2 * self.workers:
+                chunk = list(islice(lat_lngs, self.chunk_size))
+                if not len(chunk):
+                    break
+                pending.append(self.pool.submit(
+                    _nearest_chunk, chunk, k, units, include, exclude, model
+                ))
+                if timings is not None:
+                    timings.count('chunks')
+            if not len(pending):
+                return
+            for nearest in pending.popleft().result():
+                yield nearest
+
+    def nearest_many(
+            self,
+            lat_lngs,
+            k=1,
+            units=DEFAULT_UNITS,
+            timings=None,
+            include=None,
+            exclude=None,
+            model=DISTANCE_MODEL
+            ):
+        """Finds the k stores closest to each of many locations.
+
+        See nearest_stream and StoresParser.nearest_many.
+
+        Args:
+            lat_lngs (list(list(float) or None)): Latitudes and longitudes
+                being compared to.
+            k (int, optional): Number of stores to find per location.
+            units (str, optional): Distance metric (mi or km).
+            timings (obj, optional): Timings instance to count chunks in.
+            include (dict, optional): Value(s) of categorical fields stores
+                must have (see StoreFilter).
+            exclude (dict, optional): Value(s) of categorical fields stores
+                must not have.
+            model (str, optional): Distance model (haversine, vincenty or
+                karney) stores are ranked and measured by.
+        Returns:
+            List, in the same order as lat_lngs, of lists of store (dict) and
+            distance (float) tuples, closest first.
+
+        """
+
+        return list(self.nearest_stream(
+            lat_lngs, k, units, timings, include, exclude, model
+        ))
+
+
+def _index_matches(sp):
+    """Checks whether the index file of sp was saved from its stores.
+
+    """
+
+    try:
+        _, meta = read_index(sp.file_path + INDEX_SUFFIX, verify=False)
+    except (IOError, IndexFormatError):
+        return False
+    return meta.get('source') == sp.source
@@ -0,0 +1,170 @@
+import codecs
+from storelocator.constants import (
+    DEFAULT_ENCODING,
+    GEOCODE_PROVIDER
+)
+import csv
+from storelocator.geocache import normalize_query
+from storelocator.zip_table import (
+    LATITUDE_COLUMNS,
+    LONGITUDE_COLUMNS,
+    column_index,
+    get_zip_table
+)
+
+
+QUERY_COLUMNS = ['query', 'address', 'zip', 'zip code']
+
+
+class GeocoderProvider(object):
+    """GeocoderProvider is the interface every geocoding backend implements.
+
+    Subclasses implement geocode, and may override geocode_batch when the
+    backend can resolve many queries in one call.  remote tells callers
+    whether results are worth caching and calls worth running concurrently.
+
+    """
+
+    name = None
+    remote = True
+
+    def geocode(self, query):
+        """Outputs latitude and longitude for a given address or zip code.
+
+        Args:
+            query (str, int): Address or zip code.
+        Returns:
+            Latitude and longitude (list of floats) or None.
+
+        """
+
+        raise NotImplementedError
+
+    def geocode_batch(self, queries):
+        """Outputs latitudes and longitudes for many addresses or zip codes.
+
+        Args:
+            queries (list(str, int)): Addresses or zip codes.
+        Returns:
+            List of latitudes and longitudes (lists of floats or None), in
+            the same order as queries.
+
+        """
+
+        return [self.geocode(query) for query in queries]
+
+
+class GeocoderLibProvider(GeocoderProvider):
+    """GeocoderLibProvider geocodes with a provider of the geocoder package.
+
+    """
+
+    def __init__(self, name, **options):
+        """Initialization selects a geocoder package provider by name.
+
+        Args:
+            name (str): Provider function of the geocoder package (google,
+                osm, bing, ...).
+            **options: Keyword arguments passed to every call (e.g. key).
+
+        """
+
+        self.name = name
+        self.options = options
+
+    def geocode(self, query):
+        import geocoder
+        g = getattr(geocoder, self.name)(query, **self.options)
+        return g.latlng
+
+
+class GoogleProvider(GeocoderLibProvider):
+    """GoogleProvider geocodes with Google through the geocoder package.
+
+    """
+
+    def __init__(self, **options):
+        GeocoderLibProvider.__init__(self, 'google', **options)
+
+
+class OfflineProvider(GeocoderProvider):
+    """OfflineProvider geocodes from local reference files without a network.
+
+    Addresses are looked up in a CSV of queries and their coordinates
+    (query or address, lat and lng columns), matched case- and
+    whitespace-insensitively.  Zip codes are also looked up in a file of zip
+    code centroids when one is given.
+
+    """
+
+    name = 'offline'
+    remote = False
+
+    def __init__(
+            self,
+            file_path=None,
+            zip_file_path=None,
+            encoding=DEFAULT_ENCODING
+            ):
+        """Initialization loads the reference files.
+
+        Args:
+            file_path (str, optional): CSV of queries and coordinates.
+            zip_file_path (str, optional): File of zip code centroids.
+            encoding (str, optional): Encoding of the CSV.
+
+        """
+
+        self.references = {}
+        self.zip_table = get_zip_table(zip_file_path)
+        if file_path is not None:
+            with codecs.open(file_path, 'r', encoding=encoding) as f:
+                reader = csv.reader(f)
+                fieldnames = [name.strip().lower() for name in next(reader)]
+                columns = [
+                    column_index(fieldnames, names, file_path)
+                    for names in [
+                        QUERY_COLUMNS, LATITUDE_COLUMNS, LONGITUDE_COLUMNS
+                    ]
+                ]
+                for row in reader:
+                    try:
+                        query = normalize_query(row[columns[0]])
+                        lat_lng = [
+                            float(row[columns[1]]),
+                            float(row[columns[2]])
+                        ]
+                    except (IndexError, ValueError):
+                        continue
+                    self.references[query] = lat_lng
+
+    def geocode(self, query):
+        lat_lng = self.references.get(normalize_query(query))
+        if lat_lng is None and self.zip_table is not None:
+            lat_lng = self.zip_table.lookup(query)
+        return lat_lng
+
+
+PROVIDERS = {
+    'google': GoogleProvider,
+    'offline': OfflineProvider
+}
+
+
+def get_provider(name=GEOCODE_PROVIDER, **options):
+    """Creates a geocoding provider by name.
+
+    Names other than those in PROVIDERS are looked up as providers of the
+    geocoder package.
+
+    Args:
+        name (str, optional): Provider name.
+        **options: Keyword arguments for the provider.
+    Returns:
+        GeocoderProvider instance.
+
+    """
+
+    if name in PROVIDERS:
+        return PROVIDERS[name](**options)
+    return GeocoderLibProvider(name, **options)
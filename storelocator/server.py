@@ -0,0 +1,419 @@
+from concurrent.futures import ThreadPoolExecutor
+from storelocator.constants import (
+    DEFAULT_UNITS,
+    DISTANCE_MODEL,
+    SERVER_HOST,
+    SERVER_IDLE_TIMEOUT,
+    SERVER_MAX_K,
+    SERVER_PORT,
+    SERVER_REQUEST_TIMEOUT,
+    SERVER_WORKERS,
+    UNITS
+)
+from storelocator.timings import (
+    Timings,
+    embed_timings
+)
+from http.server import (
+    BaseHTTPRequestHandler,
+    HTTPServer
+)
+import json
+import math
+import queue
+import selectors
+import socket
+import threading
+import time
+from urllib.parse import (
+    parse_qs,
+    urlparse
+)
+from storelocator.util import (
+    format_result,
+    geocode
+)
+from storelocator.validation import (
+    parse_distance_model,
+    parse_filters
+)
+
+
+class StoreLocatorServer(HTTPServer):
+    """StoreLocatorServer answers nearest-store queries over HTTP with JSON.
+
+    The StoresParser is loaded once and shared by a fixed pool of worker
+    threads, so requests skip the import and index loading cost that every
+    find_store invocation pays.
+
+    Workers are handed one request at a time, not one connection: between
+    requests, a keep-alive connection is parked with a watcher thread that
+    hands it back to the pool once its next request arrives, and closes it
+    after idle_timeout seconds without one.  Idle clients therefore never
+    hold a worker, however many of them there are.
+
+    """
+
+    def __init__(
+            self,
+            sp,
+            host=SERVER_HOST,
+            port=SERVER_PORT,
+            workers=SERVER_WORKERS,
+            geocoder=geocode
+            ):
+        """Initialization binds a StoreLocatorServer to host and port.
+
+        Args:
+            sp (obj): StoresParser instance with stores and tree populated.
+            host (str, optional): Host name or address to listen on.
+            port (int, optional): Port to listen on (0 picks a free port).
+            workers (int, optional): Number of requests handled at once.
+            geocoder (callable, optional): Converts an address or zip code to
+                a latitude and longitude (list of floats) or None.
+
+        """
+
+        HTTPServer.__init__(self, (host, port), NearestStoreHandler)
+        self.sp = sp
+        self.geocoder = geocoder
+        self.idle_timeout = SERVER_IDLE_TIMEOUT
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self._closing = False
+        self._parked = queue.Queue()
+        self._wake, self._waker = socket.socketpair()
+        self._idle = selectors.DefaultSelector()
+        self._idle.register(self._wake, selectors.EVENT_READ)
+        self._watcher = threading.Thread(target=self._watch, daemon=True)
+        self._watcher.start()
+
+    def process_request(self, request, client_address):
+        """Hands a new connection's first request to the worker pool.
+
+        """
+
+        self._submit(_Connection(request, client_address))
+
+    def _handle(self, connection):
+        """Answers one request of a connection, then parks or closes it.
+
+        """
+
+        try:
+            self.finish_request(connection, connection.client_address)
+        except Exception:
+            connection.keep_alive = False
+            self.handle_error(connection.socket, connection.client_address)
+        if not connection.keep_alive or self._closing:
+            self._close(connection)
+        elif connection.buffered():
+            self._submit(connection)
+        else:
+            self._parked.put(connection)
+            self._waker.send(b'\0')
+
+    def _watch(self):
+        """Hands parked connections back to the pool when they are readable.
+
+        """
+
+        while not self._closing:
+            events = self._idle.select(min(1.0, self.idle_timeout))
+            for key, _ in events:
+                if key.fileobj is self._wake:
+                    self._wake.recv(4096)
+                    continue
+                self._idle.unregister(key.fileobj)
+                self._submit(key.data)
+            now = time.monotonic()
+            while True:
+                try:
+                    connection = self._parked.get_nowait()
+                except queue.Empty:
+                    break
+                connection.idle_since = now
+                self._idle.register(
+                    connection.socket, selectors.EVENT_READ, connection
+                )
+            for key in list(self._idle.get_map().values()):
+                if (key.data is not None and
+                        now - key.data.idle_since > self.idle_timeout):
+                    self._idle.unregister(key.fileobj)
+                    self._close(key.data)
+        for key in list(self._idle.get_map().values()):
+            if key.data is not None:
+                self._close(key.data)
+
+    def _submit(self, connection):
+        try:
+            self.executor.submit(self._handle, connection)
+        except RuntimeError:
+            self._close(connection)
+
+    def _close(self, connection):
+        connection.close()
+        self.shutdown_request(connection.socket)
+
+    def server_close(self):
+        """Closes the socket and connections once requests have finished.
+
+        """
+
+        self._closing = True
+        self._waker.send(b'\0')
+        self._watcher.join()
+        HTTPServer.server_close(self)
+        self.executor.shutdown(wait=True)
+        while not self._parked.empty():
+            self._close(self._parked.get_nowait())
+        self._idle.close()
+        self._wake.close()
+        self._waker.close()
+
+
+class _Connection(object):
+    """_Connection keeps a client socket and its buffered files together.
+
+    The same files are used for every request of a keep-alive connection,
+    so bytes the client sent ahead are not lost between requests.
+
+    """
+
+    def __init__(self, sock, client_address):
+        self.socket = sock
+        self.client_address = client_address
+        self.rfile = sock.makefile('rb')
+        self.wfile = sock.makefile('wb')
+        self.keep_alive = False
+        self.idle_since = None
+
+    def buffered(self):
+        """Checks, without blocking, whether a next request is buffered.
+
+        """
+
+        try:
+            self.socket.setblocking(False)
+            return len(self.rfile.peek(1)) > 0
+        except (OSError, ValueError):
+            return False
+        finally:
+            try:
+                self.socket.setblocking(True)
+            except OSError:
+                pass
+
+    def close(self):
+        for f in (self.wfile, self.rfile):
+            try:
+                f.close()
+            except OSError:
+                pass
+
+
+class NearestStoreHandler(BaseHTTPRequestHandler):
+    """NearestStoreHandler answers GET /nearest requests.
+
+    Query parameters are lat and lng, or address, or zip, plus optional k
+    (number of stores, default 1, at most SERVER_MAX_K), units (mi or km)
+    and model (distance model: haversine, vincenty or karney).  A single
+    store is returned as the JSON object format_result produces, and
+    several stores as a JSON array of those objects, closest first.  With
+    timings=1, each object also holds the Timings of the request.
+
+    Each handler answers a single request of a _Connection; the server
+    decides whether the connection is kept alive for the next one.
+
+    """
+
+    protocol_version = 'HTTP/1.1'
+    timeout = SERVER_REQUEST_TIMEOUT
+
+    def setup(self):
+        self.connection = self.request.socket
+        self.connection.settimeout(self.timeout)
+        self.rfile = self.request.rfile
+        self.wfile = self.request.wfile
+
+    def handle(self):
+        self.close_connection = True
+        self.handle_one_request()
+        self.request.keep_alive = not self.close_connection
+
+    def finish(self):
+        if not self.wfile.closed:
+            self.wfile.flush()
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path != '/nearest':
+            return self._send(404, {'error': 'Not found.'})
+        params = parse_qs(url.query)
+        try:
+            lat_lng, query, k, units = parse_nearest_params(params)
+            filters = parse_filter_params(params)
+            model = parse_model_param(params)
+        except ValueError as e:
+            return self._send(400, {'error': str(e)})
+        timings = None
+        if params.get('timings', ['0'])[0] not in ('', '0', 'false'):
+            timings = Timings()
+            start = timings.clock()
+        if lat_lng is None:
+            lat_lng = self.server.geocoder(query)
+            if timings is not None:
+                timings.lap('geocode', start)
+        nearest = []
+        if lat_lng is not None:
+            nearest = self.server.sp.nearest(
+                lat_lng, k, units, timings, model=model, **filters
+            )
+        if not len(nearest):
+            return self._send(404, {})
+        if timings is not None:
+            start = timings.clock()
+        formatted = [
+            format_result(result, distance, units, 'json')
+            for result, distance in nearest
+        ]
+        if timings is not None:
+            timings.lap('format', start)
+            formatted = [
+                embed_timings(result, timings) for result in formatted
+            ]
+        if k == 1:
+            return self._send(200, formatted[0])
+        return self._send(200, '[{}]'.format(', '.join(formatted)))
+
+    def _send(self, status, body):
+        if not isinstance(body, str):
+            body = json.dumps(body)
+        body = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def parse_nearest_params(params):
+    """Validates /nearest query parameters.
+
+    Args:
+        params (dict): Query parameters, as returned by urllib's parse_qs.
+    Returns:
+        Latitude and longitude (list of floats, or None when an address or
+        zip code needs to be geocoded), address or zip code (str or None),
+        k (int) and units (str).
+    Raises:
+        ValueError: If a parameter is missing or invalid, a coordinate is
+            not finite or out of range, or k is above SERVER_MAX_K.
+
+    """
+
+    def first(name):
+        values = params.get(name)
+        return values[0] if values else None
+
+    units = first('units') or DEFAULT_UNITS
+    if units not in UNITS:
+        raise ValueError(
+            'units must be one of the following: {}'.format(UNITS)
+        )
+    try:
+        k = int(first('k') or 1)
+    except ValueError:
+        raise ValueError('k must be a positive integer.')
+    if k < 1:
+        raise ValueError('k must be a positive integer.')
+    if k > SERVER_MAX_K:
+        raise ValueError('k must be at most {}.'.format(SERVER_MAX_K))
+    lat_lng = None
+    query = first('address') or first('zip')
+    if first('lat') is not None or first('lng') is not None:
+        try:
+            lat_lng = [float(first('lat')), float(first('lng'))]
+        except (TypeError, ValueError):
+            raise ValueError('lat and lng must both be numbers.')
+        if not all(math.isfinite(value) for value in lat_lng):
+            raise ValueError('lat and lng must both be finite numbers.')
+        if not (-90 <= lat_lng[0] <= 90 and -180 <= lat_lng[1] <= 180):
+            raise ValueError(
+                'lat must be within [-90, 90] and lng within [-180, 180].'
+            )
+    elif query is None:
+        raise ValueError('lat and lng, address or zip must be specified.')
+    return lat_lng, query, k, units
+
+
+def parse_filter_params(params):
+    """Validates /nearest include and exclude parameters.
+
+    Each is written as field=value and may be repeated (see
+    parse_filters).
+
+    Args:
+        params (dict): Query parameters, as returned by urllib's parse_qs.
+    Returns:
+        Dict with the include and exclude values (dict or None) of each
+        field name.
+    Raises:
+        ValueError: If a filter is malformed.
+
+    """
+
+    filters = {}
+    for name in ['include', 'exclude']:
+        filters[name] = None
+        if name in params:
+            try:
+                filters[name] = parse_filters(params[name])
+            except ValueError as e:
+                raise ValueError('{} {}'.format(name, e))
+    return filters
+
+
+def parse_model_param(params):
+    """Validates the /nearest model parameter.
+
+    Args:
+        params (dict): Query parameters, as returned by urllib's parse_qs.
+    Returns:
+        Distance model (str), DISTANCE_MODEL when none is given.
+    Raises:
+        ValueError: If the model is unknown or cannot be used.
+
+    """
+
+    model = params.get('model', [DISTANCE_MODEL])[0]
+    try:
+        return parse_distance_model(model)
+    except ValueError as e:
+        raise ValueError('model {}'.format(e))
+
+
+def serve(
+        sp,
+        host=SERVER_HOST,
+        port=SERVER_PORT,
+        workers=SERVER_WORKERS):
+    """Answers nearest-store queries over HTTP until interrupted.
+
+    Args:
+        sp (obj): StoresParser instance with stores and tree populated.
+        host (str, optional): Host name or address to listen on.
+        port (int, optional): Port to listen on.
+        workers (int, optional): Number of requests handled at once.
+
+    """
+
+    server = StoreLocatorServer(sp, host, port, workers)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -0,0 +1,569 @@
+from storelocator.constants import (
+    DEFAULT_UNITS,
+    DISTANCE_MODEL,
+    INDEX_SUFFIX,
+    INDEX_VERIFY,
+    KILOMETERS_TO_MILES,
+    SHARD_MANIFEST,
+    SHARD_PRECISION,
+    SPATIAL_BACKEND
+)
+from storelocator.csv_parser import (
+    StoresParser,
+    _chord_bound,
+    paginate
+)
+from storelocator.index_file import (
+    IndexFormatError,
+    StaleIndexError,
+    read_index,
+    source_matches,
+    write_index
+)
+import numpy
+import os
+from storelocator.spatial_index import get_backend
+from storelocator.store_table import StoreTable
+from storelocator.util import (
+    bbox_circle,
+    calculate_distance,
+    distance_function,
+    geodetic2ecef,
+    haversine_bound,
+    haversine_distances,
+    in_bbox,
+    points_in_polygon,
+    polygon_bbox
+)
+
+
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+
+def geohash_codes(lats, lngs, precision=SHARD_PRECISION):
+    """Computes the geohash cell of many coordinates as integers.
+
+    Each code holds the 5 * precision bits of the geohash, alternating
+    longitude and latitude bisections starting with longitude.
+
+    Args:
+        lats (array(float)): Latitudes.
+        lngs (array(float)): Longitudes.
+        precision (int, optional): Geohash length in characters.
+    Returns:
+        Array (int64) of geohash codes.
+
+    """
+
+    bits = 5 * precision
+    lng_bits, lat_bits = (bits + 1) // 2, bits // 2
+    lats = numpy.asarray(lats, dtype=numpy.float64)
+    lngs = numpy.asarray(lngs, dtype=numpy.float64)
+    lat_cells = numpy.clip(
+        numpy.floor((lats + 90) / 180 * (1 << lat_bits)),
+        0,
+        (1 << lat_bits) - 1
+    ).astype(numpy.int64)
+    lng_cells = numpy.clip(
+        numpy.floor((lngs + 180) / 360 * (1 << lng_bits)),
+        0,
+        (1 << lng_bits) - 1
+    ).astype(numpy.int64)
+    codes = numpy.zeros(lats.shape, dtype=numpy.int64)
+    for bit in range(bits):
+        if bit % 2 == 0:
+            value = (lng_cells >> (lng_bits - 1 - bit // 2)) & 1
+        else:
+            value = (lat_cells >> (lat_bits - 1 - bit // 2)) & 1
+        codes = (codes << 1) | value
+    return codes
+
+
+def geohash(lat, lng, precision=SHARD_PRECISION):
+    """Computes the geohash of a coordinate.
+
+    Args:
+        lat (float): Latitude.
+        lng (float): Longitude.
+        precision (int, optional): Geohash length in characters.
+    Returns:
+        Geohash (str).
+
+    """
+
+    return _geohash_string(
+        int(geohash_codes([lat], [lng], precision)[0]), precision
+    )
+
+
+def _geohash_string(code, precision):
+    """Spells a geohash code in the geohash alphabet.
+
+    """
+
+    return ''.join(
+        GEOHASH_ALPHABET[(code >> (5 * (precision - 1 - i))) & 31]
+        for i in range(precision)
+    )
+
+
+def build_shards(
+        sp,
+        directory,
+        precision=SHARD_PRECISION
+        ):
+    """Partitions the stores of a StoresParser into geohash shards.
+
+    Every non-empty geohash cell of the given precision is saved as its own
+    index file (the cell's stores, with their original ids, and their tree)
+    in directory, along with a manifest of the cells and the ECEF bounding
+    box of each shard's stores, which ShardRouter uses to decide which
+    shards a query has to visit.  Pending updates are compacted first.
+
+    Args:
+        sp (obj): StoresParser instance with stores and tree populated.
+        directory (str): Directory for the shard index files.
+        precision (int, optional): Geohash length of the cells.
+    Returns:
+        List of geohashes (str) of the shards written.
+
+    """
+
+    if sp.pending:
+        sp.compact()
+    stores = sp.stores
+    if stores.ecef is None:
+        sp.build_tree()
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    codes = geohash_codes(stores.lats, stores.lngs, precision)
+    order = numpy.argsort(codes, kind='stable')
+    _, starts = numpy.unique(codes[order], return_index=True)
+    ends = numpy.append(starts[1:], len(order))
+    names, codes_written = [], []
+    mins, maxes = [], []
+    for start, end in zip(starts.tolist(), ends.tolist()):
+        rows = order[start:end]
+        code = int(codes[rows[0]])
+        name = _geohash_string(code, precision)
+        table = stores.select(rows)
+        tree = get_backend(sp.backend, len(table)).build(table.ecef)
+        arrays, table_meta = table.to_arrays()
+        tree_arrays, tree_meta = tree.to_arrays()
+        arrays.update(tree_arrays)
+        write_index(
+            os.path.join(directory, name + INDEX_SUFFIX),
+            arrays,
+            {'cell': name, 'table': table_meta, 'tree': tree_meta}
+        )
+        names.append(name)
+        codes_written.append(code)
+        mins.append(numpy.min(table.ecef, axis=0))
+        maxes.append(numpy.max(table.ecef, axis=0))
+    write_index(
+        os.path.join(directory, SHARD_MANIFEST),
+        {
+            'codes': numpy.array(codes_written, dtype=numpy.int64),
+            'mins': numpy.array(mins, dtype=numpy.float64).reshape(-1, 3),
+            'maxes': numpy.array(maxes, dtype=numpy.float64).reshape(-1, 3)
+        },
+        {
+            'cells': names,
+            'precision': precision,
+            'source': sp.source,
+            'size': len(stores)
+        }
+    )
+    return names
+
+
+class ShardRouter(object):
+    """ShardRouter answers nearest store queries over geohash shards.
+
+    A query is sent to its home shard first.  Any other shard is only
+    searched when the distance to the k-th best store found so far could
+    reach past that shard's boundary, i.e. when the ECEF bounding box of
+    the shard is within the chord bound of that distance.  Results are
+    merged with the same ranking (distance under the distance model, then
+    store id) as StoresParser.nearest_many, so they match the unsharded
+    index exactly.
+
+    Shards are opened on first use, so a process serving one region only
+    maps the shards its queries reach.
+
+    """
+
+    def __init__(
+            self,
+            directory,
+            stores_csv=None,
+            backend=SPATIAL_BACKEND,
+            verify=INDEX_VERIFY
+            ):
+        """Initialization reads the manifest of a directory of shards.
+
+        Args:
+            directory (str): Directory written by build_shards.
+            stores_csv (str, optional): CSV the shards were built from.  When
+                given, the shards must have been built from its current
+                version.
+            backend (str, optional): Spatial backend of the shard trees.
+            verify (bool, optional): Whether to check the checksum of the
+                data of the manifest and of each shard as it is opened.
+        Raises:
+            IOError: If the manifest cannot be read.
+            IndexFormatError: If the manifest is corrupt or outdated.
+            StaleIndexError: If stores_csv changed since the shards were
+                built.
+
+        """
+
+        arrays, meta = read_index(
+            os.path.join(directory, SHARD_MANIFEST), verify
+        )
+        try:
+            if stores_csv is not None and not source_matches(
+                    stores_csv, meta['source']):
+                raise StaleIndexError(
+                    'Shards were built from another version of the CSV.'
+                )
+            self.cells = list(meta['cells'])
+            self.precision = meta['precision']
+            codes = numpy.asarray(arrays['codes']).tolist()
+            self.mins = numpy.asarray(arrays['mins'])
+            self.maxes = numpy.asarray(arrays['maxes'])
+        except KeyError as e:
+            raise IndexFormatError('Shard manifest is missing {}.'.format(e))
+        self.directory = directory
+        self.backend = backend
+        self.verify = verify
+        self._positions = {code: i for i, code in enumerate(codes)}
+        self._shards = {}
+
+    def __len__(self):
+        return len(self.cells)
+
+    def shard(self, cell):
+        """Opens the shard of a geohash cell as a StoresParser.
+
+        Args:
+            cell (str): Geohash of the shard.
+        Returns:
+            StoresParser instance with stores and tree populated.
+
+        """
+
+        sp = self._shards.get(cell)
+        if sp is None:
+            path = os.path.join(self.directory, cell + INDEX_SUFFIX)
+            arrays, meta = read_index(path, self.verify)
+            try:
+                sp = StoresParser(path, backend=self.backend)
+                sp.stores = StoreTable.from_arrays(arrays, meta['table'])
+                sp.tree = get_backend(
+                    self.backend, len(sp.stores)
+                ).from_arrays(
+                    arrays, meta['tree'], sp.stores.ecef
+                )
+            except KeyError as e:
+                raise IndexFormatError(
+                    'Shard index file is missing {}.'.format(e)
+                )
+            self._shards[cell] = sp
+        return sp
+
+    def home_cell(self, lat_lng):
+        """Returns the geohash cell a location belongs to.
+
+        Args:
+            lat_lng (list(float)): Latitude and longitude.
+        Returns:
+            Geohash (str).
+
+        """
+
+        return geohash(lat_lng[0], lat_lng[1], self.precision)
+
+    def nearest(
+            self,
+            lat_lng,
+            k=1,
+            units=DEFAULT_UNITS,
+            timings=None,
+            include=None,
+            exclude=None,
+            model=DISTANCE_MODEL
+            ):
+        """Finds the k stores closest to a location.
+
+        See nearest_many.
+
+        Args:
+            lat_lng (list(float)): Latitude and longitude being compared to.
+            k (int, optional): Number of stores to find.
+            units (str, optional): Distance metric (mi or km).
+            timings (obj, optional): Timings instance to record stages in.
+            include (dict, optional): Value(s) of categorical fields stores
+                must have (see StoreFilter).
+            exclude (dict, optional): Value(s) of categorical fields stores
+                must not have.
+            model (str, optional): Distance model (haversine, vincenty or
+                karney) stores are ranked and measured by.
+        Returns:
+            List of store (dict) and distance (float) tuples, closest first.
+
+        """
+
+        return self.nearest_many(
+            [lat_lng], k, units, timings, include, exclude, model
+        )[0]
+
+    def nearest_many(
+            self,
+            lat_lngs,
+            k=1,
+            units=DEFAULT_UNITS,
+            timings=None,
+            include=None,
+            exclude=None,
+            model=DISTANCE_MODEL
+            ):
+        """Finds the k stores closest to each of many locations.
+
+        Each location is searched in its home shard (or, when its cell has
+        no stores, the shard whose bounding box is closest), and then in
+        every other shard whose bounding box is within the chord bound of
+        the k-th best distance found there.  Locations are grouped by shard
+        so each shard is searched once per round.  With include or exclude,
+        each shard only returns the stores that pass the filter, so shards
+        are visited until k of them are found.
+
+        Args:
+            lat_lngs (list(list(float) or None)): Latitudes and longitudes
+                being compared to.  Entries that failed to geocode may be
+                None.
+            k (int, optional): Number of stores to find per location.
+            units (str, optional): Distance metric (mi or km).
+            timings (obj, optional): Timings instance to record the stages
+                of every shard search and the number of shards searched in.
+            include (dict, optional): Value(s) of categorical fields stores
+                must have (see StoreFilter).
+            exclude (dict, optional): Value(s) of categorical fields stores
+                must not have.
+            model (str, optional): Distance model (haversine, vincenty or
+                karney) stores are ranked and measured by.
+        Returns:
+            List, in the same order as lat_lngs, of lists of store (dict) and
+            distance (float) tuples, closest first (ties go to the lowest
+            store id).
+        Raises:
+            ValueError: If model is not a known distance model.
+
+        """
+
+        distance_function(model)
+        results = [[] for _ in lat_lngs]
+        located = [
+            i for i, lat_lng in enumerate(lat_lngs) if lat_lng is not None
+        ]
+        if k < 1 or not len(located) or not len(self.cells):
+            return results
+        targets = numpy.array(
+            [lat_lngs[i] for i in located], dtype=numpy.float64
+        ).reshape(-1, 2)
+        targets_ecef = geodetic2ecef(targets[:, 0], targets[:, 1])
+        gaps = numpy.linalg.norm(
+            numpy.maximum(
+                numpy.maximum(
+                    self.mins[None, :, :] - targets_ecef[:, None, :],
+                    targets_ecef[:, None, :] - self.maxes[None, :, :]
+                ),
+                0
+            ),
+            axis=2
+        )
+        codes = geohash_codes(targets[:, 0], targets[:, 1], self.precision)
+        candidates = [[] for _ in located]
+        visits = {}
+        for t, code in enumerate(codes.tolist()):
+            position = self._positions.get(code)
+            if position is None:
+                position = int(numpy.argmin(gaps[t]))
+            visits.setdefault(position, []).append(t)
+        while len(visits):
+            active = []
+            for position, ts in visits.items():
+                gaps[ts, position] = numpy.inf
+                shard = self.shard(self.cells[position])
+                found = shard.nearest_candidates(
+                    targets[ts].tolist(), k, units, timings, include, exclude,
+                    model
+                )
+                if timings is not None:
+                    timings.count('shard_searches')
+                for t, shard_candidates in zip(ts, found):
+                    if len(candidates[t]):
+                        shard_candidates = _merge(
+                            targets[t],
+                            candidates[t] + shard_candidates,
+                            k,
+                            units,
+                            model
+                        )
+                    candidates[t] = shard_candidates
+                active.extend(ts)
+            visits = {}
+            for t in active:
+                position = int(numpy.argmin(gaps[t]))
+                reach = numpy.inf
+                if len(candidates[t]) >= k:
+                    _, _, lat, lng = candidates[t][-1]
+                    reach = _chord_bound(haversine_bound(float(
+                        haversine_distances(
+                            targets[t, 0], targets[t, 1], lat, lng, 'km'
+                        )
+                    ), model))
+                if gaps[t, position] <= reach:
+                    visits.setdefault(position, []).append(t)
+        if timings is not None:
+            start = timings.clock()
+        for i, (lat, lng), shard_candidates in zip(
+                located, targets.tolist(), candidates):
+            results[i] = [
+                (
+                    store,
+                    calculate_distance(
+                        [lat, lng], [s_lat, s_lng], units, model
+                    )
+                )
+                for store, _, s_lat, s_lng in shard_candidates
+            ]
+        if timings is not None:
+            timings.lap('distance', start)
+        return results
+
+    def within_radius(
+            self,
+            lat_lng,
+            radius,
+            units=DEFAULT_UNITS,
+            limit=None,
+            offset=0
+            ):
+        """Finds the stores within a distance of a location, closest first.
+
+        See StoresParser.within_radius.
+
+        """
+
+        radius_km = radius if units == 'km' else radius / KILOMETERS_TO_MILES
+        return self._within(
+            lat_lng,
+            radius_km,
+            lambda lats, lngs: haversine_distances(
+                lat_lng[0], lat_lng[1], lats, lngs, units
+            ) <= radius,
+            lat_lng,
+            units,
+            limit,
+            offset
+        )
+
+    def within_bbox(
+            self,
+            bbox,
+            origin=None,
+            units=DEFAULT_UNITS,
+            limit=None,
+            offset=0
+            ):
+        """Finds the stores in a latitude/longitude bounding box.
+
+        See StoresParser.within_bbox.
+
+        """
+
+        center, radius_km = bbox_circle(bbox)
+        return self._within(
+            center,
+            radius_km,
+            lambda lats, lngs: in_bbox(lats, lngs, bbox),
+            center if origin is None else origin,
+            units,
+            limit,
+            offset
+        )
+
+    def within_polygon(
+            self,
+            polygon,
+            origin=None,
+            units=DEFAULT_UNITS,
+            limit=None,
+            offset=0
+            ):
+        """Finds the stores in a polygon, such as a delivery zone.
+
+        See StoresParser.within_polygon.
+
+        """
+
+        center, radius_km = bbox_circle(polygon_bbox(polygon))
+        return self._within(
+            center,
+            radius_km,
+            lambda lats, lngs: points_in_polygon(lats, lngs, polygon),
+            center if origin is None else origin,
+            units,
+            limit,
+            offset
+        )
+
+    def _within(self, center, radius_km, test, origin, units, limit, offset):
+        """Runs a range query on every shard the search circle reaches.
+
+        """
+
+        positions = range(len(self.cells))
+        if radius_km is not None:
+            target = geodetic2ecef(center[0], center[1])
+            gaps = numpy.linalg.norm(
+                numpy.maximum(
+                    numpy.maximum(self.mins - target, target - self.maxes),
+                    0
+                ),
+                axis=1
+            )
+            positions = numpy.flatnonzero(
+                gaps <= _chord_bound(radius_km)
+            ).tolist()
+        return paginate(
+            [
+                self.shard(self.cells[position]).range_candidates(
+                    center, radius_km, test
+                )
+                for position in positions
+            ],
+            origin,
+            units,
+            limit,
+            offset
+        )
+
+
+def _merge(target, candidates, k, units, model=DISTANCE_MODEL):
+    """Keeps the k best of candidates from several shards.
+
+    """
+
+    ids = numpy.array([candidate[1] for candidate in candidates])
+    distances = distance_function(model)(
+        target[0],
+        target[1],
+        numpy.array([candidate[2] for candidate in candidates]),
+        numpy.array([candidate[3] for candidate in candidates]),
+        units
+    )
+    return [
+        candidates[j] for j in numpy.lexsort((ids, distances))[:k].tolist()
+    ]
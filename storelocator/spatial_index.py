@@ -0,0 +1,343 @@
+from storelocator.constants import (
+    AUTO_BACKEND,
+    BRUTE_FORCE_CHUNK,
+    BRUTE_FORCE_MAX,
+    SPATIAL_BACKEND,
+    TREE_BALANCED,
+    TREE_COMPACT,
+    TREE_LEAFSIZE,
+    TREE_PARALLEL_MIN,
+    TREE_WORKERS
+)
+import numpy
+
+
+class SpatialIndex(object):
+    """SpatialIndex answers nearest and radius queries over ECEF coords.
+
+    Subclasses wrap one scipy tree class, named by tree_name and imported
+    on first use so that loading the package does not import scipy.  Trees
+    are split into NumPy arrays with to_arrays so they can be saved to an
+    index file, and restored from them with from_arrays when the file was
+    written by the same backend and version of scipy.
+
+    """
+
+    name = None
+    tree_name = None
+
+    @classmethod
+    def tree_class(cls):
+        """Imports the scipy tree class of the backend.
+
+        Returns:
+            Tree class.
+
+        """
+
+        from scipy import spatial
+        return getattr(spatial, cls.tree_name)
+
+    def __init__(self, tree):
+        """Initialization wraps a built tree.
+
+        Args:
+            tree (obj): Tree of tree_class.
+
+        """
+
+        self.tree = tree
+
+    @classmethod
+    def build(cls, ecef):
+        """Builds a SpatialIndex over XYZ ECEF coords.
+
+        Args:
+            ecef (array(float)): (N, 3) XYZ ECEF coords.
+        Returns:
+            SpatialIndex instance.
+
+        """
+
+        return cls(cls.tree_class()(ecef, leafsize=TREE_LEAFSIZE))
+
+    def __len__(self):
+        return self.tree.n
+
+    def query(self, targets, k):
+        """Finds the k nearest coords to each target.
+
+        Args:
+            targets (array(float)): (M, 3) XYZ ECEF coords.
+            k (int): Number of coords to find per target.
+        Returns:
+            Distances and indices, as returned by the scipy tree.
+
+        """
+
+        return self.tree.query(targets, k=k)
+
+    def query_ball_point(self, targets, r):
+        """Finds the coords within distance r of each target.
+
+        Args:
+            targets (array(float)): (M, 3) XYZ ECEF coords.
+            r (float or array(float)): Distance, or one per target.
+        Returns:
+            Array of lists of indices, one per target.
+
+        """
+
+        return self.tree.query_ball_point(targets, r=r)
+
+    def to_arrays(self):
+        """Splits the tree into named NumPy arrays of its nodes and metadata.
+
+        Returns empty arrays and None metadata when the tree cannot be split
+        (a periodic tree, or a scipy version without compiled trees), in
+        which case the tree is rebuilt when the index file is loaded.
+
+        Returns:
+            Tuple of arrays (dict) and metadata (dict or None).
+
+        """
+
+        import scipy
+        try:
+            (
+                tree_buffer, _, n, m, leafsize, maxes, mins, indices,
+                boxsize, _
+            ) = self.tree.__getstate__()
+        except (AttributeError, TypeError, ValueError):
+            return {}, None
+        if boxsize is not None:
+            return {}, None
+        arrays = {
+            'tree/buffer': numpy.asarray(tree_buffer).view(numpy.uint8),
+            'tree/maxes': maxes,
+            'tree/mins': mins,
+            'tree/indices': indices
+        }
+        meta = {
+            'backend': self.name,
+            'scipy': scipy.__version__,
+            'n': n,
+            'm': m,
+            'leafsize': leafsize
+        }
+        return arrays, meta
+
+    @classmethod
+    def from_arrays(cls, arrays, meta, ecef):
+        """Restores a tree saved by to_arrays, or rebuilds it from ecef.
+
+        Args:
+            arrays (dict): Named arrays of the index file.
+            meta (dict or None): Tree metadata of the index file.
+            ecef (array(float)): (N, 3) XYZ ECEF coords of the tree.
+        Returns:
+            SpatialIndex instance, or None if there are no coords.
+
+        """
+
+        if ecef is None:
+            return None
+        if meta is not None and meta.get('backend') == cls.name:
+            import scipy
+            if meta['scipy'] != scipy.__version__:
+                return cls.build(ecef)
+            tree_class = cls.tree_class()
+            tree = tree_class.__new__(tree_class)
+            try:
+                tree.__setstate__((
+                    arrays['tree/buffer'].view('S1'),
+                    ecef,
+                    meta['n'],
+                    meta['m'],
+                    meta['leafsize'],
+                    arrays['tree/maxes'],
+                    arrays['tree/mins'],
+                    arrays['tree/indices'],
+                    None,
+                    None
+                ))
+                return cls(tree)
+            except (AttributeError, KeyError, TypeError, ValueError):
+                pass
+        return cls.build(ecef)
+
+
+class CKDTreeIndex(SpatialIndex):
+    """CKDTreeIndex is the compiled cKDTree, queried in parallel.
+
+    Batches of at least TREE_PARALLEL_MIN targets are split across
+    TREE_WORKERS threads; smaller ones are not worth starting threads for.
+
+    """
+
+    name = 'ckdtree'
+    tree_name = 'cKDTree'
+
+    @classmethod
+    def build(cls, ecef):
+        return cls(cls.tree_class()(
+            ecef,
+            leafsize=TREE_LEAFSIZE,
+            balanced_tree=TREE_BALANCED,
+            compact_nodes=TREE_COMPACT
+        ))
+
+    def query(self, targets, k):
+        return self.tree.query(targets, k=k, workers=_workers(targets))
+
+    def query_ball_point(self, targets, r):
+        return self.tree.query_ball_point(
+            targets, r=r, workers=_workers(targets)
+        )
+
+
+class KDTreeIndex(SpatialIndex):
+    """KDTreeIndex is scipy's KDTree, kept as a fallback backend.
+
+    """
+
+    name = 'kdtree'
+    tree_name = 'KDTree'
+
+
+class BruteForceIndex(SpatialIndex):
+    """BruteForceIndex compares every target with every coord in NumPy.
+
+    It has nothing to build or load and never imports scipy, so it is the
+    fastest way to answer a handful of queries over a modest catalogue,
+    e.g. one find_store invocation; a tree wins once there are many
+    queries to spread its loading cost over.  Targets are processed a
+    chunk at a time so the distance matrix stays under BRUTE_FORCE_CHUNK
+    entries.
+
+    """
+
+    name = 'brute'
+
+    def __init__(self, ecef):
+        """Initialization wraps the coords to search.
+
+        Args:
+            ecef (array(float)): (N, 3) XYZ ECEF coords.
+
+        """
+
+        self.ecef = ecef
+
+    @classmethod
+    def build(cls, ecef):
+        return cls(ecef)
+
+    def __len__(self):
+        return len(self.ecef)
+
+    def query(self, targets, k):
+        targets = numpy.asarray(targets, dtype=numpy.float64).reshape(-1, 3)
+        n = len(self.ecef)
+        found = min(k, n)
+        distances = numpy.full((len(targets), k), numpy.inf)
+        indices = numpy.full((len(targets), k), n, dtype=numpy.int64)
+        for start, chunk in self._chunks(targets if found else []):
+            squared = self._squared_distances(chunk)
+            rows = numpy.argpartition(squared, found - 1, axis=1)[:, :found]
+            nearest = numpy.take_along_axis(squared, rows, axis=1)
+            order = numpy.lexsort((rows, nearest))
+            end = start + len(chunk)
+            indices[start:end, :found] = numpy.take_along_axis(
+                rows, order, axis=1
+            )
+            distances[start:end, :found] = numpy.sqrt(
+                numpy.take_along_axis(nearest, order, axis=1)
+            )
+        if k == 1:
+            return distances[:, 0], indices[:, 0]
+        return distances, indices
+
+    def query_ball_point(self, targets, r):
+        targets = numpy.asarray(targets, dtype=numpy.float64).reshape(-1, 3)
+        r = numpy.broadcast_to(
+            numpy.asarray(r, dtype=numpy.float64), (len(targets),)
+        )
+        matches = []
+        for start, chunk in self._chunks(targets):
+            within = self._squared_distances(chunk) <= (
+                r[start:start + len(chunk), None] ** 2
+            )
+            matches.extend(numpy.flatnonzero(row).tolist() for row in within)
+        return matches
+
+    def to_arrays(self):
+        return {}, None
+
+    @classmethod
+    def from_arrays(cls, arrays, meta, ecef):
+        if ecef is None:
+            return None
+        return cls.build(ecef)
+
+    def _chunks(self, targets):
+        """Yields the start and rows of each chunk of targets.
+
+        """
+
+        size = max(1, BRUTE_FORCE_CHUNK // max(1, len(self.ecef)))
+        for start in range(0, len(targets), size):
+            yield start, targets[start:start + size]
+
+    def _squared_distances(self, targets):
+        """Returns the squared distances from targets to every coord.
+
+        """
+
+        ecef = numpy.asarray(self.ecef, dtype=numpy.float64)
+        squared = numpy.zeros((len(targets), len(ecef)))
+        for axis in range(3):
+            squared += (ecef[None, :, axis] - targets[:, axis, None]) ** 2
+        return squared
+
+
+BACKENDS = {
+    CKDTreeIndex.name: CKDTreeIndex,
+    KDTreeIndex.name: KDTreeIndex,
+    BruteForceIndex.name: BruteForceIndex
+}
+
+
+def get_backend(name=SPATIAL_BACKEND, size=None):
+    """Looks up a SpatialIndex class by name.
+
+    The auto backend is brute when there are at most BRUTE_FORCE_MAX coords
+    to index, and SPATIAL_BACKEND otherwise.
+
+    Args:
+        name (str, optional): Backend name (ckdtree, kdtree, brute or auto).
+        size (int, optional): Number of coords to index, for auto.
+    Returns:
+        SpatialIndex subclass.
+    Raises:
+        ValueError: If there is no backend of that name.
+
+    """
+
+    if name == AUTO_BACKEND:
+        if size is not None and size <= BRUTE_FORCE_MAX:
+            name = BruteForceIndex.name
+        else:
+            name = SPATIAL_BACKEND
+    try:
+        return BACKENDS[name]
+    except KeyError:
+        raise ValueError('Unknown spatial backend {}.'.format(name))
+
+
+def _workers(targets):
+    """Returns the number of threads a query of targets should use.
+
+    """
+
+    return TREE_WORKERS if len(targets) >= TREE_PARALLEL_MIN else 1
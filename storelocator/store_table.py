@@ -0,0 +1,700 @@
+from array import array
+from storelocator.constants import (
+    CATEGORICAL_FIELDS,
+    STORE_FIELDS
+)
+import numpy
+
+
+class CategoricalColumn(object):
+    """CategoricalColumn stores a dictionary-encoded column of strings.
+
+    Every distinct value is kept once in values, and each row holds the
+    integer code of its value.  The rows of each value are indexed too:
+    order lists the rows grouped by code (ascending within each code), and
+    the rows of code c are order[starts[c]:starts[c + 1]].  The row index
+    is built on first use unless it was loaded with the column.
+
+    """
+
+    def __init__(self, codes, values, order=None, starts=None):
+        """Initialization creates a CategoricalColumn from codes and values.
+
+        Args:
+            codes (array(int)): Code of each row's value.
+            values (list(str)): Distinct values, indexed by code.
+            order (array(int), optional): Rows grouped by code.
+            starts (array(int), optional): Start of each code's rows in
+                order, followed by the number of rows.
+
+        """
+
+        self.codes = codes
+        self.values = values
+        self.order = order
+        self.starts = starts
+        self._lookup = None
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, row):
+        return self.values[self.codes[row]]
+
+    def codes_of(self, values):
+        """Looks up the codes of values, skipping values not in the column.
+
+        Args:
+            values (iterable(str)): Values to look up.
+        Returns:
+            Array of codes (int).
+
+        """
+
+        if self._lookup is None:
+            self._lookup = {
+                value: code for code, value in enumerate(self.values)
+            }
+        return numpy.array(
+            sorted({
+                self._lookup[value] for value in values
+                if value in self._lookup
+            }),
+            dtype=numpy.int64
+        )
+
+    def row_index(self):
+        """Returns the row index of the column, building it if needed.
+
+        Returns:
+            Rows grouped by code (array(int)), and the start of each code's
+            rows in them followed by the number of rows (array(int)).
+
+        """
+
+        if self.order is None or self.starts is None:
+            codes = numpy.asarray(self.codes)
+            self.order = numpy.argsort(codes, kind='stable').astype(
+                numpy.int64
+            )
+            self.starts = numpy.zeros(len(self.values) + 1, dtype=numpy.int64)
+            numpy.cumsum(
+                numpy.bincount(codes, minlength=len(self.values)),
+                out=self.starts[1:]
+            )
+        return self.order, self.starts
+
+    def count(self, codes):
+        """Counts the rows holding any of codes.
+
+        Args:
+            codes (array(int)): Codes to count.
+        Returns:
+            Number of rows (int).
+
+        """
+
+        _, starts = self.row_index()
+        return int(numpy.sum(starts[codes + 1] - starts[codes]))
+
+    def rows(self, codes):
+        """Finds the rows holding any of codes.
+
+        Args:
+            codes (array(int)): Codes to find.
+        Returns:
+            Ascending array of rows (int).
+
+        """
+
+        order, starts = self.row_index()
+        rows = [order[starts[code]:starts[code + 1]] for code in codes]
+        if not len(rows):
+            return numpy.array([], dtype=numpy.int64)
+        if len(rows) == 1:
+            return numpy.asarray(rows[0])
+        return numpy.sort(numpy.concatenate(rows))
+
+
+class TextColumn(object):
+    """TextColumn stores a column of strings as one UTF-8 buffer.
+
+    The value of row i is data[offsets[i]:offsets[i + 1]].
+
+    """
+
+    def __init__(self, offsets, data):
+        """Initialization creates a TextColumn from offsets and data.
+
+        Args:
+            offsets (array(int)): Start of each row's value in data, followed
+                by the end of the last value.
+            data (array(uint8)): Concatenated UTF-8 encoded values.
+
+        """
+
+        self.offsets = offsets
+        self.data = data
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, row):
+        start, end = self.offsets[row], self.offsets[row + 1]
+        return self.data[start:end].tobytes().decode('utf-8')
+
+
+class StoreTable(object):
+    """StoreTable holds stores data as columns instead of a list of dicts.
+
+    Latitude and longitude are kept as float64 arrays (along with ECEF
+    coordinates once they are calculated), and every CSV field is kept as a
+    compact string column.  Indexing a StoreTable builds the store (dict) for
+    a single row, so full records only exist for the rows that are used.
+
+    """
+
+    def __init__(
+            self,
+            fieldnames,
+            columns,
+            lats,
+            lngs,
+            ecef=None,
+            ids=None
+            ):
+        """Initialization creates a StoreTable from prebuilt columns.
+
+        Args:
+            fieldnames (list(str)): CSV field names, in order.
+            columns (dict): Column (CategoricalColumn or TextColumn) of each
+                field name.
+            lats (array(float)): Latitude of each store.
+            lngs (array(float)): Longitude of each store.
+            ecef (array(float), optional): XYZ ECEF coords of each store.
+            ids (array(int), optional): Ascending id of each store.  Defaults
+                to the row indices.
+
+        """
+
+        self.fieldnames = fieldnames
+        self.columns = columns
+        self.lats = lats
+        self.lngs = lngs
+        self.ecef = ecef
+        if ids is None:
+            ids = numpy.arange(len(lats), dtype=numpy.int64)
+        self.ids = ids
+
+    @staticmethod
+    def from_records(stores, fieldnames=None):
+        """Builds a StoreTable from an iterable of stores (dicts).
+
+        Args:
+            stores (iterable(dict)): Stores to add to the table.
+            fieldnames (list(str), optional): CSV field names, in order.
+                Defaults to the keys of the first store.
+        Returns:
+            StoreTable containing stores.
+
+        """
+
+        builder = None
+        for store in stores:
+            if builder is None:
+                builder = StoreTableBuilder(fieldnames or list(store.keys()))
+            builder.append(store)
+        if builder is None:
+            builder = StoreTableBuilder(fieldnames or [])
+        return builder.build()
+
+    @staticmethod
+    def from_arrays(arrays, meta):
+        """Rebuilds a StoreTable from the output of to_arrays.
+
+        The arrays are used as-is, so a table read from a memory-mapped index
+        file stays backed by that file.
+
+        Args:
+            arrays (dict): NumPy array of each name.
+            meta (dict): Field names and categorical values.
+        Returns:
+            StoreTable instance.
+
+        """
+
+        columns = {}
+        for fieldname in meta['fieldnames']:
+            if fieldname in meta['categories']:
+                columns[fieldname] = CategoricalColumn(
+                    arrays['codes/{}'.format(fieldname)],
+                    meta['categories'][fieldname],
+                    arrays.get('order/{}'.format(fieldname)),
+                    arrays.get('starts/{}'.format(fieldname))
+                )
+            else:
+                columns[fieldname] = TextColumn(
+                    arrays['offsets/{}'.format(fieldname)],
+                    arrays['data/{}'.format(fieldname)]
+                )
+        return StoreTable(
+            meta['fieldnames'],
+            columns,
+            arrays['lats'],
+            arrays['lngs'],
+            arrays.get('ecef'),
+            arrays.get('ids')
+        )
+
+    def to_arrays(self):
+        """Splits the StoreTable into named NumPy arrays and metadata.
+
+        The row index of every categorical column is built if needed, so
+        that it is saved with the columns.
+
+        Returns:
+            NumPy array of each name (dict) and metadata (dict) holding the
+            field names and categorical values.
+
+        """
+
+        arrays = {'lats': self.lats, 'lngs': self.lngs, 'ids': self.ids}
+        if self.ecef is not None:
+            arrays['ecef'] = self.ecef
+        categories = {}
+        for fieldname in self.fieldnames:
+            column = self.columns[fieldname]
+            if isinstance(column, CategoricalColumn):
+                arrays['codes/{}'.format(fieldname)] = column.codes
+                (
+                    arrays['order/{}'.format(fieldname)],
+                    arrays['starts/{}'.format(fieldname)]
+                ) = column.row_index()
+                categories[fieldname] = column.values
+            else:
+                arrays['offsets/{}'.format(fieldname)] = column.offsets
+                arrays['data/{}'.format(fieldname)] = column.data
+        meta = {'fieldnames': self.fieldnames, 'categories': categories}
+        return arrays, meta
+
+    def __len__(self):
+        return len(self.lats)
+
+    def __getitem__(self, row):
+        if row < 0:
+            row += len(self)
+        if not 0 <= row < len(self):
+            raise IndexError('store index out of range')
+        return {
+            fieldname: self.columns[fieldname][row]
+            for fieldname in self.fieldnames
+        }
+
+    def __iter__(self):
+        for row in range(len(self)):
+            yield self[row]
+
+    def select(self, rows):
+        """Copies a subset of rows into a new StoreTable.
+
+        Unlike take, the new table does not reference this one, and its
+        text columns only hold the selected values.
+
+        Args:
+            rows (array(int)): Row indices to select.
+        Returns:
+            StoreTable of the selected rows.
+
+        """
+
+        rows = numpy.asarray(rows, dtype=numpy.int64)
+        columns = {}
+        for fieldname in self.fieldnames:
+            column = self.columns[fieldname]
+            if isinstance(column, CategoricalColumn):
+                columns[fieldname] = CategoricalColumn(
+                    numpy.asarray(column.codes)[rows],
+                    column.values
+                )
+            else:
+                starts = numpy.asarray(column.offsets)[rows]
+                lengths = numpy.asarray(column.offsets)[rows + 1] - starts
+                offsets = numpy.zeros(len(rows) + 1, dtype=numpy.int64)
+                numpy.cumsum(lengths, out=offsets[1:])
+                positions = numpy.repeat(starts - offsets[:-1], lengths)
+                positions += numpy.arange(offsets[-1], dtype=numpy.int64)
+                columns[fieldname] = TextColumn(
+                    offsets,
+                    numpy.asarray(column.data)[positions]
+                )
+        return StoreTable(
+            self.fieldnames,
+            columns,
+            numpy.asarray(self.lats)[rows],
+            numpy.asarray(self.lngs)[rows],
+            None if self.ecef is None else numpy.asarray(self.ecef)[rows],
+            numpy.asarray(self.ids)[rows]
+        )
+
+    @staticmethod
+    def concat(tables):
+        """Joins StoreTables with the same field names into one StoreTable.
+
+        Categorical values are merged, and codes are remapped to the merged
+        values.
+
+        Args:
+            tables (list(obj)): StoreTable instances.
+        Returns:
+            StoreTable holding the rows of every table, in order.
+
+        """
+
+        fieldnames = tables[0].fieldnames
+        columns = {}
+        for fieldname in fieldnames:
+            parts = [table.columns[fieldname] for table in tables]
+            if isinstance(parts[0], CategoricalColumn):
+                merged = {}
+                codes = []
+                for part in parts:
+                    mapping = numpy.array(
+                        [
+                            merged.setdefault(value, len(merged))
+                            for value in part.values
+                        ],
+                        dtype=numpy.int32
+                    )
+                    codes.append(mapping[numpy.asarray(part.codes)])
+                columns[fieldname] = CategoricalColumn(
+                    numpy.concatenate(codes).astype(numpy.int32),
+                    list(merged)
+                )
+            else:
+                offsets = [numpy.zeros(1, dtype=numpy.int64)]
+                shift = 0
+                for part in parts:
+                    offsets.append(numpy.asarray(part.offsets)[1:] + shift)
+                    shift += int(part.offsets[-1])
+                columns[fieldname] = TextColumn(
+                    numpy.concatenate(offsets),
+                    numpy.concatenate(
+                        [numpy.asarray(part.data) for part in parts]
+                    ).astype(numpy.uint8)
+                )
+        ecef = None
+        if all(table.ecef is not None for table in tables):
+            ecef = numpy.concatenate(
+                [numpy.asarray(table.ecef) for table in tables]
+            ).reshape(-1, 3)
+        return StoreTable(
+            fieldnames,
+            columns,
+            numpy.concatenate([numpy.asarray(t.lats) for t in tables]),
+            numpy.concatenate([numpy.asarray(t.lngs) for t in tables]),
+            ecef,
+            numpy.concatenate(
+                [numpy.asarray(t.ids) for t in tables]
+            ).astype(numpy.int64)
+        )
+
+    def take(self, rows):
+        """Selects a subset of rows without building any stores (dicts).
+
+        Args:
+            rows (array(int)): Row indices to select.
+        Returns:
+            StoreRows view of the selected rows.
+
+        """
+
+        return StoreRows(self, rows)
+
+
+class StoreRows(object):
+    """StoreRows is a view of selected rows of a StoreTable.
+
+    """
+
+    def __init__(self, table, rows):
+        """Initialization creates a StoreRows view of rows of table.
+
+        Args:
+            table (obj): StoreTable instance.
+            rows (array(int)): Row indices of table.
+
+        """
+
+        self.table = table
+        self.rows = numpy.asarray(rows, dtype=numpy.int64)
+
+    @property
+    def lats(self):
+        """Latitudes of the selected rows.
+
+        """
+
+        return self.table.lats[self.rows]
+
+    @property
+    def lngs(self):
+        """Longitudes of the selected rows.
+
+        """
+
+        return self.table.lngs[self.rows]
+
+    @property
+    def ecef(self):
+        """XYZ ECEF coords of the selected rows.
+
+        """
+
+        return self.table.ecef[self.rows]
+
+    @property
+    def ids(self):
+        """Ids of the selected rows.
+
+        """
+
+        return self.table.ids[self.rows]
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getitem__(self, i):
+        return self.table[int(self.rows[i])]
+
+    def __iter__(self):
+        for row in self.rows:
+            yield self.table[int(row)]
+
+
+class StoreTableBuilder(object):
+    """StoreTableBuilder accumulates stores row by row into a StoreTable.
+
+    """
+
+    def __init__(self, fieldnames, categorical_fields=CATEGORICAL_FIELDS):
+        """Initialization creates an empty StoreTableBuilder.
+
+        Args:
+            fieldnames (list(str)): CSV field names, in order.
+            categorical_fields (list(str), optional): Field names to
+                dictionary-encode.  All other fields are stored as text.
+
+        """
+
+        self.fieldnames = list(fieldnames)
+        self.lats = array('d')
+        self.lngs = array('d')
+        self.ids = array('q')
+        self.codes = {}
+        self.values = {}
+        self.offsets = {}
+        self.data = {}
+        for fieldname in self.fieldnames:
+            if fieldname in categorical_fields:
+                self.codes[fieldname] = array('i')
+                self.values[fieldname] = {}
+            else:
+                self.offsets[fieldname] = array('q', [0])
+                self.data[fieldname] = bytearray()
+
+    def append(self, store, store_id=None):
+        """Adds a store (dict) to the table.
+
+        Args:
+            store (dict): Store to add.
+            store_id (int, optional): Id of the store.  Defaults to its row
+                index.
+
+        """
+
+        lat = float(store[STORE_FIELDS['LATITUDE']])
+        lng = float(store[STORE_FIELDS['LONGITUDE']])
+        if store_id is None:
+            store_id = len(self.ids)
+        self.lats.append(lat)
+        self.lngs.append(lng)
+        self.ids.append(store_id)
+        for fieldname in self.fieldnames:
+            value = store.get(fieldname)
+            if value is None:
+                value = ''
+            if fieldname in self.codes:
+                values = self.values[fieldname]
+                code = values.get(value)
+                if code is None:
+                    code = values[value] = len(values)
+                self.codes[fieldname].append(code)
+            else:
+                self.data[fieldname].extend(value.encode('utf-8'))
+                self.offsets[fieldname].append(len(self.data[fieldname]))
+
+    def build(self):
+        """Creates a StoreTable from the stores added so far.
+
+        Returns:
+            StoreTable instance.
+
+        """
+
+        columns = {}
+        for fieldname in self.fieldnames:
+            if fieldname in self.codes:
+                columns[fieldname] = CategoricalColumn(
+                    numpy.array(self.codes[fieldname], dtype=numpy.int32),
+                    list(self.values[fieldname])
+                )
+            else:
+                columns[fieldname] = TextColumn(
+                    numpy.array(self.offsets[fieldname], dtype=numpy.int64),
+                    numpy.frombuffer(
+                        bytes(self.data[fieldname]), dtype=numpy.uint8
+                    )
+                )
+        return StoreTable(
+            self.fieldnames,
+            columns,
+            numpy.array(self.lats, dtype=numpy.float64),
+            numpy.array(self.lngs, dtype=numpy.float64),
+            ids=numpy.array(self.ids, dtype=numpy.int64)
+        )
+
+
+class StoreFilter(object):
+    """StoreFilter selects stores by the values of their categorical fields.
+
+    include maps field names to the values a store must have (any one of
+    them per field, every field), and exclude maps field names to values
+    it must not have.  Matching rows are found from the row index of each
+    categorical column, so finding them costs about as much as the number
+    of rows of the included values, however large the table is.
+
+    """
+
+    def __init__(self, include=None, exclude=None):
+        """Initialization creates a StoreFilter from field values.
+
+        Args:
+            include (dict, optional): Value (str) or values (list(str)) of
+                each field name stores must have.
+            exclude (dict, optional): Value (str) or values (list(str)) of
+                each field name stores must not have.
+
+        """
+
+        self.include = _field_values(include)
+        self.exclude = _field_values(exclude)
+
+    def __bool__(self):
+        return bool(len(self.include) or len(self.exclude))
+
+    def estimate(self, table):
+        """Counts at least as many rows of table as match.
+
+        Args:
+            table (obj): StoreTable instance.
+        Returns:
+            Number of rows (int) holding the included values of the field
+            with the fewest of them, or every row when nothing is included.
+        Raises:
+            ValueError: If a field is not categorical in table.
+
+        """
+
+        estimate = len(table)
+        for fieldname, values in self.include.items():
+            column = _categorical_column(table, fieldname)
+            estimate = min(estimate, column.count(column.codes_of(values)))
+        for fieldname in self.exclude:
+            _categorical_column(table, fieldname)
+        return estimate
+
+    def rows(self, table):
+        """Finds the rows of table that match.
+
+        The rows of the field with the fewest included rows are tested
+        against the other fields, so included values that match few stores
+        are never compared with the whole table.
+
+        Args:
+            table (obj): StoreTable instance.
+        Returns:
+            Ascending array of rows (int).
+        Raises:
+            ValueError: If a field is not categorical in table.
+
+        """
+
+        rows = None
+        smallest = None
+        for fieldname, values in self.include.items():
+            column = _categorical_column(table, fieldname)
+            codes = column.codes_of(values)
+            count = column.count(codes)
+            if smallest is None or count < smallest[0]:
+                smallest = (count, column, codes)
+        if smallest is None:
+            rows = numpy.arange(len(table), dtype=numpy.int64)
+        else:
+            rows = smallest[1].rows(smallest[2])
+        return rows[self.test(table, rows)]
+
+    def test(self, table, rows):
+        """Tests which rows of table match.
+
+        Args:
+            table (obj): StoreTable instance.
+            rows (array(int)): Rows to test.
+        Returns:
+            Array (bool) of the rows that match.
+        Raises:
+            ValueError: If a field is not categorical in table.
+
+        """
+
+        rows = numpy.asarray(rows, dtype=numpy.int64)
+        keep = numpy.ones(len(rows), dtype=bool)
+        for fields, included in [(self.include, True), (self.exclude, False)]:
+            for fieldname, values in fields.items():
+                column = _categorical_column(table, fieldname)
+                found = numpy.isin(
+                    numpy.asarray(column.codes)[rows],
+                    column.codes_of(values)
+                )
+                keep &= found if included else ~found
+        return keep
+
+
+def _field_values(fields):
+    """Normalizes a field name to value(s) dict to field name to value set.
+
+    """
+
+    normalized = {}
+    for fieldname, values in (fields or {}).items():
+        if isinstance(values, str):
+            values = [values]
+        normalized[fieldname] = set(values)
+    return normalized
+
+
+def _categorical_column(table, fieldname):
+    """Looks up a categorical column of table to filter on.
+
+    """
+
+    column = table.columns.get(fieldname)
+    if not isinstance(column, CategoricalColumn):
+        raise ValueError(
+            'Stores can only be filtered on the following fields: {}'.format(
+                [
+                    name for name in table.fieldnames
+                    if isinstance(table.columns[name], CategoricalColumn)
+                ]
+            )
+        )
+    return column
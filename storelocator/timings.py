@@ -0,0 +1,201 @@
+from storelocator.constants import (
+    PROFILE_LINES,
+    PROFILE_MODES,
+    STORE_FIELDS
+)
+from contextlib import contextmanager
+import json
+import sys
+import time
+
+
+class Timings(object):
+    """Timings records where the time of a lookup went.
+
+    Code on the lookup path takes an optional timings argument and, only
+    when one is given, records the duration of each stage (accumulated
+    when a stage runs more than once, e.g. once per batch) and counts
+    such as candidate stores, radius expansions and cache hits.  When no
+    Timings is passed nothing is measured, so instrumentation costs
+    nothing unless it is asked for.
+
+    """
+
+    def __init__(self, callback=None):
+        """Initialization creates an empty Timings.
+
+        Args:
+            callback (callable, optional): Called with the name and duration
+                (float, seconds) of each stage as it ends, e.g. to feed a
+                metrics client.
+
+        """
+
+        self.stages = {}
+        self.counts = {}
+        self.callback = callback
+
+    @staticmethod
+    def clock():
+        """Returns the current time, for starting a stage.
+
+        """
+
+        return time.perf_counter()
+
+    def add(self, name, seconds):
+        """Records that a stage took seconds.
+
+        Args:
+            name (str): Name of the stage.
+            seconds (float): Duration of the stage.
+
+        """
+
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+        if self.callback is not None:
+            self.callback(name, seconds)
+
+    def lap(self, name, start):
+        """Records a stage that started at start and ends now.
+
+        Args:
+            name (str): Name of the stage.
+            start (float): Time the stage started, from clock.
+        Returns:
+            Current time (float), for starting the next stage.
+
+        """
+
+        now = time.perf_counter()
+        self.add(name, now - start)
+        return now
+
+    @contextmanager
+    def stage(self, name):
+        """Records the duration of a with block as a stage.
+
+        Args:
+            name (str): Name of the stage.
+
+        """
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.lap(name, start)
+
+    def count(self, name, n=1):
+        """Adds n to a counter.
+
+        Args:
+            name (str): Name of the counter.
+            n (int, optional): Amount to add.
+
+        """
+
+        self.counts[name] = self.counts.get(name, 0) + n
+
+    def to_dict(self):
+        """Returns the stages (in milliseconds) and counts as a dict.
+
+        Returns:
+            Dict with stages (name to milliseconds, in the order they were
+            first recorded), total_ms and counts, ready for json.dumps.
+
+        """
+
+        return {
+            'stages': {
+                name: round(seconds * 1000, 3)
+                for name, seconds in self.stages.items()
+            },
+            'total_ms': round(sum(self.stages.values()) * 1000, 3),
+            'counts': dict(self.counts)
+        }
+
+    def __str__(self):
+        lines = [
+            '{:<18} {:10.3f} ms'.format(name, seconds * 1000)
+            for name, seconds in self.stages.items()
+        ]
+        lines.append('{:<18} {:10.3f} ms'.format(
+            'total', sum(self.stages.values()) * 1000
+        ))
+        lines.extend(
+            '{:<18} {:10}'.format(name, n)
+            for name, n in self.counts.items()
+        )
+        return '\n'.join(lines)
+
+
+def embed_timings(formatted, timings):
+    """Adds timings to a store formatted as json by format_result.
+
+    Args:
+        formatted (str or dict): JSON object of a store, or an empty dict
+            when no store was found.
+        timings (obj): Timings instance.
+    Returns:
+        JSON object (str) with the timings under the Timings field.
+
+    """
+
+    if isinstance(formatted, str):
+        formatted = json.loads(formatted)
+    formatted = dict(formatted)
+    formatted[STORE_FIELDS['TIMINGS']] = timings.to_dict()
+    return json.dumps(formatted)
+
+
+@contextmanager
+def profile(mode, stream=None, lines=PROFILE_LINES):
+    """Profiles a with block and writes a report when it ends.
+
+    cprofile reports the functions with the most cumulative time, and
+    tracemalloc the source lines that allocated the most memory still held
+    at the end, plus the peak.
+
+    Args:
+        mode (str): Profiler (cprofile or tracemalloc).
+        stream (file, optional): Where the report is written.  Defaults to
+            stderr.
+        lines (int, optional): Number of entries in the report.
+    Raises:
+        ValueError: If mode is not a known profiler.
+
+    """
+
+    if mode not in PROFILE_MODES:
+        raise ValueError(
+            'profile must be one of the following: {}'.format(PROFILE_MODES)
+        )
+    if stream is None:
+        stream = sys.stderr
+    if mode == 'cprofile':
+        import cProfile
+        import pstats
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            pstats.Stats(profiler, stream=stream).sort_stats(
+                'cumulative'
+            ).print_stats(lines)
+    else:
+        import tracemalloc
+        tracemalloc.start()
+        try:
+            yield
+        finally:
+            snapshot = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            stream.write('Peak traced memory: {:.1f} KiB\n'.format(
+                peak / 1024.0
+            ))
+            for stat in snapshot.statistics('lineno')[:lines]:
+                stream.write('{}\n'.format(stat))
@@ -2,24 +2,42 @@ from storelocator.constants import (
     A,
     B,
     DEFAULT_UNITS,
+    DISTANCE_MODEL,
+    DISTANCE_MODELS,
     DISTANCE_PRECISION,
     DISTANCE_RADIUS,
     ESQ,
+    GEOCODE_CACHE_PATH,
+    GEOCODE_PROVIDER,
     KILOMETERS_TO_MILES,
-    OUTPUT,
+    SPHERICAL_ERROR,
     STORE_FIELDS,
-    UNITS
+    ZIP_CENTROIDS_CSV
 )
 from decimal import (
     Decimal,
     ROUND_HALF_UP
 )
-import geocoder
+from storelocator.geocache import GeocodeCache
 import json
 import math
+import numpy
+from storelocator.providers import get_provider
+from storelocator.validation import (  # noqa: F401
+    parse_bbox,
+    parse_distance_model,
+    parse_fields,
+    parse_filters,
+    parse_polygon,
+    validate_args
+)
+from storelocator.zip_table import (
+    get_zip_table,
+    parse_zip
+)
 
 
-def filter_stores(sp, lat_lng_ecef, initial_radius, inc_radius):
+def filter_stores(sp, lat_lng_ecef, initial_radius, inc_radius, timings=None):
     """Queries StoresParser for stores near lat_lng_ecef within radius.
 
     Args:
@@ -27,8 +45,10 @@ def filter_stores(sp, lat_lng_ecef, initial_radius, inc_radius):
         lat_lng_ecef (float): Converted ECEF lat/long.
         initial_radius (float): Initial search radius.
         inc_radius (float): Amount to increment search radius.
+        timings (obj, optional): Timings instance to count radius
+            expansions and candidates in.
     Returns:
-        List of nearby stores.
+        StoreRows view of nearby stores.
 
     """
 
@@ -37,26 +57,40 @@ def filter_stores(sp, lat_lng_ecef, initial_radius, inc_radius):
     while len(matches) < 1:
         results = sp.query(lat_lng_ecef, radius)
         if results is not None:
-            if len(results):
-                matches.extend(results)
+            matches = results
         radius += inc_radius
+        if timings is not None:
+            timings.count('radius_iterations')
+    if timings is not None:
+        timings.count('candidates', len(matches))
     return matches
 
 
 def geodetic2ecef(lat, lon, alt=0):
     """Convert geodetic coordinates to ECEF.
 
+    Accepts floats, or arrays to convert many coordinates in one call.
+
     Args:
-        lat (float): Latitude.
-        lon (float): Longitude.
-        alt (float, optional): Altitude.
+        lat (float or array(float)): Latitude.
+        lon (float or array(float)): Longitude.
+        alt (float or array(float), optional): Altitude.
     Returns:
-        X, Y, Z ECEF coordinates.
+        X, Y, Z ECEF coordinates, or an (N, 3) array of them when given
+        arrays.
 
     """
 
+    if numpy.ndim(lat) or numpy.ndim(lon) or numpy.ndim(alt):
+        lat = numpy.radians(numpy.asarray(lat, dtype=numpy.float64))
+        lon = numpy.radians(numpy.asarray(lon, dtype=numpy.float64))
+        n = A / numpy.sqrt(1 - ESQ * numpy.sin(lat) ** 2)
+        x = (n + alt) * numpy.cos(lat) * numpy.cos(lon)
+        y = (n + alt) * numpy.cos(lat) * numpy.sin(lon)
+        z = (n * (1 - ESQ) + alt) * numpy.sin(lat)
+        return numpy.stack(numpy.broadcast_arrays(x, y, z), axis=-1)
     lat, lon = math.radians(lat), math.radians(lon)
-    xi = math.sqrt(1 - ESQ * math.sin(lat))
+    xi = math.sqrt(1 - ESQ * math.sin(lat) ** 2)
     x = (A / xi + alt) * math.cos(lat) * math.cos(lon)
     y = (A / xi + alt) * math.cos(lat) * math.sin(lon)
     z = (A / xi * (1 - ESQ) + alt) * math.sin(lat)
@@ -77,58 +111,144 @@ def euclidean_distance(distance):
     return 2 * A * math.sin(distance / (2 * B))
 
 
-def geocode(query):
+geocode_cache = GeocodeCache(GEOCODE_CACHE_PATH)
+geocode_provider = get_provider(GEOCODE_PROVIDER)
+zip_centroids_csv = ZIP_CENTROIDS_CSV
+_zip_tables = {}
+_quantizers = {}
+
+
+def set_geocode_cache(cache):
+    """Replaces the GeocodeCache used by geocode.
+
+    Args:
+        cache (obj): GeocodeCache instance.
+
+    """
+
+    global geocode_cache
+    geocode_cache = cache
+
+
+def set_geocode_provider(provider):
+    """Replaces the GeocoderProvider used by geocode.
+
+    Args:
+        provider (obj): GeocoderProvider instance.
+
+    """
+
+    global geocode_provider
+    geocode_provider = provider
+
+
+def set_zip_centroids(file_path):
+    """Replaces the file of zip code centroids used by geocode.
+
+    Args:
+        file_path (str or None): Path of a file of zip code centroids, or
+            None to always geocode zip codes remotely.
+
+    """
+
+    global zip_centroids_csv
+    zip_centroids_csv = file_path
+
+
+def zip_centroid(query):
+    """Looks up a zip code in the file of zip code centroids.
+
+    The file is loaded on first use, and only if it exists.
+
+    Args:
+        query (str, int): Address or zip code.
+    Returns:
+        Latitude and longitude (list of floats) or None if query is not a
+        zip code in the file.
+
+    """
+
+    if parse_zip(query) is None:
+        return None
+    if zip_centroids_csv not in _zip_tables:
+        _zip_tables[zip_centroids_csv] = get_zip_table(zip_centroids_csv)
+    table = _zip_tables[zip_centroids_csv]
+    if table is None:
+        return None
+    return table.lookup(query)
+
+
+def geocode(query, cache=None, provider=None, timings=None):
     """Outputs latitude and longitude for a given address or zip code.
 
+    Zip codes are looked up offline in the file of zip code centroids
+    first.  Everything else, including zip codes missing from that file, is
+    geocoded by the provider.  Results of remote providers (including
+    misses) are remembered in a GeocodeCache so repeated queries skip the
+    remote geocoder.
+
     Args:
         query (str, int): Address or zip code.
+        cache (obj, optional): GeocodeCache instance.  Defaults to the one
+            set with set_geocode_cache.
+        provider (obj, optional): GeocoderProvider instance.  Defaults to
+            the one set with set_geocode_provider.
+        timings (obj, optional): Timings instance to count zip centroid and
+            cache hits and misses in.
     Returns:
         Latitude and longitude (list of floats) or None.
 
     """
 
-    # TODO(Austin) Add optional parameter for provider
-    g = geocoder.google(query)
-    return g.latlng
+    lat_lng = zip_centroid(query)
+    if lat_lng is not None:
+        if timings is not None:
+            timings.count('zip_centroid_hits')
+        return lat_lng
+    if provider is None:
+        provider = geocode_provider
+    if not provider.remote:
+        return provider.geocode(query)
+    if cache is None:
+        cache = geocode_cache
+    if timings is None:
+        return cache.geocode(query, provider.geocode)
+    hits = cache.hits
+    lat_lng = cache.geocode(query, provider.geocode)
+    if cache.hits > hits:
+        timings.count('cache_hits')
+    else:
+        timings.count('cache_misses')
+    return lat_lng
 
 
-def validate_args(args):
-    """Validates arguments and constructs query from them.
+def geocode_batch(queries, provider=None):
+    """Outputs latitudes and longitudes for many addresses or zip codes.
+
+    Zip codes found in the file of zip code centroids are resolved there;
+    the remaining queries go to the provider in one geocode_batch call.
+    Intended for local providers; remote ones are better served by a
+    GeocodePipeline, which caches and rate-limits.
 
     Args:
-        args (obj): Arguments object -> address, zip, units, output.
+        queries (list(str, int)): Addresses or zip codes.
+        provider (obj, optional): GeocoderProvider instance.  Defaults to
+            the one set with set_geocode_provider.
     Returns:
-        {
-            is_valid: (bool),
-            query: (str/int or None)
-        }
+        List of latitudes and longitudes (lists of floats or None), in the
+        same order as queries.
 
     """
 
-    is_valid = True
-    query = None
-    if args.address is not None:
-        if not isinstance(args.address, str):
-            print('--address must be a string.')
-            is_valid = False
-        query = args.address
-    elif args.zip is not None:
-        if not (isinstance(args.zip, str) or isinstance(args.zip, int)):
-            print('--zip must be a string or an integer.')
-            is_valid = False
-        query = args.zip
-    else:
-        print('--address or --zip must be specified.')
-        is_valid = False
-    if args.units is not None:
-        if args.units not in UNITS:
-            print('--units must be one of the following: {}'.format(UNITS))
-            is_valid = False
-    if args.output is not None:
-        if args.output not in OUTPUT:
-            print ('--output must be one of the following: {}'.format(OUTPUT))
-            is_valid = False
-    return {'is_valid': is_valid, 'query': query}
+    if provider is None:
+        provider = geocode_provider
+    lat_lngs = [zip_centroid(query) for query in queries]
+    missing = [i for i, lat_lng in enumerate(lat_lngs) if lat_lng is None]
+    if len(missing):
+        found = provider.geocode_batch([queries[i] for i in missing])
+        for i, lat_lng in zip(missing, found):
+            lat_lngs[i] = lat_lng
+    return lat_lngs
 
 
 def format_distance(distance, precision=DISTANCE_PRECISION):
@@ -142,16 +262,19 @@ def format_distance(distance, precision=DISTANCE_PRECISION):
 
     """
 
-    d = Decimal(distance)
-    prec = '0.' + ''.join(
-        ['0' if x < (precision - 1) else '1' for x in range(precision)]
-    )
-    return Decimal(d.quantize(Decimal(prec), rounding=ROUND_HALF_UP))
+    quantizer = _quantizers.get(precision)
+    if quantizer is None:
+        quantizer = _quantizers[precision] = Decimal(1).scaleb(-precision)
+    return Decimal(distance).quantize(quantizer, rounding=ROUND_HALF_UP)
 
 
 def format_result(result, distance, units, output):
     """Formats nearest store and corresponding distance into specified output.
 
+    The store is copied before its Distance field is set, so the store
+    passed in is left as it was.  To format many results, see
+    storelocator.formatter.ResultFormatter.
+
     Args:
         result (dict or None): Result of nearest store.
         distance (float or None): Distance to nearest store.
@@ -183,6 +306,7 @@ def format_result(result, distance, units, output):
         if result is None or distance is None:
             print('Unable to locate closest store.')
             return {}
+        result = dict(result)
         result[STORE_FIELDS['DISTANCE']] = '{} {}'.format(
             format_distance(distance), units
         )
@@ -190,7 +314,12 @@ def format_result(result, distance, units, output):
     return formatted_result
 
 
-def calculate_distance(lat_lng_a, lat_lng_b, units=DEFAULT_UNITS):
+def calculate_distance(
+        lat_lng_a,
+        lat_lng_b,
+        units=DEFAULT_UNITS,
+        model=DISTANCE_MODEL
+        ):
     """Calculates distance in (mi or km) between two coords.
 
     Based on https://gist.github.com/rochacbruno/2883505
@@ -199,6 +328,8 @@ def calculate_distance(lat_lng_a, lat_lng_b, units=DEFAULT_UNITS):
         lat_lng_a (list(float)): Latitude and longitude of point A.
         lat_lng_b (list(float)): Latitude and longitude of point B.
         units (str, optional): Distance metric used for calculation (mi or km).
+        model (str, optional): Distance model (haversine, vincenty or
+            karney, see distance_function).
     Returns:
         Distance (float) in provided units (mi or km).
 
@@ -206,6 +337,10 @@ def calculate_distance(lat_lng_a, lat_lng_b, units=DEFAULT_UNITS):
 
     lat_a, lng_a = lat_lng_a
     lat_b, lng_b = lat_lng_b
+    if model != 'haversine':
+        return float(
+            distance_function(model)(lat_a, lng_a, lat_b, lng_b, units)
+        )
     lat_diff = math.radians(lat_b - lat_a)
     lng_diff = math.radians(lng_b - lng_a)
     a = (
@@ -220,33 +355,363 @@ def calculate_distance(lat_lng_a, lat_lng_b, units=DEFAULT_UNITS):
     return distance
 
 
-def find_nearest_store(lat_lng, stores, units):
+def haversine_distances(lats_a, lngs_a, lats_b, lngs_b, units=DEFAULT_UNITS):
+    """Calculates distances in (mi or km) between arrays of coords.
+
+    Vectorized counterpart of calculate_distance.  Inputs are broadcast
+    against each other, so passing targets shaped (M, 1) and stores shaped
+    (N,) yields an (M, N) matrix of distances.
+
+    Args:
+        lats_a (array(float)): Latitudes of points A.
+        lngs_a (array(float)): Longitudes of points A.
+        lats_b (array(float)): Latitudes of points B.
+        lngs_b (array(float)): Longitudes of points B.
+        units (str, optional): Distance metric used for calculation (mi or km).
+    Returns:
+        Array of distances (float) in provided units (mi or km).
+
+    """
+
+    lats_a = numpy.asarray(lats_a, dtype=numpy.float64)
+    lngs_a = numpy.asarray(lngs_a, dtype=numpy.float64)
+    lats_b = numpy.asarray(lats_b, dtype=numpy.float64)
+    lngs_b = numpy.asarray(lngs_b, dtype=numpy.float64)
+    lat_diff = numpy.radians(lats_b - lats_a)
+    lng_diff = numpy.radians(lngs_b - lngs_a)
+    a = (
+        numpy.sin(lat_diff / 2) * numpy.sin(lat_diff / 2) +
+        numpy.cos(numpy.radians(lats_a)) * numpy.cos(numpy.radians(lats_b)) *
+        numpy.sin(lng_diff / 2) * numpy.sin(lng_diff / 2)
+        )
+    c = 2 * numpy.arctan2(numpy.sqrt(a), numpy.sqrt(1 - a))
+    distances = DISTANCE_RADIUS * c
+    if units == 'mi':
+        return distances * KILOMETERS_TO_MILES
+    return distances
+
+
+def distance_function(model=DISTANCE_MODEL):
+    """Returns the vectorized distance calculation of a distance model.
+
+    haversine measures great circles on a sphere of DISTANCE_RADIUS, while
+    vincenty and karney (which needs the optional geographiclib package)
+    measure geodesics on the WGS84 ellipsoid that ECEF coordinates are
+    computed on.  Every function takes the arguments of
+    haversine_distances.
+
+    Args:
+        model (str, optional): Distance model (haversine, vincenty or
+            karney).
+    Returns:
+        Distance function (callable).
+    Raises:
+        ValueError: If model is not a known distance model.
+
+    """
+
+    if model == 'haversine':
+        return haversine_distances
+    if model == 'vincenty':
+        from storelocator.geodesic import vincenty_distances
+        return vincenty_distances
+    if model == 'karney':
+        from storelocator.geodesic import karney_distances
+        return karney_distances
+    raise ValueError(
+        'distance model must be one of the following: {}'.format(
+            DISTANCE_MODELS
+        )
+    )
+
+
+def haversine_bound(distances, model=DISTANCE_MODEL):
+    """Widens haversine distances to cover a distance model.
+
+    Ellipsoidal distances are within SPHERICAL_ERROR of haversine distances
+    (a relative error of at most about 0.56%), so any store closer under
+    model than a store at haversine distance d is within
+    d * (1 + SPHERICAL_ERROR) / (1 - SPHERICAL_ERROR) by haversine
+    distance.  Searches bound their ball queries with this, and rank only
+    the stores that can still make the cut with model.
+
+    Args:
+        distances (float or array(float)): Haversine distances.
+        model (str, optional): Distance model stores are ranked by.
+    Returns:
+        Haversine distances (float or array(float)) covering them under
+        model.
+
+    """
+
+    if model == 'haversine':
+        return distances
+    return distances * (1 + SPHERICAL_ERROR) / (1 - SPHERICAL_ERROR)
+
+
+def in_bbox(lats, lngs, bbox):
+    """Tests which coords lie in a latitude/longitude bounding box.
+
+    Args:
+        lats (array(float)): Latitudes.
+        lngs (array(float)): Longitudes.
+        bbox (list(float)): Minimum latitude, minimum longitude, maximum
+            latitude and maximum longitude.  A minimum longitude greater
+            than the maximum wraps across the antimeridian.
+    Returns:
+        Array (bool) that is True for coords in the box, edges included.
+
+    """
+
+    min_lat, min_lng, max_lat, max_lng = bbox
+    lats = numpy.asarray(lats, dtype=numpy.float64)
+    lngs = numpy.asarray(lngs, dtype=numpy.float64)
+    return (
+        (lats >= min_lat) & (lats <= max_lat) &
+        ((lngs - min_lng) % 360 <= _bbox_width(bbox))
+    )
+
+
+def bbox_circle(bbox):
+    """Finds a circle enclosing a latitude/longitude bounding box.
+
+    The center is the middle of the box.  For boxes up to 180 degrees wide
+    the corners are the points farthest from it, so the radius is the
+    distance to the farthest corner; wider boxes are not bounded.
+
+    Args:
+        bbox (list(float)): Minimum latitude, minimum longitude, maximum
+            latitude and maximum longitude.
+    Returns:
+        Center (list of floats) and radius (float, km, or None when the
+        box is too wide to bound).
+
+    """
+
+    min_lat, min_lng, max_lat, max_lng = bbox
+    width = _bbox_width(bbox)
+    lng = min_lng + width / 2
+    center = [(min_lat + max_lat) / 2, lng - 360 if lng > 180 else lng]
+    if width > 180:
+        return center, None
+    radius = float(numpy.max(haversine_distances(
+        center[0],
+        center[1],
+        [min_lat, min_lat, max_lat, max_lat],
+        [min_lng, max_lng, min_lng, max_lng],
+        'km'
+    )))
+    return center, radius
+
+
+def _bbox_width(bbox):
+    """Returns the width of a bounding box in degrees of longitude.
+
+    """
+
+    width = bbox[3] - bbox[1]
+    if width < 0:
+        width += 360
+    return width
+
+
+def polygon_bbox(polygon):
+    """Finds the bounding box of a polygon.
+
+    Args:
+        polygon (list(list(float))): Latitudes and longitudes of the
+            vertices.
+    Returns:
+        Minimum latitude, minimum longitude, maximum latitude and maximum
+        longitude (list of floats).
+
+    """
+
+    vertices = numpy.asarray(polygon, dtype=numpy.float64).reshape(-1, 2)
+    return (
+        numpy.min(vertices, axis=0).tolist() +
+        numpy.max(vertices, axis=0).tolist()
+    )
+
+
+def points_in_polygon(lats, lngs, polygon):
+    """Tests which coords lie in a polygon by ray casting.
+
+    The polygon is treated as planar in latitude and longitude, which
+    suits regions such as delivery zones; it must not cross the
+    antimeridian.  Each edge is tested against every coord at once.
+
+    Args:
+        lats (array(float)): Latitudes.
+        lngs (array(float)): Longitudes.
+        polygon (list(list(float))): Latitudes and longitudes of the
+            vertices, in order.  The last vertex connects to the first.
+    Returns:
+        Array (bool) that is True for coords inside the polygon.
+
+    """
+
+    lats = numpy.asarray(lats, dtype=numpy.float64)
+    lngs = numpy.asarray(lngs, dtype=numpy.float64)
+    vertices = numpy.asarray(polygon, dtype=numpy.float64).reshape(-1, 2)
+    inside = numpy.zeros(lats.shape, dtype=bool)
+    for (lat_a, lng_a), (lat_b, lng_b) in zip(
+            vertices.tolist(), numpy.roll(vertices, -1, axis=0).tolist()):
+        if lat_a == lat_b:
+            continue
+        crosses = (lat_a > lats) != (lat_b > lats)
+        lng_cross = lng_a + (lats - lat_a) * (lng_b - lng_a) / (lat_b - lat_a)
+        inside ^= crosses & (lngs < lng_cross)
+    return inside
+
+
+def store_coords(stores):
+    """Collects latitudes and longitudes of a list of stores into arrays.
+
+    StoreTable and StoreRows already hold their coords as arrays, which are
+    returned as-is.
+
+    Args:
+        stores (list(dict), StoreTable or StoreRows): Stores.
+    Returns:
+        Latitudes and longitudes (arrays of float).
+
+    """
+
+    if hasattr(stores, 'lats') and hasattr(stores, 'lngs'):
+        return stores.lats, stores.lngs
+    lats = numpy.array(
+        [store[STORE_FIELDS['LATITUDE']] for store in stores],
+        dtype=numpy.float64
+    )
+    lngs = numpy.array(
+        [store[STORE_FIELDS['LONGITUDE']] for store in stores],
+        dtype=numpy.float64
+    )
+    return lats, lngs
+
+
+def find_nearest_store(lat_lng, stores, units, model=DISTANCE_MODEL):
     """Finds store from list of stores that is closest to a given set of coords.
 
+    Distances to all stores are calculated in one vectorized pass.  The
+    distance reported for the winning store is recalculated with
+    calculate_distance so that it is identical to the scalar result.  With
+    an ellipsoidal model, haversine distances shortlist the stores that
+    can be nearest (see haversine_bound) and only those are measured with
+    model.
+
     Args:
         lat_lng (list(float)): Latitude and longitude being compared to.
-        stores (list(dict)): List of stores to search against.
+        stores (list(dict), StoreTable or StoreRows): Stores to search
+            against.
         units (str): Distance metric used for comparison.
+        model (str, optional): Distance model (haversine, vincenty or
+            karney).
     Returns:
         Nearest store (dict or None) and corresponding distance (float or None).
 
     """
     result = None
     min_distance = None
-    if lat_lng is not None and stores is not None:
-        for store in stores:
-            store_lat_lng = [
-                float(
-                    store[STORE_FIELDS['LATITUDE']]
-                ),
-                float(store[STORE_FIELDS['LONGITUDE']])
-            ]
-            store_distance = calculate_distance(lat_lng, store_lat_lng, units)
-            if min_distance is None:
-                min_distance = store_distance
-                result = store
-            else:
-                if store_distance < min_distance:
-                    min_distance = store_distance
-                    result = store
+    if lat_lng is not None and stores is not None and len(stores):
+        lats, lngs = store_coords(stores)
+        distances = haversine_distances(
+            lat_lng[0], lat_lng[1], lats, lngs, units
+        )
+        nearest = int(numpy.argmin(distances))
+        if model != 'haversine':
+            nearest = _nearest_by_model(
+                lat_lng, lats, lngs, distances, units, model
+            )
+        result = stores[nearest]
+        min_distance = calculate_distance(
+            lat_lng, [lats[nearest], lngs[nearest]], units, model
+        )
     return result, min_distance
+
+
+def find_nearest_stores(lat_lngs, stores, units, model=DISTANCE_MODEL):
+    """Finds the store closest to each of many sets of coords.
+
+    Every set of coords is compared against every store, so this suits
+    modest candidate lists; large catalogues should go through
+    find_nearest_stores_batch instead.
+
+    Args:
+        lat_lngs (list(list(float) or None)): Latitudes and longitudes being
+            compared to.
+        stores (list(dict), StoreTable or StoreRows): Stores to search
+            against.
+        units (str): Distance metric used for comparison.
+        model (str, optional): Distance model (haversine, vincenty or
+            karney), see find_nearest_store.
+    Returns:
+        List of nearest store (dict or None) and corresponding distance
+        (float or None) tuples, in the same order as lat_lngs.
+
+    """
+
+    results = [(None, None)] * len(lat_lngs)
+    located = [i for i, lat_lng in enumerate(lat_lngs) if lat_lng is not None]
+    if stores is None or not len(stores) or not len(located):
+        return results
+    lats, lngs = store_coords(stores)
+    targets = numpy.array([lat_lngs[i] for i in located], dtype=numpy.float64)
+    distances = haversine_distances(
+        targets[:, 0:1], targets[:, 1:2], lats, lngs, units
+    )
+    for i, row, nearest in zip(
+            located, distances, numpy.argmin(distances, axis=1)):
+        if model != 'haversine':
+            nearest = _nearest_by_model(
+                lat_lngs[i], lats, lngs, row, units, model
+            )
+        results[i] = (
+            stores[nearest],
+            calculate_distance(
+                lat_lngs[i], [lats[nearest], lngs[nearest]], units, model
+            )
+        )
+    return results
+
+
+def find_nearest_stores_batch(sp, lat_lngs, units, model=DISTANCE_MODEL):
+    """Finds the nearest store to each of many sets of coords in one pass.
+
+    All coords are searched together with StoresParser.nearest_many, which
+    costs two vectorized tree queries however many coords there are.
+
+    Args:
+        sp (obj): StoresParser instance.
+        lat_lngs (list(list(float) or None)): Latitudes and longitudes being
+            compared to.  Entries that failed to geocode may be None.
+        units (str): Distance metric used for comparison.
+        model (str, optional): Distance model (haversine, vincenty or
+            karney).
+    Returns:
+        List of nearest store (dict or None) and corresponding distance
+        (float or None) tuples, in the same order as lat_lngs.
+
+    """
+
+    return [
+        nearest[0] if len(nearest) else (None, None)
+        for nearest in sp.nearest_many(lat_lngs, 1, units, model=model)
+    ]
+
+
+def _nearest_by_model(lat_lng, lats, lngs, distances, units, model):
+    """Finds the index of the store closest under model.
+
+    Only the stores whose haversine distance can beat the best store's
+    bound are measured with model.
+
+    """
+
+    cut = haversine_bound(numpy.min(distances), model)
+    shortlist = numpy.flatnonzero(distances <= cut)
+    exact = distance_function(model)(
+        lat_lng[0], lat_lng[1], lats[shortlist], lngs[shortlist], units
+    )
+    return int(shortlist[numpy.argmin(exact)])
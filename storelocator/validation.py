@@ -0,0 +1,327 @@
+from storelocator.constants import (
+    BULK_OUTPUT,
+    CATEGORICAL_FIELDS,
+    DISTANCE_MODELS,
+    OUTPUT,
+    OUTPUT_FIELDS,
+    UNITS
+)
+import csv
+import importlib.util
+import os
+
+
+def validate_args(args):
+    """Validates arguments and constructs query from them.
+
+    Args:
+        args (obj): Arguments object -> address, zip, units, output and,
+            optionally, input, count, serve, radius, bbox, polygon, limit,
+            offset, include, exclude, distance_model, fields and timings.
+    Returns:
+        {
+            is_valid: (bool),
+            query: (str/int or None),
+            bbox: (list(float) or None),
+            polygon: (list(list(float)) or None),
+            include: (dict or None),
+            exclude: (dict or None),
+            fields: (list(str) or None)
+        }
+
+    """
+
+    is_valid = True
+    query = None
+    bbox = None
+    polygon = None
+    fields = None
+    filters = {'include': None, 'exclude': None}
+    regions = [
+        name for name in ['radius', 'bbox', 'polygon']
+        if getattr(args, name, None) is not None
+    ]
+    if getattr(args, 'serve', False):
+        pass
+    elif getattr(args, 'input', None) is not None:
+        if not isinstance(args.input, str):
+            print('--input must be a string.')
+            is_valid = False
+    elif args.address is not None:
+        if not isinstance(args.address, str):
+            print('--address must be a string.')
+            is_valid = False
+        query = args.address
+    elif args.zip is not None:
+        if not (isinstance(args.zip, str) or isinstance(args.zip, int)):
+            print('--zip must be a string or an integer.')
+            is_valid = False
+        query = args.zip
+    elif len(regions) and 'radius' not in regions:
+        pass
+    else:
+        print('--address, --zip, --input or --serve must be specified.')
+        is_valid = False
+    if len(regions) > 1:
+        print('Only one of --radius, --bbox or --polygon may be specified.')
+        is_valid = False
+    elif len(regions) and (
+            getattr(args, 'serve', False) or
+            getattr(args, 'input', None) is not None):
+        print('--{} cannot be combined with --input or --serve.'.format(
+            regions[0]
+        ))
+        is_valid = False
+    if getattr(args, 'radius', None) is not None:
+        if not isinstance(args.radius, (int, float)) or args.radius <= 0:
+            print('--radius must be a positive number.')
+            is_valid = False
+    if getattr(args, 'bbox', None) is not None:
+        try:
+            bbox = parse_bbox(args.bbox)
+        except ValueError as e:
+            print('--{}'.format(e))
+            is_valid = False
+    if getattr(args, 'polygon', None) is not None:
+        try:
+            polygon = parse_polygon(args.polygon)
+        except ValueError as e:
+            print('--{}'.format(e))
+            is_valid = False
+    for name in filters:
+        if getattr(args, name, None) is not None:
+            try:
+                filters[name] = parse_filters(getattr(args, name))
+            except ValueError as e:
+                print('--{} {}'.format(name, e))
+                is_valid = False
+    if (filters['include'] or filters['exclude']) and len(regions):
+        print('--include and --exclude cannot be combined with --{}.'.format(
+            regions[0]
+        ))
+        is_valid = False
+    if getattr(args, 'timings', False) and getattr(args, 'serve', False):
+        print('--timings cannot be combined with --serve; '
+              'GET /nearest takes timings=1 instead.')
+        is_valid = False
+    if getattr(args, 'limit', None) is not None:
+        if not isinstance(args.limit, int) or args.limit < 1:
+            print('--limit must be a positive integer.')
+            is_valid = False
+    if getattr(args, 'offset', None) is not None:
+        if not isinstance(args.offset, int) or args.offset < 0:
+            print('--offset must be a non-negative integer.')
+            is_valid = False
+    if args.units is not None:
+        if args.units not in UNITS:
+            print('--units must be one of the following: {}'.format(UNITS))
+            is_valid = False
+    batch = getattr(args, 'input', None) is not None and not len(regions)
+    if args.output is not None:
+        if args.output in BULK_OUTPUT and not batch:
+            print('--output={} needs --input.'.format(args.output))
+            is_valid = False
+        elif args.output not in OUTPUT + BULK_OUTPUT:
+            print('--output must be one of the following: {}'.format(
+                OUTPUT + BULK_OUTPUT
+            ))
+            is_valid = False
+    if getattr(args, 'fields', None) is not None:
+        try:
+            fields = parse_fields(args.fields)
+        except ValueError as e:
+            print('--fields {}'.format(e))
+            is_valid = False
+        if not batch or args.output in [None, 'text']:
+            print('--fields needs --input and json, csv or binary output.')
+            is_valid = False
+    if getattr(args, 'count', None) is not None:
+        if not isinstance(args.count, int) or args.count < 1:
+            print('--count must be a positive integer.')
+            is_valid = False
+    if getattr(args, 'processes', None) is not None:
+        if not isinstance(args.processes, int) or args.processes < 0:
+            print('--processes must be a non-negative integer.')
+            is_valid = False
+    if getattr(args, 'workers', None) is not None:
+        if not isinstance(args.workers, int) or args.workers < 1:
+            print('--workers must be a positive integer.')
+            is_valid = False
+    if getattr(args, 'concurrency', None) is not None:
+        if not isinstance(args.concurrency, int) or args.concurrency < 1:
+            print('--concurrency must be a positive integer.')
+            is_valid = False
+    if getattr(args, 'rate', None) is not None:
+        if (not isinstance(args.rate, (int, float)) or
+                not 0 < args.rate < float('inf')):
+            print('--rate must be a positive number.')
+            is_valid = False
+    if getattr(args, 'distance_model', None) is not None:
+        try:
+            parse_distance_model(args.distance_model)
+        except ValueError as e:
+            print('--distance-model {}'.format(e))
+            is_valid = False
+        if args.distance_model != 'haversine' and len(regions):
+            print('--distance-model cannot be combined with --{}.'.format(
+                regions[0]
+            ))
+            is_valid = False
+    return {
+        'is_valid': is_valid,
+        'query': query,
+        'bbox': bbox,
+        'polygon': polygon,
+        'include': filters['include'],
+        'exclude': filters['exclude'],
+        'fields': fields
+    }
+
+
+def parse_bbox(text):
+    """Parses a bounding box written as min_lat,min_lng,max_lat,max_lng.
+
+    Args:
+        text (str): Comma-separated bounding box.
+    Returns:
+        Minimum latitude, minimum longitude, maximum latitude and maximum
+        longitude (list of floats).
+    Raises:
+        ValueError: If the box is malformed or out of range.
+
+    """
+
+    try:
+        bbox = [float(value) for value in text.split(',')]
+    except ValueError:
+        bbox = []
+    if len(bbox) != 4:
+        raise ValueError(
+            'bbox must be four numbers: min_lat,min_lng,max_lat,max_lng.'
+        )
+    if not (-90 <= bbox[0] <= bbox[2] <= 90):
+        raise ValueError('bbox latitudes must be ordered and within 90.')
+    if not (-180 <= bbox[1] <= 180 and -180 <= bbox[3] <= 180):
+        raise ValueError('bbox longitudes must be within 180.')
+    return bbox
+
+
+def parse_polygon(text):
+    """Parses a polygon written as lat,lng;lat,lng;... or a CSV of vertices.
+
+    Args:
+        text (str): Semicolon-separated vertices, or the path to a CSV with
+            one lat,lng vertex per row (rows that are not two numbers, such
+            as a header, are skipped).
+    Returns:
+        Latitudes and longitudes (lists of floats) of the vertices.
+    Raises:
+        ValueError: If the polygon has fewer than 3 vertices or a vertex is
+            out of range.
+
+    """
+
+    if os.path.isfile(text):
+        with open(text) as f:
+            rows = [row for row in csv.reader(f)]
+        vertices = []
+        for row in rows:
+            try:
+                vertices.append([float(row[0]), float(row[1])])
+            except (IndexError, ValueError):
+                continue
+    else:
+        try:
+            vertices = [
+                [float(value) for value in vertex.split(',')]
+                for vertex in text.split(';') if vertex.strip()
+            ]
+        except ValueError:
+            raise ValueError('polygon must be lat,lng pairs separated by ;.')
+    if any(len(vertex) != 2 for vertex in vertices):
+        raise ValueError('polygon must be lat,lng pairs separated by ;.')
+    if len(vertices) < 3:
+        raise ValueError('polygon must have at least 3 vertices.')
+    for lat, lng in vertices:
+        if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+            raise ValueError('polygon vertices must be valid coordinates.')
+    return vertices
+
+
+def parse_filters(pairs):
+    """Parses store filters written as field=value.
+
+    Args:
+        pairs (list(str)): Filters, each naming a categorical field and one
+            value of it.  Filters on the same field are alternatives.
+    Returns:
+        Values (list(str)) of each field name (dict).
+    Raises:
+        ValueError: If a filter is malformed or its field is not
+            categorical.
+
+    """
+
+    filters = {}
+    for pair in pairs:
+        fieldname, sep, value = pair.partition('=')
+        fieldname = fieldname.strip()
+        if not sep or not fieldname:
+            raise ValueError('must be written as field=value.')
+        if fieldname not in CATEGORICAL_FIELDS:
+            raise ValueError(
+                'field must be one of the following: {}'.format(
+                    CATEGORICAL_FIELDS
+                )
+            )
+        filters.setdefault(fieldname, []).append(value.strip())
+    return filters
+
+
+def parse_fields(text):
+    """Parses comma-separated store fields to output.
+
+    Args:
+        text (str): Field names, e.g. "Store Name,City,State".
+    Returns:
+        Field names (list(str)), in the order given.
+    Raises:
+        ValueError: If a field is not a store field or is repeated.
+
+    """
+
+    fields = [fieldname.strip() for fieldname in text.split(',')]
+    for fieldname in fields:
+        if fieldname not in OUTPUT_FIELDS:
+            raise ValueError(
+                'must be among the following: {}'.format(OUTPUT_FIELDS)
+            )
+    if len(set(fields)) != len(fields):
+        raise ValueError('must not repeat a field.')
+    return fields
+
+
+def parse_distance_model(model):
+    """Checks that a distance model is known and can be used.
+
+    Args:
+        model (str): Distance model (haversine, vincenty or karney).
+    Returns:
+        The distance model (str).
+    Raises:
+        ValueError: If the model is unknown, or is karney and the optional
+            geographiclib package is not installed.
+
+    """
+
+    if model not in DISTANCE_MODELS:
+        raise ValueError(
+            'must be one of the following: {}'.format(
+                DISTANCE_MODELS
+            )
+        )
+    if model == 'karney' and importlib.util.find_spec('geographiclib') is None:
+        raise ValueError(
+            'karney needs the geographiclib package.'
+        )
+    return model
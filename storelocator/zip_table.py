@@ -0,0 +1,204 @@
+import codecs
+from storelocator.constants import (
+    DEFAULT_ENCODING,
+    INDEX_SUFFIX
+)
+import csv
+from storelocator.index_file import (
+    IndexFormatError,
+    read_index,
+    source_matches,
+    source_meta,
+    write_index
+)
+import numpy
+import os
+
+
+ZIP_COLUMNS = ['zip', 'zip code', 'zcta', 'zcta5', 'geoid']
+LATITUDE_COLUMNS = ['lat', 'latitude', 'intptlat']
+LONGITUDE_COLUMNS = ['lng', 'lon', 'long', 'longitude', 'intptlong']
+
+
+def column_index(fieldnames, names, file_path):
+    """Finds the first of several accepted column names in a header.
+
+    Args:
+        fieldnames (list(str)): Lowercase column names of the file.
+        names (list(str)): Accepted names, in order of preference.
+        file_path (str): Path of the file, for the error message.
+    Returns:
+        Index (int) of the column.
+    Raises:
+        ValueError: If none of the names is a column.
+
+    """
+
+    for name in names:
+        if name in fieldnames:
+            return fieldnames.index(name)
+    raise ValueError('{} has no {} column.'.format(file_path, names[0]))
+
+
+def parse_zip(query):
+    """Extracts the 5-digit zip code from a zip code or ZIP+4 query.
+
+    Args:
+        query (str, int): Query that may be a zip code.
+    Returns:
+        Zip code (int) or None if query is not a zip code.
+
+    """
+
+    if isinstance(query, int):
+        return query if 0 <= query <= 99999 else None
+    query = str(query).strip()
+    if len(query) == 10 and query[5] == '-' and query[6:].isdigit():
+        query = query[:5]
+    if len(query) == 5 and query.isdigit():
+        return int(query)
+    return None
+
+
+class ZipTable(object):
+    """ZipTable looks up the centroid of a zip code offline.
+
+    Zip codes are kept as a sorted uint32 array alongside float64 latitude
+    and longitude arrays, and found with a binary search.
+
+    """
+
+    def __init__(self, zips, lats, lngs):
+        """Initialization creates a ZipTable from sorted arrays.
+
+        Args:
+            zips (array(int)): Sorted zip codes.
+            lats (array(float)): Latitude of each zip code's centroid.
+            lngs (array(float)): Longitude of each zip code's centroid.
+
+        """
+
+        self.zips = zips
+        self.lats = lats
+        self.lngs = lngs
+
+    @staticmethod
+    def from_csv(file_path, encoding=DEFAULT_ENCODING):
+        """Parses a CSV (or tab-separated file) of zip code centroids.
+
+        The zip code, latitude and longitude columns are found by name, so
+        both zip,lat,lng files and the Census ZCTA gazetteer (GEOID,
+        INTPTLAT, INTPTLONG) can be used.
+
+        Args:
+            file_path (str): Path of the file.
+            encoding (str, optional): Encoding of the file.
+        Returns:
+            ZipTable instance.
+        Raises:
+            ValueError: If a zip code, latitude or longitude column is
+                missing.
+
+        """
+
+        with codecs.open(file_path, 'r', encoding=encoding) as f:
+            header = f.readline()
+            delimiter = '\t' if '\t' in header else ','
+            fieldnames = [
+                name.strip().lower()
+                for name in next(csv.reader([header], delimiter=delimiter))
+            ]
+            columns = [
+                column_index(fieldnames, names, file_path)
+                for names in [ZIP_COLUMNS, LATITUDE_COLUMNS, LONGITUDE_COLUMNS]
+            ]
+            zips, lats, lngs = [], [], []
+            for row in csv.reader(f, delimiter=delimiter):
+                try:
+                    zip_code = parse_zip(row[columns[0]])
+                    lat = float(row[columns[1]])
+                    lng = float(row[columns[2]])
+                except (IndexError, ValueError):
+                    continue
+                if zip_code is not None:
+                    zips.append(zip_code)
+                    lats.append(lat)
+                    lngs.append(lng)
+        zips = numpy.array(zips, dtype=numpy.uint32)
+        order = numpy.argsort(zips, kind='stable')
+        return ZipTable(
+            zips[order],
+            numpy.array(lats, dtype=numpy.float64)[order],
+            numpy.array(lngs, dtype=numpy.float64)[order]
+        )
+
+    @staticmethod
+    def load(file_path):
+        """Opens a file of zip code centroids through its compiled index.
+
+        The sorted arrays are saved next to the file in the same index format
+        as StoresParser, and memory mapped on later loads.  They are rebuilt
+        when the file changes.
+
+        Args:
+            file_path (str): Path of the file.
+        Returns:
+            ZipTable instance.
+
+        """
+
+        index_path = file_path + INDEX_SUFFIX
+        try:
+            arrays, meta = read_index(index_path)
+            if source_matches(file_path, meta.get('source')):
+                return ZipTable(arrays['zips'], arrays['lats'], arrays['lngs'])
+        except (IOError, IndexFormatError, KeyError):
+            pass
+        source = source_meta(file_path)
+        table = ZipTable.from_csv(file_path)
+        try:
+            write_index(
+                index_path,
+                {'zips': table.zips, 'lats': table.lats, 'lngs': table.lngs},
+                {'source': source}
+            )
+        except IOError:
+            pass
+        return table
+
+    def __len__(self):
+        return len(self.zips)
+
+    def lookup(self, query):
+        """Looks up the centroid of a zip code.
+
+        Args:
+            query (str, int): Zip code or ZIP+4.
+        Returns:
+            Latitude and longitude (list of floats) or None if query is not
+            a zip code in the table.
+
+        """
+
+        zip_code = parse_zip(query)
+        if zip_code is None:
+            return None
+        i = int(numpy.searchsorted(self.zips, zip_code))
+        if i < len(self.zips) and self.zips[i] == zip_code:
+            return [float(self.lats[i]), float(self.lngs[i])]
+        return None
+
+
+def get_zip_table(file_path):
+    """Loads a ZipTable if its file exists.
+
+    Args:
+        file_path (str or None): Path of a file of zip code centroids.
+    Returns:
+        ZipTable instance or None.
+
+    """
+
+    if file_path is None or not os.path.exists(file_path):
+        return None
+    return ZipTable.load(file_path)
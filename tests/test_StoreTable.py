@@ -0,0 +1,148 @@
+import codecs
+import csv
+from storelocator.constants import STORES_CSV
+from storelocator.csv_parser import StoresParser
+import numpy
+from storelocator.store_table import (
+    CategoricalColumn,
+    StoreFilter,
+    StoreRows,
+    StoreTable
+)
+import unittest
+
+
+class TestStoreTable(unittest.TestCase):
+    """Test StoreTable functionality.
+
+    """
+
+    def setUp(self):
+        """Initialize StoreTable from store-locations.csv and raw CSV rows.
+
+        """
+
+        self.table = StoresParser(STORES_CSV).get_stores()
+        with codecs.open(STORES_CSV, 'r', encoding='utf-8-sig') as f:
+            self.records = list(csv.DictReader(f))
+
+    def test_records_match_csv(self):
+        """Test that every row of the table matches the CSV row it came from.
+
+        """
+
+        self.assertEqual(len(self.table), len(self.records))
+        self.assertEqual(list(self.table), self.records)
+
+    def test_coords(self):
+        """Test that lats and lngs hold the parsed latitudes and longitudes.
+
+        """
+
+        self.assertEqual(self.table.lats[0], float(self.records[0]['Latitude']))
+        self.assertEqual(
+            self.table.lngs[-1],
+            float(self.records[-1]['Longitude'])
+        )
+
+    def test_categorical_columns(self):
+        """Test that store name, city, state and county are dictionary-encoded.
+
+        """
+
+        for fieldname in ['Store Name', 'City', 'State', 'County']:
+            self.assertIsInstance(
+                self.table.columns[fieldname],
+                CategoricalColumn
+            )
+        self.assertEqual(len(self.table.columns['State'].values), 48)
+
+    def test_negative_index(self):
+        """Test that negative indices count back from the last store.
+
+        """
+
+        self.assertEqual(self.table[-1], self.records[-1])
+
+    def test_index_out_of_range(self):
+        """Test that indexing past the last store raises IndexError.
+
+        """
+
+        with self.assertRaises(IndexError):
+            self.table[len(self.records)]
+
+    def test_take(self):
+        """Test that take returns a StoreRows view of the selected rows.
+
+        """
+
+        rows = self.table.take([5, 2])
+        self.assertIsInstance(rows, StoreRows)
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(list(rows), [self.records[5], self.records[2]])
+        self.assertEqual(list(rows.lats), [
+            float(self.records[5]['Latitude']),
+            float(self.records[2]['Latitude'])
+        ])
+
+    def test_from_records(self):
+        """Test that from_records builds a table holding the given stores.
+
+        """
+
+        table = StoreTable.from_records(self.records[:3])
+        self.assertEqual(list(table), self.records[:3])
+
+    def test_row_index(self):
+        """Test that a categorical column's row index lists each value's rows.
+
+        """
+
+        column = self.table.columns['State']
+        order, starts = column.row_index()
+        for code, value in enumerate(column.values):
+            self.assertEqual(
+                order[starts[code]:starts[code + 1]].tolist(),
+                [
+                    row for row, record in enumerate(self.records)
+                    if record['State'] == value
+                ]
+            )
+        arrays, meta = self.table.to_arrays()
+        loaded = StoreTable.from_arrays(arrays, meta).columns['State']
+        self.assertIs(loaded.order, order)
+        self.assertIs(loaded.starts, starts)
+
+    def test_store_filter(self):
+        """Test that StoreFilter matches the same rows as the records.
+
+        """
+
+        store_filter = StoreFilter(include={'State': 'XX'})
+        self.assertEqual(store_filter.rows(self.table).tolist(), [])
+        self.assertEqual(store_filter.estimate(self.table), 0)
+        store_filter = StoreFilter(
+            include={'State': ['MN', 'WI']},
+            exclude={'County': 'Hennepin County'}
+        )
+        expected = [
+            row for row, record in enumerate(self.records)
+            if record['State'] in ['MN', 'WI'] and
+            record['County'] != 'Hennepin County'
+        ]
+        self.assertEqual(store_filter.rows(self.table).tolist(), expected)
+        self.assertGreaterEqual(
+            store_filter.estimate(self.table), len(expected)
+        )
+        rows = numpy.arange(len(self.table))
+        self.assertEqual(
+            numpy.flatnonzero(store_filter.test(self.table, rows)).tolist(),
+            expected
+        )
+        self.assertFalse(StoreFilter())
+        with self.assertRaises(ValueError):
+            StoreFilter(include={'Zip Code': '55401'}).rows(self.table)
+
+if __name__ == '__main__':
+    unittest.main()
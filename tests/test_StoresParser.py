@@ -1,6 +1,25 @@
 from storelocator.csv_parser import StoresParser
-from storelocator.constants  import STORES_CSV
+from storelocator.geodesic import vincenty_distances
+from storelocator.constants  import (
+    FILTER_BRUTE_MAX,
+    INC_RADIUS,
+    INITIAL_RADIUS,
+    STORES_CSV
+)
+import numpy
+import random
 import unittest
+from unittest import mock
+from storelocator.util import (
+    calculate_distance,
+    filter_stores,
+    find_nearest_store,
+    find_nearest_stores_batch,
+    geodetic2ecef,
+    haversine_distances,
+    in_bbox,
+    points_in_polygon
+)
 
 
 class TestStoresParser(unittest.TestCase):
@@ -59,5 +78,636 @@ class TestStoresParser(unittest.TestCase):
         stores = self.sp.get_stores()
         self.assertEqual(self.sp.stores, stores)
 
+
+class TestStoresParserNearest(unittest.TestCase):
+    """Test nearest and nearest_many.
+
+    """
+
+    def setUp(self):
+        """Initialize StoresParser and random coords across North America.
+
+        """
+
+        self.sp = StoresParser(STORES_CSV)
+        self.sp.get_stores()
+        self.sp.build_tree()
+        rng = random.Random(7)
+        self.lat_lngs = [
+            [rng.uniform(15, 70), rng.uniform(-170, -50)] for _ in range(100)
+        ]
+
+    def brute_force(self, lat_lng, k, units):
+        """Return the k nearest stores by comparing against every store.
+
+        """
+
+        distances = haversine_distances(
+            lat_lng[0],
+            lat_lng[1],
+            self.sp.stores.lats,
+            self.sp.stores.lngs,
+            units
+        )
+        rows = numpy.lexsort((self.sp.stores.ids, distances))[:k]
+        return [
+            (
+                self.sp.stores[int(row)],
+                calculate_distance(
+                    lat_lng,
+                    [self.sp.stores.lats[row], self.sp.stores.lngs[row]],
+                    units
+                )
+            )
+            for row in rows
+        ]
+
+    def test_nearest_matches_brute_force(self):
+        """Test that nearest matches a brute-force search for k of 1 to 5.
+
+        """
+
+        for k in range(1, 6):
+            for lat_lng in self.lat_lngs[:20]:
+                self.assertEqual(
+                    self.sp.nearest(lat_lng, k, 'km'),
+                    self.brute_force(lat_lng, k, 'km')
+                )
+
+    def test_nearest_many_matches_brute_force(self):
+        """Test that nearest_many matches a brute-force search per coords.
+
+        """
+
+        results = self.sp.nearest_many(self.lat_lngs + [None], 3, 'mi')
+        self.assertEqual(results[-1], [])
+        for lat_lng, result in zip(self.lat_lngs, results):
+            self.assertEqual(result, self.brute_force(lat_lng, 3, 'mi'))
+
+    def test_nearest_matches_find_nearest_store(self):
+        """Test that nearest agrees with filter_stores & find_nearest_store.
+
+        """
+
+        for lat_lng in self.lat_lngs[:20]:
+            stores = filter_stores(
+                self.sp,
+                geodetic2ecef(lat_lng[0], lat_lng[1]),
+                INITIAL_RADIUS,
+                INC_RADIUS
+            )
+            self.assertEqual(
+                self.sp.nearest(lat_lng, 1, 'mi')[0],
+                find_nearest_store(lat_lng, stores, 'mi')
+            )
+
+    def test_nearest_k_larger_than_catalogue(self):
+        """Test that nearest returns every store when k exceeds their number.
+
+        """
+
+        self.assertEqual(len(self.sp.nearest(self.lat_lngs[0], 5000)), 1791)
+
+
+class TestStoresParserUpdates(unittest.TestCase):
+    """Test add_store, remove_store, update_store and compact.
+
+    """
+
+    def setUp(self):
+        """Initialize StoresParser with stores and tree populated.
+
+        """
+
+        self.sp = StoresParser(STORES_CSV)
+        self.sp.get_stores()
+        self.sp.build_tree()
+        self.lat_lng = [47.6097, -122.3422]
+        self.store = {
+            'Store Name': 'Pike Place',
+            'Store Location': 'Pike St & 1st Ave',
+            'Address': '1 Pike St',
+            'City': 'Seattle',
+            'State': 'WA',
+            'Zip Code': '98101',
+            'Latitude': '47.6097',
+            'Longitude': '-122.3422',
+            'County': 'King County'
+        }
+
+    def nearest(self, lat_lng):
+        """Return the nearest store found via filter_stores.
+
+        """
+
+        stores = filter_stores(
+            self.sp,
+            geodetic2ecef(lat_lng[0], lat_lng[1]),
+            INITIAL_RADIUS,
+            INC_RADIUS
+        )
+        return find_nearest_store(lat_lng, stores, 'mi')
+
+    def live_stores(self):
+        """Return every store that has not been removed, by brute force.
+
+        """
+
+        stores = [
+            store for row, store in enumerate(self.sp.stores)
+            if row not in self.sp.removed
+        ]
+        return stores + list(self.sp.delta.values())
+
+    def test_add_store(self):
+        """Test that an added store is found before compaction.
+
+        """
+
+        store_id = self.sp.add_store(self.store)
+        self.assertEqual(store_id, 1791)
+        self.assertEqual(self.sp.pending, 1)
+        self.assertEqual(self.sp.get_store(store_id), self.store)
+        self.assertEqual(self.nearest(self.lat_lng)[0], self.store)
+        self.assertEqual(
+            find_nearest_stores_batch(self.sp, [self.lat_lng], 'mi')[0][0],
+            self.store
+        )
+
+    def test_add_store_invalid_coords(self):
+        """Test that add_store raises ValueError for a non-numeric latitude.
+
+        """
+
+        self.store['Latitude'] = 'north'
+        with self.assertRaises(ValueError):
+            self.sp.add_store(self.store)
+
+    def test_remove_store(self):
+        """Test that a removed store is no longer found before compaction.
+
+        """
+
+        nearest, _ = self.nearest(self.lat_lng)
+        store_id = self.sp.stores.ids[
+            list(self.sp.stores).index(nearest)
+        ]
+        self.sp.remove_store(store_id)
+        self.assertNotEqual(self.nearest(self.lat_lng)[0], nearest)
+        self.assertNotEqual(
+            find_nearest_stores_batch(self.sp, [self.lat_lng], 'mi')[0][0],
+            nearest
+        )
+        with self.assertRaises(KeyError):
+            self.sp.get_store(store_id)
+        with self.assertRaises(KeyError):
+            self.sp.remove_store(store_id)
+
+    def test_update_store(self):
+        """Test that a moved store is found at its new location.
+
+        """
+
+        self.sp.update_store(
+            0,
+            {'Latitude': '47.6097', 'Longitude': '-122.3422'}
+        )
+        result, _ = self.nearest(self.lat_lng)
+        self.assertEqual(result['Store Name'], self.sp.stores[0]['Store Name'])
+        self.assertEqual(result['Latitude'], '47.6097')
+
+    def test_batch_matches_brute_force_with_pending_updates(self):
+        """Test that batch results match a brute-force search of live stores.
+
+        """
+
+        self.sp.add_store(self.store)
+        for store_id in range(0, 1791, 7):
+            self.sp.remove_store(store_id)
+        self.sp.update_store(3, {'Latitude': '40.0', 'Longitude': '-100.0'})
+        lat_lngs = [self.lat_lng, [40.1, -100.1], [44.977753, -93.2650108]]
+        results = find_nearest_stores_batch(self.sp, lat_lngs, 'km')
+        live = self.live_stores()
+        for lat_lng, result in zip(lat_lngs, results):
+            self.assertEqual(result, find_nearest_store(lat_lng, live, 'km'))
+
+    def test_compact(self):
+        """Test that compact merges pending updates and keeps results.
+
+        """
+
+        store_id = self.sp.add_store(self.store)
+        self.sp.remove_store(5)
+        self.sp.update_store(3, {'City': 'Elsewhere'})
+        live = sorted(map(sorted, map(dict.items, self.live_stores())))
+        self.sp.compact()
+        self.assertEqual(self.sp.pending, 0)
+        self.assertEqual(len(self.sp.stores), 1791)
+        self.assertEqual(
+            sorted(map(sorted, map(dict.items, self.sp.stores))),
+            live
+        )
+        self.assertEqual(self.sp.get_store(store_id), self.store)
+        self.assertEqual(self.sp.get_store(3)['City'], 'Elsewhere')
+        self.assertEqual(self.nearest(self.lat_lng)[0], self.store)
+
+    def test_compact_threshold(self):
+        """Test that updates past compact_threshold trigger compaction.
+
+        """
+
+        self.sp.compact_threshold = 2
+        self.sp.add_store(self.store)
+        self.sp.add_store(self.store)
+        self.assertEqual(self.sp.pending, 2)
+        self.sp.add_store(self.store)
+        self.assertEqual(self.sp.pending, 0)
+        self.assertEqual(len(self.sp.stores), 1794)
+
+class TestStoresParserRange(unittest.TestCase):
+    """Test within_radius, within_bbox and within_polygon.
+
+    """
+
+    def setUp(self):
+        """Initialize StoresParser with stores and tree populated.
+
+        """
+
+        self.sp = StoresParser(STORES_CSV)
+        self.sp.get_stores()
+        self.sp.build_tree()
+        self.lats = numpy.asarray(self.sp.stores.lats)
+        self.lngs = numpy.asarray(self.sp.stores.lngs)
+        self.ids = numpy.asarray(self.sp.stores.ids)
+
+    def brute_force(self, mask, origin, units):
+        """Return the stores in mask sorted by distance, then id.
+
+        """
+
+        rows = numpy.flatnonzero(mask)
+        distances = haversine_distances(
+            origin[0], origin[1], self.lats[rows], self.lngs[rows], units
+        )
+        return [
+            self.sp.stores[int(row)]
+            for row in rows[numpy.lexsort((self.ids[rows], distances))]
+        ]
+
+    def stores_of(self, found):
+        """Return the stores a range query found.
+
+        """
+
+        return [store for store, _ in found]
+
+    def test_within_radius_matches_brute_force(self):
+        """Test that within_radius finds every store within the radius.
+
+        """
+
+        random.seed(2)
+        for _ in range(20):
+            lat_lng = [random.uniform(25, 49), random.uniform(-124, -67)]
+            radius = random.uniform(1, 300)
+            for units in ['mi', 'km']:
+                found = self.sp.within_radius(lat_lng, radius, units)
+                expected = self.brute_force(
+                    haversine_distances(
+                        lat_lng[0], lat_lng[1], self.lats, self.lngs, units
+                    ) <= radius,
+                    lat_lng,
+                    units
+                )
+                self.assertEqual(self.stores_of(found), expected)
+                for store, distance in found:
+                    self.assertEqual(distance, calculate_distance(
+                        lat_lng,
+                        [float(store['Latitude']), float(store['Longitude'])],
+                        units
+                    ))
+
+    def test_within_bbox_matches_brute_force(self):
+        """Test that within_bbox finds every store in the box.
+
+        """
+
+        random.seed(3)
+        for _ in range(20):
+            lat = random.uniform(25, 45)
+            lng = random.uniform(-124, -75)
+            bbox = [
+                lat, lng,
+                lat + random.uniform(0.1, 5), lng + random.uniform(0.1, 8)
+            ]
+            center = [(bbox[0] + bbox[2]) / 2, (bbox[1] + bbox[3]) / 2]
+            self.assertEqual(
+                self.stores_of(self.sp.within_bbox(bbox)),
+                self.brute_force(
+                    in_bbox(self.lats, self.lngs, bbox), center, 'mi'
+                )
+            )
+        bbox = [-90, -180, 90, 180]
+        self.assertEqual(len(self.sp.within_bbox(bbox)), len(self.sp.stores))
+
+    def test_within_polygon_matches_brute_force(self):
+        """Test that within_polygon finds every store in the polygon.
+
+        """
+
+        polygon = [[37, -123], [45, -110], [30, -100], [33, -115]]
+        origin = [37.7857, -122.4376]
+        self.assertEqual(
+            self.stores_of(self.sp.within_polygon(polygon, origin, 'km')),
+            self.brute_force(
+                points_in_polygon(self.lats, self.lngs, polygon),
+                origin,
+                'km'
+            )
+        )
+
+    def test_pagination(self):
+        """Test that limit and offset page through the sorted results.
+
+        """
+
+        lat_lng = [37.7857, -122.4376]
+        found = self.sp.within_radius(lat_lng, 100)
+        self.assertGreater(len(found), 10)
+        pages = [
+            self.sp.within_radius(lat_lng, 100, limit=4, offset=offset)
+            for offset in range(0, len(found), 4)
+        ]
+        self.assertTrue(all(len(page) <= 4 for page in pages))
+        self.assertEqual(sum(pages, []), found)
+
+    def test_pending_updates(self):
+        """Test that range queries see added, updated and removed stores.
+
+        """
+
+        lat_lng = [47.6097, -122.3422]
+        before = self.sp.within_radius(lat_lng, 20)
+        self.sp.add_store({
+            'Store Name': 'Pike Place',
+            'Store Location': 'Pike St & 1st Ave',
+            'Address': '1 Pike St',
+            'City': 'Seattle',
+            'State': 'WA',
+            'Zip Code': '98101',
+            'Latitude': '47.6097',
+            'Longitude': '-122.3422',
+            'County': 'King County'
+        })
+        removed = int(numpy.flatnonzero(
+            haversine_distances(
+                lat_lng[0], lat_lng[1], self.lats, self.lngs
+            ) <= 20
+        )[0])
+        self.sp.remove_store(int(self.ids[removed]))
+        found = self.sp.within_radius(lat_lng, 20)
+        self.assertEqual(found[0][0]['Store Name'], 'Pike Place')
+        self.assertEqual(found[0][1], 0)
+        self.assertEqual(len(found), len(before))
+        self.assertNotIn(self.sp.stores[removed], self.stores_of(found))
+        self.assertIn(
+            'Pike Place',
+            [store['Store Name'] for store, _ in self.sp.within_polygon(
+                [[47, -123], [48, -122.5], [47, -122]]
+            )]
+        )
+
+
+class TestStoresParserFilters(unittest.TestCase):
+    """Test nearest store queries with include and exclude filters.
+
+    """
+
+    def setUp(self):
+        """Initialize StoresParser with stores and tree populated.
+
+        """
+
+        self.sp = StoresParser(STORES_CSV)
+        self.sp.get_stores()
+        self.sp.build_tree()
+
+    def brute_force(self, lat_lng, k, include, exclude):
+        """Return the ids of the k closest live stores passing the filter.
+
+        """
+
+        found = []
+        for store_id, store in self.live_stores():
+            if any(
+                    store[fieldname] not in values
+                    for fieldname, values in include.items()):
+                continue
+            if any(
+                    store[fieldname] in values
+                    for fieldname, values in exclude.items()):
+                continue
+            found.append((
+                calculate_distance(
+                    lat_lng,
+                    [float(store['Latitude']), float(store['Longitude'])],
+                    'mi'
+                ),
+                store_id
+            ))
+        return [store_id for _, store_id in sorted(found)[:k]]
+
+    def live_stores(self):
+        """Return the id and store of every live store.
+
+        """
+
+        stores = [
+            (int(self.sp.stores.ids[row]), self.sp.stores[row])
+            for row in range(len(self.sp.stores))
+            if row not in self.sp.removed
+        ]
+        return stores + sorted(self.sp.delta.items())
+
+    def assert_matches_brute_force(self, seed):
+        """Check random filtered queries against brute_force.
+
+        """
+
+        random.seed(seed)
+        states = sorted(set(self.sp.stores.columns['State'].values))
+        for i in range(30):
+            lat_lng = [random.uniform(25, 49), random.uniform(-124, -67)]
+            k = random.randint(1, 5)
+            include = {}
+            if i % 3:
+                include['State'] = random.sample(states, 2)
+            exclude = {'State': [random.choice(states)]}
+            found = self.sp.nearest_candidates(
+                [lat_lng], k, 'mi', None, include, exclude
+            )[0]
+            self.assertEqual(
+                [store_id for _, store_id, _, _ in found],
+                self.brute_force(lat_lng, k, include, exclude)
+            )
+
+    def test_filters_match_brute_force(self):
+        """Test filters that the row index answers without the tree.
+
+        """
+
+        self.assert_matches_brute_force(4)
+
+    def test_unselective_filters_match_brute_force(self):
+        """Test filters answered through the tree.
+
+        """
+
+        with mock.patch('storelocator.csv_parser.FILTER_BRUTE_MAX', 0):
+            self.assert_matches_brute_force(5)
+
+    def test_filters_with_pending_updates(self):
+        """Test that filters see added, updated and removed stores.
+
+        """
+
+        lat_lng = [44.9778, -93.2650]
+        self.sp.add_store({
+            'Store Name': 'Hennepin Ave',
+            'Store Location': 'Hennepin Ave & 7th St',
+            'Address': '700 Hennepin Ave',
+            'City': 'Minneapolis',
+            'State': 'MN',
+            'Zip Code': '55403',
+            'Latitude': '44.9778',
+            'Longitude': '-93.2650',
+            'County': 'Hennepin County'
+        })
+        [(_, removed, _, _)] = self.sp.nearest_candidates(
+            [lat_lng], 1, 'mi', None, {'State': 'WI'}
+        )[0]
+        self.sp.remove_store(removed)
+        for patched in [FILTER_BRUTE_MAX, 0]:
+            with mock.patch(
+                    'storelocator.csv_parser.FILTER_BRUTE_MAX', patched):
+                for include, exclude in [
+                        ({'State': 'MN'}, {}),
+                        ({'State': 'WI'}, {}),
+                        ({}, {'County': 'Hennepin County'})]:
+                    found = self.sp.nearest_candidates(
+                        [lat_lng], 3, 'mi', None, include, exclude
+                    )[0]
+                    self.assertEqual(
+                        [store_id for _, store_id, _, _ in found],
+                        self.brute_force(lat_lng, 3, {
+                            fieldname: [value]
+                            for fieldname, value in include.items()
+                        }, {
+                            fieldname: [value]
+                            for fieldname, value in exclude.items()
+                        })
+                    )
+        found = self.sp.nearest(lat_lng, include={'State': 'MN'})
+        self.assertEqual(found[0][0]['Store Name'], 'Hennepin Ave')
+
+    def test_filter_on_text_field(self):
+        """Test that filtering on a text field raises ValueError.
+
+        """
+
+        with self.assertRaises(ValueError):
+            self.sp.nearest([45, -93], include={'Zip Code': '55403'})
+
+
+class TestStoresParserDistanceModels(unittest.TestCase):
+    """Test nearest store queries ranked by an ellipsoidal distance model.
+
+    """
+
+    def setUp(self):
+        """Initialize StoresParser and random coords across North America.
+
+        """
+
+        self.sp = StoresParser(STORES_CSV)
+        self.sp.get_stores()
+        self.sp.build_tree()
+        rng = random.Random(11)
+        self.lat_lngs = [
+            [rng.uniform(15, 70), rng.uniform(-170, -50)] for _ in range(40)
+        ]
+
+    def brute_force(self, lat_lng, k, units, rows=None):
+        """Return the k nearest stores by Vincenty distance to every store.
+
+        """
+
+        if rows is None:
+            rows = numpy.arange(len(self.sp.stores))
+        distances = vincenty_distances(
+            lat_lng[0],
+            lat_lng[1],
+            self.sp.stores.lats[rows],
+            self.sp.stores.lngs[rows],
+            units
+        )
+        order = numpy.lexsort((self.sp.stores.ids[rows], distances))[:k]
+        return [
+            (
+                self.sp.stores[int(row)],
+                calculate_distance(
+                    lat_lng,
+                    [self.sp.stores.lats[row], self.sp.stores.lngs[row]],
+                    units,
+                    'vincenty'
+                )
+            )
+            for row in rows[order]
+        ]
+
+    def test_vincenty_matches_brute_force(self):
+        """Test that nearest_many with vincenty matches a brute-force search.
+
+        """
+
+        for k in [1, 4]:
+            results = self.sp.nearest_many(
+                self.lat_lngs + [None], k, 'km', model='vincenty'
+            )
+            self.assertEqual(results[-1], [])
+            for lat_lng, result in zip(self.lat_lngs, results):
+                self.assertEqual(result, self.brute_force(lat_lng, k, 'km'))
+
+    def test_filtered_vincenty_matches_brute_force(self):
+        """Test filtered queries with vincenty, with and without the tree.
+
+        """
+
+        include = {'State': ['MN', 'WI']}
+        rows = numpy.flatnonzero(numpy.isin(
+            [store['State'] for store in self.sp.stores], include['State']
+        ))
+        for patched in [FILTER_BRUTE_MAX, 0]:
+            with mock.patch(
+                    'storelocator.csv_parser.FILTER_BRUTE_MAX', patched):
+                for lat_lng in self.lat_lngs[:10]:
+                    self.assertEqual(
+                        self.sp.nearest(
+                            lat_lng, 2, 'mi', include=include,
+                            model='vincenty'
+                        ),
+                        self.brute_force(lat_lng, 2, 'mi', rows)
+                    )
+
+    def test_unknown_distance_model(self):
+        """Test that an unknown distance model raises ValueError.
+
+        """
+
+        with self.assertRaises(ValueError):
+            self.sp.nearest(self.lat_lngs[0], model='flat')
+
+
 if __name__ == '__main__':
     unittest.main()
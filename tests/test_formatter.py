@@ -0,0 +1,138 @@
+import io
+import json
+from storelocator.constants import (
+    OUTPUT_FIELDS,
+    STORES_CSV
+)
+from storelocator.csv_parser import StoresParser
+from storelocator.formatter import (
+    ResultFormatter,
+    format_distances,
+    read_results
+)
+import numpy
+import unittest
+from storelocator.util import (
+    format_distance,
+    format_result
+)
+
+
+class TestFormatDistances(unittest.TestCase):
+    """Test format_distances against format_distance.
+
+    """
+
+    def test_format_distances_match_format_distance(self):
+        """Test random distances, halves, -0.0, large values and NaN.
+
+        """
+
+        rng = numpy.random.default_rng(3)
+        distances = numpy.concatenate([
+            rng.uniform(0, 5000, 5000),
+            numpy.round(rng.uniform(0, 50, 2000), 3),
+            [0.0, -0.0, 0.005, 0.015, 0.125, 2.675, 1.005, -1.125, 1e17],
+            [float('nan')]
+        ]).tolist()
+        for precision in range(4):
+            self.assertEqual(
+                format_distances(distances, precision),
+                [
+                    str(format_distance(distance, precision))
+                    for distance in distances
+                ]
+            )
+
+
+class TestResultFormatter(unittest.TestCase):
+    """Test ResultFormatter output formats.
+
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        """Look up the nearest stores to random locations, and one with none.
+
+        """
+
+        sp = StoresParser(STORES_CSV)
+        sp.ingest()
+        rng = numpy.random.default_rng(5)
+        lat_lngs = numpy.column_stack([
+            rng.uniform(25, 49, 300), rng.uniform(-124, -67, 300)
+        ]).tolist()
+        cls.nearest_many = sp.nearest_many(lat_lngs, 2, 'km') + [[]]
+
+    def old_lines(self, output, units):
+        """Return the lines format_result writes for each result.
+
+        """
+
+        lines = []
+        for nearest in self.nearest_many:
+            if not len(nearest):
+                lines.append(
+                    '{}' if output == 'json' else
+                    format_result(None, None, units, output)
+                )
+            for store, distance in nearest:
+                lines.append(format_result(store, distance, units, output))
+        return lines
+
+    def test_text_and_json_match_format_result(self):
+        for output in ['text', 'json']:
+            formatter = ResultFormatter(output, 'km')
+            self.assertEqual(formatter.header(), '')
+            self.assertEqual(
+                formatter.format_many(self.nearest_many).splitlines(),
+                self.old_lines(output, 'km')
+            )
+
+    def test_selected_fields(self):
+        formatter = ResultFormatter('json', 'mi', ['City', 'State'])
+        lines = formatter.format_many(self.nearest_many[:1]).splitlines()
+        store, distance = self.nearest_many[0][0]
+        self.assertEqual(json.loads(lines[0]), {
+            'City': store['City'],
+            'State': store['State'],
+            'Distance': '{} mi'.format(format_distance(distance))
+        })
+
+    def test_csv(self):
+        formatter = ResultFormatter('csv', 'km')
+        rows = (
+            formatter.header() + formatter.format_many(self.nearest_many)
+        ).splitlines()
+        self.assertEqual(
+            rows[0], ','.join(OUTPUT_FIELDS) + ',Distance (km)'
+        )
+        self.assertEqual(len(rows), 1 + 2 * (len(self.nearest_many) - 1) + 1)
+        self.assertEqual(rows[-1], ',' * len(OUTPUT_FIELDS))
+
+    def test_binary_round_trip(self):
+        formatter = ResultFormatter('binary', 'km', ['Store Name', 'Zip Code'])
+        stream = io.BytesIO(
+            formatter.header() +
+            formatter.format_many(self.nearest_many[:10]) +
+            formatter.format_many(self.nearest_many[10:], 10)
+        )
+        expected = [
+            (i, {
+                'Store Name': store['Store Name'],
+                'Zip Code': store['Zip Code']
+            }, distance)
+            for i, nearest in enumerate(self.nearest_many)
+            for store, distance in nearest
+        ]
+        self.assertEqual(list(read_results(stream)), expected)
+        with self.assertRaises(ValueError):
+            list(read_results(io.BytesIO(b'not results')))
+
+    def test_unknown_output(self):
+        with self.assertRaises(ValueError):
+            ResultFormatter('xml')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,190 @@
+import os
+import shutil
+from storelocator.geocache import (
+    GeocodeCache,
+    normalize_query
+)
+import tempfile
+import unittest
+
+
+class StubGeocoder(object):
+    """Geocoder that records its calls instead of reaching the network.
+
+    """
+
+    def __init__(self, results):
+        self.results = results
+        self.calls = []
+
+    def __call__(self, query):
+        self.calls.append(query)
+        return self.results.get(str(query))
+
+
+class Clock(object):
+    """Clock that only moves when told to.
+
+    """
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestGeocodeCache(unittest.TestCase):
+    """Test GeocodeCache functionality.
+
+    """
+
+    def setUp(self):
+        """Create a stub geocoder, a clock and a temporary directory.
+
+        """
+
+        self.geocoder = StubGeocoder({
+            '94115': [37.7857, -122.4376],
+            '55428': [45.0632, -93.3811]
+        })
+        self.clock = Clock()
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, 'geocodes.sqlite')
+
+    def tearDown(self):
+        """Remove the temporary directory.
+
+        """
+
+        shutil.rmtree(self.tmp)
+
+    def test_normalize_query(self):
+        """Test that case, whitespace and type do not change the key.
+
+        """
+
+        self.assertEqual(normalize_query(94115), '94115')
+        self.assertEqual(
+            normalize_query('  1 Main  St,\tTown '),
+            normalize_query('1 main st, town')
+        )
+
+    def test_cached_calls_skip_geocoder(self):
+        """Test that repeated queries are answered without the geocoder.
+
+        """
+
+        cache = GeocodeCache(clock=self.clock)
+        for query in ['94115', ' 94115', 94115]:
+            self.assertEqual(
+                cache.geocode(query, self.geocoder),
+                [37.7857, -122.4376]
+            )
+        self.assertEqual(self.geocoder.calls, ['94115'])
+        self.assertEqual((cache.hits, cache.misses), (2, 1))
+
+    def test_negative_caching(self):
+        """Test that misses are cached for negative_ttl seconds.
+
+        """
+
+        cache = GeocodeCache(ttl=100, negative_ttl=10, clock=self.clock)
+        self.assertIsNone(cache.geocode('nowhere', self.geocoder))
+        self.assertIsNone(cache.geocode('nowhere', self.geocoder))
+        self.assertEqual(len(self.geocoder.calls), 1)
+        self.clock.now += 11
+        self.assertIsNone(cache.geocode('nowhere', self.geocoder))
+        self.assertEqual(len(self.geocoder.calls), 2)
+
+    def test_ttl(self):
+        """Test that results are geocoded again once they expire.
+
+        """
+
+        cache = GeocodeCache(ttl=100, clock=self.clock)
+        cache.geocode('94115', self.geocoder)
+        self.clock.now += 99
+        cache.geocode('94115', self.geocoder)
+        self.assertEqual(len(self.geocoder.calls), 1)
+        self.clock.now += 2
+        cache.geocode('94115', self.geocoder)
+        self.assertEqual(len(self.geocoder.calls), 2)
+
+    def test_lru_eviction(self):
+        """Test that the least recently used entry is evicted first.
+
+        """
+
+        cache = GeocodeCache(max_size=2, clock=self.clock)
+        cache.geocode('94115', self.geocoder)
+        cache.geocode('55428', self.geocoder)
+        cache.geocode('94115', self.geocoder)
+        cache.geocode('nowhere', self.geocoder)
+        self.assertEqual(cache.get('94115'), (True, [37.7857, -122.4376]))
+        self.assertEqual(cache.get('55428'), (False, None))
+
+    def test_persistent(self):
+        """Test that entries in the database outlive the cache that set them.
+
+        """
+
+        cache = GeocodeCache(self.path, clock=self.clock)
+        cache.geocode('94115', self.geocoder)
+        cache.geocode('nowhere', self.geocoder)
+        cache.close()
+        cache = GeocodeCache(self.path, clock=self.clock)
+        self.assertEqual(
+            cache.geocode('94115', self.geocoder),
+            [37.7857, -122.4376]
+        )
+        self.assertIsNone(cache.geocode('nowhere', self.geocoder))
+        self.assertEqual(len(self.geocoder.calls), 2)
+        self.assertEqual(cache.hits, 2)
+        cache.close()
+
+    def test_persistent_size_limit(self):
+        """Test that the database keeps at most disk_size entries.
+
+        """
+
+        cache = GeocodeCache(
+            self.path, disk_size=1, disk_slack=0, clock=self.clock
+        )
+        cache.geocode('94115', self.geocoder)
+        self.clock.now += 1
+        cache.geocode('55428', self.geocoder)
+        cache.close()
+        cache = GeocodeCache(self.path, clock=self.clock)
+        self.assertEqual(cache.get('94115'), (False, None))
+        self.assertEqual(cache.get('55428'), (True, [45.0632, -93.3811]))
+        cache.close()
+
+    def test_persistent_trimmed_in_batches(self):
+        """Test that the database is trimmed once it exceeds the slack.
+
+        """
+
+        cache = GeocodeCache(
+            self.path, max_size=1, disk_size=3, disk_slack=2, clock=self.clock
+        )
+        for i in range(5):
+            cache.set(str(i), [i, i])
+            self.clock.now += 1
+        self.assertEqual(cache._count(), 5)
+        cache.set('0', [0, 0])
+        self.assertEqual(cache._count(), 5)
+        self.clock.now += 1
+        cache.set('5', [5, 5])
+        self.assertEqual(cache._count(), 3)
+        self.assertEqual(
+            [query for query in map(str, range(6)) if cache.get(query)[0]],
+            ['0', '4', '5']
+        )
+        cache.close()
+        cache = GeocodeCache(self.path)
+        self.assertEqual(cache._rows, 3)
+        cache.close()
+
+if __name__ == '__main__':
+    unittest.main()
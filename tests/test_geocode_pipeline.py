@@ -0,0 +1,169 @@
+import asyncio
+from storelocator.constants import STORES_CSV
+from storelocator.csv_parser import StoresParser
+from storelocator.geocode_pipeline import (
+    GeocodePipeline,
+    TokenBucket,
+    nearest_stream
+)
+import threading
+import time
+import unittest
+
+
+class StubGeocoder(object):
+    """Geocoder with injected latency that records its calls.
+
+    """
+
+    def __init__(self, latency=0.0, failures=0):
+        self.latency = latency
+        self.failures = failures
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def __call__(self, query):
+        with self.lock:
+            self.calls.append(query)
+            fail = self.failures > 0
+            self.failures -= 1
+        time.sleep(self.latency)
+        if fail:
+            raise IOError('geocoder unavailable')
+        if query == 'nowhere':
+            return None
+        return [40.0 + int(query) * 0.01, -100.0]
+
+
+class TestGeocodePipeline(unittest.TestCase):
+    """Test GeocodePipeline functionality.
+
+    """
+
+    def test_results_in_order(self):
+        """Test that geocode_all returns results in the order of queries.
+
+        """
+
+        pipeline = GeocodePipeline(StubGeocoder(), rate=None)
+        self.assertEqual(
+            pipeline.geocode_all(['1', 'nowhere', '3']),
+            [[40.01, -100.0], None, [40.03, -100.0]]
+        )
+
+    def test_concurrency(self):
+        """Test that calls overlap up to the concurrency limit.
+
+        """
+
+        geocoder = StubGeocoder(latency=0.05)
+        pipeline = GeocodePipeline(geocoder, concurrency=10, rate=None)
+        start = time.time()
+        results = pipeline.geocode_all([str(i) for i in range(20)])
+        elapsed = time.time() - start
+        self.assertEqual(len(results), 20)
+        self.assertLess(elapsed, 20 * 0.05 / 2)
+
+    def test_deduplication(self):
+        """Test that identical in-flight queries share one call.
+
+        """
+
+        geocoder = StubGeocoder(latency=0.05)
+        pipeline = GeocodePipeline(geocoder, concurrency=4, rate=None)
+        results = pipeline.geocode_all(['7', ' 7', '7', '8'])
+        self.assertEqual(results[0], results[1])
+        self.assertEqual(sorted(geocoder.calls), ['7', '8'])
+
+    def test_retry(self):
+        """Test that calls that raise are retried with backoff.
+
+        """
+
+        geocoder = StubGeocoder(failures=2)
+        pipeline = GeocodePipeline(
+            geocoder, concurrency=1, rate=None, retries=2, backoff=0.01
+        )
+        self.assertEqual(pipeline.geocode_all(['1']), [[40.01, -100.0]])
+        self.assertEqual(len(geocoder.calls), 3)
+        self.assertEqual(pipeline.failures, 0)
+
+    def test_retries_exhausted(self):
+        """Test that a query that keeps failing resolves to None.
+
+        """
+
+        pipeline = GeocodePipeline(
+            StubGeocoder(failures=5), rate=None, retries=1, backoff=0.01
+        )
+        self.assertEqual(pipeline.geocode_all(['1']), [None])
+        self.assertEqual(pipeline.failures, 1)
+
+    def test_rate_limit(self):
+        """Test that calls start no faster than the rate limit.
+
+        """
+
+        pipeline = GeocodePipeline(StubGeocoder(), concurrency=8, rate=100)
+        start = time.time()
+        pipeline.geocode_all([str(i) for i in range(11)])
+        self.assertGreaterEqual(time.time() - start, 0.09)
+
+
+class TestTokenBucket(unittest.TestCase):
+    """Test TokenBucket functionality.
+
+    """
+
+    def test_acquire_waits_for_refill(self):
+        """Test that acquire waits once the bucket is empty.
+
+        """
+
+        async def acquire_three():
+            bucket = TokenBucket(rate=50, capacity=2)
+            start = time.monotonic()
+            for _ in range(3):
+                await bucket.acquire()
+            return time.monotonic() - start
+
+        elapsed = asyncio.run(acquire_three())
+        self.assertGreaterEqual(elapsed, 0.015)
+        self.assertLess(elapsed, 0.5)
+
+
+class TestNearestStream(unittest.TestCase):
+    """Test nearest_stream function.
+
+    """
+
+    def test_nearest_stream_matches_nearest(self):
+        """Test that streamed results match StoresParser.nearest per query.
+
+        """
+
+        sp = StoresParser(STORES_CSV)
+        sp.get_stores()
+        sp.build_tree()
+        geocoder = StubGeocoder(latency=0.01)
+        pipeline = GeocodePipeline(geocoder, rate=None)
+        queries = [str(i) for i in range(10)] + ['nowhere']
+
+        async def collect():
+            results = {}
+            async for index, query, nearest in nearest_stream(
+                    sp, queries, pipeline, k=2, batch_size=3):
+                results[index] = (query, nearest)
+            return results
+
+        results = asyncio.run(collect())
+        self.assertEqual(len(results), len(queries))
+        self.assertEqual(results[10], ('nowhere', []))
+        for index in range(10):
+            self.assertEqual(
+                results[index],
+                (queries[index], sp.nearest(geocoder(queries[index]), 2))
+            )
+
+if __name__ == '__main__':
+    unittest.main()
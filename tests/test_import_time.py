@@ -0,0 +1,109 @@
+import json
+import os
+from storelocator.constants import STORES_CSV
+from storelocator.csv_parser import StoresParser
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ['scipy', 'geocoder', 'pkg_resources']
+STARTUP_BUDGET = 1.0
+
+
+def run_python(code):
+    """Runs code in a fresh interpreter and returns its json output.
+
+    """
+
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+        [ROOT] + [p for p in [env.get('PYTHONPATH')] if p]
+    )
+    output = subprocess.check_output(
+        [sys.executable, '-c', code], cwd=ROOT, env=env
+    )
+    return json.loads(output.decode('utf-8'))
+
+
+class TestImportTime(unittest.TestCase):
+    """Test that the lookup path starts without its heavy dependencies.
+
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        """Save an index file of store-locations.csv to a temporary directory.
+
+        """
+
+        cls.tmp = tempfile.mkdtemp()
+        cls.csv = os.path.join(cls.tmp, 'stores.csv')
+        shutil.copy(STORES_CSV, cls.csv)
+        StoresParser(cls.csv).ingest()
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp)
+
+    def test_import_skips_heavy_modules(self):
+        result = run_python(
+            'import json, sys, time\n'
+            'start = time.perf_counter()\n'
+            'import storelocator.csv_parser, storelocator.util\n'
+            'print(json.dumps(dict(\n'
+            '    seconds=time.perf_counter() - start,\n'
+            '    modules=[m for m in {!r} if m in sys.modules]\n'
+            ')))\n'.format(HEAVY_MODULES)
+        )
+        self.assertEqual(result['modules'], [])
+        self.assertLess(result['seconds'], STARTUP_BUDGET)
+
+    def test_auto_backend_lookup_skips_scipy(self):
+        result = run_python(
+            'import json, sys, time\n'
+            'start = time.perf_counter()\n'
+            'from storelocator.csv_parser import StoresParser\n'
+            'sp = StoresParser.get_StoresParser({!r}, backend="auto")\n'
+            '_, distance = sp.nearest([45.7833, -108.5007])[0]\n'
+            'print(json.dumps(dict(\n'
+            '    seconds=time.perf_counter() - start,\n'
+            '    backend=type(sp.tree).name,\n'
+            '    distance=distance,\n'
+            '    scipy="scipy" in sys.modules\n'
+            ')))\n'.format(self.csv)
+        )
+        self.assertEqual(result['backend'], 'brute')
+        self.assertFalse(result['scipy'])
+        self.assertLess(result['seconds'], STARTUP_BUDGET)
+        sp = StoresParser.load(self.csv)
+        self.assertEqual(
+            result['distance'], sp.nearest([45.7833, -108.5007])[0][1]
+        )
+
+    def test_help_skips_storelocator_modules(self):
+        result = run_python(
+            'import importlib.util, io, json, sys\n'
+            'from importlib.machinery import SourceFileLoader\n'
+            'loader = SourceFileLoader("__main__", "scripts/find_store")\n'
+            'spec = importlib.util.spec_from_loader("__main__", loader)\n'
+            'sys.argv = ["find_store", "--help"]\n'
+            'sys.stdout = io.StringIO()\n'
+            'try:\n'
+            '    loader.exec_module(importlib.util.module_from_spec(spec))\n'
+            'except SystemExit:\n'
+            '    pass\n'
+            'sys.stdout = sys.__stdout__\n'
+            'print(json.dumps(sorted(\n'
+            '    m for m in sys.modules if m.split(".")[0] in\n'
+            '    ["numpy", "scipy", "geocoder"]\n'
+            ')))\n'
+        )
+        self.assertEqual(result, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,256 @@
+import numpy
+import os
+import shutil
+from storelocator.constants import (
+    INDEX_SUFFIX,
+    STORES_CSV
+)
+from storelocator.csv_parser import StoresParser
+from storelocator.index_file import (
+    FORMAT_VERSION,
+    IndexFormatError,
+    PREAMBLE,
+    StaleIndexError,
+    read_index,
+    write_index
+)
+import tempfile
+import unittest
+
+
+class TestIndexFile(unittest.TestCase):
+    """Test write_index and read_index functions.
+
+    """
+
+    def setUp(self):
+        """Create a temporary directory and arrays to write.
+
+        """
+
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, 'test.idx')
+        self.arrays = {
+            'floats': numpy.arange(12, dtype=numpy.float64).reshape(4, 3),
+            'ints': numpy.array([3, 1, 2], dtype=numpy.int32),
+            'empty': numpy.array([], dtype=numpy.uint8)
+        }
+        self.meta = {'fieldnames': ['a', 'b']}
+
+    def tearDown(self):
+        """Remove the temporary directory.
+
+        """
+
+        shutil.rmtree(self.tmp)
+
+    def test_round_trip(self):
+        """Test that read_index returns the arrays and meta that were written.
+
+        """
+
+        write_index(self.path, self.arrays, self.meta)
+        arrays, meta = read_index(self.path)
+        self.assertEqual(meta, self.meta)
+        self.assertEqual(set(arrays), set(self.arrays))
+        for name, array in self.arrays.items():
+            self.assertEqual(arrays[name].dtype, array.dtype)
+            self.assertTrue(numpy.array_equal(arrays[name], array))
+
+    def test_arrays_are_memory_mapped(self):
+        """Test that read_index returns read-only views of the file.
+
+        """
+
+        write_index(self.path, self.arrays, self.meta)
+        arrays, _ = read_index(self.path)
+        self.assertIsInstance(arrays['floats'], numpy.memmap)
+        self.assertFalse(arrays['floats'].flags.writeable)
+
+    def test_checksum_mismatch(self):
+        """Test that read_index raises IndexFormatError for corrupt data.
+
+        """
+
+        write_index(self.path, self.arrays, self.meta)
+        with open(self.path, 'r+b') as f:
+            f.seek(-1, os.SEEK_END)
+            f.write(b'\xff')
+        with self.assertRaises(IndexFormatError):
+            read_index(self.path)
+
+    def test_data_checksum_is_opt_in(self):
+        """Test that corrupt data is only caught when verify is set.
+
+        """
+
+        write_index(self.path, self.arrays, self.meta)
+        with open(self.path, 'r+b') as f:
+            f.seek(-1, os.SEEK_END)
+            f.write(b'\xff')
+        _, meta = read_index(self.path, verify=False)
+        self.assertEqual(meta, self.meta)
+        with self.assertRaises(IndexFormatError):
+            read_index(self.path, verify=True)
+
+    def test_header_checksum_mismatch(self):
+        """Test that a corrupt header is caught even without verify.
+
+        """
+
+        write_index(self.path, self.arrays, self.meta)
+        with open(self.path, 'r+b') as f:
+            f.seek(PREAMBLE.size + 2)
+            f.write(b'X')
+        with self.assertRaises(IndexFormatError):
+            read_index(self.path, verify=False)
+
+    def test_version_mismatch(self):
+        """Test that read_index raises IndexFormatError for another version.
+
+        """
+
+        write_index(self.path, self.arrays, self.meta)
+        with open(self.path, 'r+b') as f:
+            magic, _, header_length, checksum = PREAMBLE.unpack(
+                f.read(PREAMBLE.size)
+            )
+            f.seek(0)
+            f.write(PREAMBLE.pack(
+                magic, FORMAT_VERSION + 1, header_length, checksum
+            ))
+        with self.assertRaises(IndexFormatError):
+            read_index(self.path)
+
+    def test_write_is_atomic(self):
+        """Test that write_index leaves only the index file behind.
+
+        """
+
+        write_index(self.path, self.arrays, self.meta)
+        write_index(self.path, self.arrays, self.meta)
+        self.assertEqual(os.listdir(self.tmp), ['test.idx'])
+
+    def test_truncated(self):
+        """Test that read_index raises IndexFormatError for a truncated file.
+
+        """
+
+        write_index(self.path, self.arrays, self.meta)
+        with open(self.path, 'r+b') as f:
+            f.truncate(os.path.getsize(self.path) - 8)
+        with self.assertRaises(IndexFormatError):
+            read_index(self.path)
+
+
+class TestStoresParserIndex(unittest.TestCase):
+    """Test that StoresParser saves to and loads from index files.
+
+    """
+
+    def setUp(self):
+        """Copy store-locations.csv to a temporary directory.
+
+        """
+
+        self.tmp = tempfile.mkdtemp()
+        self.csv = os.path.join(self.tmp, 'stores.csv')
+        shutil.copy(STORES_CSV, self.csv)
+
+    def tearDown(self):
+        """Remove the temporary directory.
+
+        """
+
+        shutil.rmtree(self.tmp)
+
+    def test_get_StoresParser_loads_saved_index(self):
+        """Test that a loaded StoresParser matches the one that was saved.
+
+        """
+
+        built = StoresParser.get_StoresParser(self.csv)
+        self.assertTrue(os.path.exists(self.csv + INDEX_SUFFIX))
+        loaded = StoresParser.get_StoresParser(self.csv)
+        self.assertIsInstance(loaded.stores.lats, numpy.memmap)
+        self.assertEqual(list(loaded.stores), list(built.stores))
+        targets = built.stores.ecef[:20] + 10
+        self.assertTrue(numpy.array_equal(
+            loaded.tree.query(targets, k=3)[1],
+            built.tree.query(targets, k=3)[1]
+        ))
+
+    def test_get_StoresParser_rebuilds_corrupt_index(self):
+        """Test that get_StoresParser rebuilds an index file that is corrupt.
+
+        """
+
+        with open(self.csv + INDEX_SUFFIX, 'wb') as f:
+            f.write(b'not an index')
+        sp = StoresParser.get_StoresParser(self.csv)
+        self.assertEqual(len(sp.stores), 1791)
+        self.assertEqual(len(StoresParser.load(self.csv).stores), 1791)
+
+    def test_load_rejects_edited_csv(self):
+        """Test that load raises StaleIndexError once the CSV is edited.
+
+        """
+
+        StoresParser.get_StoresParser(self.csv)
+        with open(self.csv, 'a') as f:
+            f.write('\rExtra,Store,1 Main St,Town,MN,55401,45.0,-93.0,County')
+        with self.assertRaises(StaleIndexError):
+            StoresParser.load(self.csv)
+        sp = StoresParser.get_StoresParser(self.csv)
+        self.assertEqual(len(sp.stores), 1792)
+        self.assertEqual(len(StoresParser.load(self.csv).stores), 1792)
+
+    def test_load_accepts_touched_csv(self):
+        """Test that load accepts a CSV whose mtime changed but not its data.
+
+        """
+
+        StoresParser.get_StoresParser(self.csv)
+        stat = os.stat(self.csv)
+        os.utime(self.csv, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        self.assertEqual(len(StoresParser.load(self.csv).stores), 1791)
+
+    def test_save_compacts_pending_updates(self):
+        """Test that save writes pending updates to the index file.
+
+        """
+
+        sp = StoresParser.get_StoresParser(self.csv)
+        sp.remove_store(0)
+        store_id = sp.add_store(sp.get_store(1))
+        sp.save()
+        loaded = StoresParser.load(self.csv)
+        self.assertEqual(len(loaded.stores), 1791)
+        self.assertEqual(loaded.get_store(store_id), sp.get_store(1))
+        with self.assertRaises(KeyError):
+            loaded.get_store(0)
+        self.assertEqual(loaded.add_store(sp.get_store(1)), store_id + 1)
+
+    def test_removed_ids_not_reused(self):
+        """Test that the id of a removed last store is not reused on load.
+
+        """
+
+        sp = StoresParser.get_StoresParser(self.csv)
+        last = int(sp.stores.ids[-1])
+        sp.remove_store(last)
+        sp.save()
+        loaded = StoresParser.load(self.csv)
+        self.assertEqual(loaded.add_store(sp.get_store(0)), last + 1)
+
+    def test_load_rejects_other_parser_settings(self):
+        """Test that load raises StaleIndexError for another delimiter.
+
+        """
+
+        StoresParser.get_StoresParser(self.csv)
+        with self.assertRaises(StaleIndexError):
+            StoresParser.load(self.csv, delimiter=';')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+import numpy
+import os
+import shutil
+from storelocator.constants import (
+    INDEX_SUFFIX,
+    STORES_CSV
+)
+from storelocator.csv_parser import StoresParser
+from storelocator.ingest import (
+    GrowableArray,
+    ingest_csv
+)
+import tempfile
+import unittest
+
+
+class TestIngest(unittest.TestCase):
+    """Test streaming CSV ingestion.
+
+    """
+
+    def setUp(self):
+        """Copy store-locations.csv to a temporary directory.
+
+        """
+
+        self.tmp = tempfile.mkdtemp()
+        self.csv = os.path.join(self.tmp, 'stores.csv')
+        shutil.copy(STORES_CSV, self.csv)
+
+    def tearDown(self):
+        """Remove the temporary directory.
+
+        """
+
+        shutil.rmtree(self.tmp)
+
+    def test_ingest_csv_matches_get_stores(self):
+        """Test that chunked ingestion builds the same table as get_stores.
+
+        """
+
+        stores, stats = ingest_csv(self.csv, self.tmp, chunk_size=7)
+        expected = StoresParser(self.csv).get_stores()
+        self.assertEqual((stats.rows, stats.skipped), (len(expected), 0))
+        self.assertIsInstance(stores.lats, numpy.memmap)
+        self.assertEqual(list(stores), list(expected))
+        self.assertTrue(numpy.array_equal(stores.ids, expected.ids))
+        self.assertEqual(stores.ecef.shape, (len(expected), 3))
+
+    def test_ingest_skips_malformed_rows(self):
+        """Test that malformed rows are counted and skipped.
+
+        """
+
+        expected = len(StoresParser(self.csv).get_stores())
+        with open(self.csv, 'a') as f:
+            f.write('\rBad Lat,,,,,,north,-122.4,\r')
+            f.write('Out Of Range,,,,,,95,-122.4,\r')
+            f.write('Too Short,,,37.7,-122.4\r')
+            f.write('Too Long,,,,,,37.7,-122.4,,extra\r')
+            f.write('Good,,,,,,37.7,-122.4,\r')
+        sp = StoresParser(self.csv)
+        stats = sp.ingest()
+        self.assertEqual((stats.rows, stats.skipped), (expected + 1, 4))
+        self.assertGreater(stats.rows_per_second, 0)
+        self.assertIn('4 malformed rows skipped', str(stats))
+        self.assertEqual(len(sp.stores), expected + 1)
+        self.assertEqual(sp.stores[-1]['Store Name'], 'Good')
+
+    def test_ingest_saves_index(self):
+        """Test that ingest leaves only the index file behind.
+
+        """
+
+        sp = StoresParser(self.csv)
+        sp.ingest()
+        self.assertEqual(
+            sorted(os.listdir(self.tmp)),
+            ['stores.csv', 'stores.csv' + INDEX_SUFFIX]
+        )
+        loaded = StoresParser.load(self.csv)
+        self.assertEqual(list(loaded.stores), list(sp.stores))
+        lat_lng = [37.7820964, -122.4464697]
+        self.assertEqual(sp.nearest(lat_lng), loaded.nearest(lat_lng))
+
+    def test_growable_array(self):
+        """Test that a GrowableArray memory maps what was appended.
+
+        """
+
+        array = GrowableArray(os.path.join(self.tmp, 'a'), 'f8', (3,))
+        self.assertEqual(array.open().shape, (0, 3))
+        array = GrowableArray(os.path.join(self.tmp, 'b'), 'i8')
+        array.extend([1, 2])
+        array.extend(numpy.arange(3, 6))
+        self.assertEqual(len(array), 5)
+        self.assertEqual(array.open().tolist(), [1, 2, 3, 4, 5])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,216 @@
+from storelocator.constants import (
+    INDEX_SUFFIX,
+    STORES_CSV
+)
+from storelocator.csv_parser import StoresParser
+from storelocator.index_file import read_index
+import numpy
+import os
+import shutil
+import tempfile
+import unittest
+from storelocator.util import haversine_distances
+
+
+def unit_vectors(lats, lngs):
+    """Return the unit vector of each location on a sphere.
+
+    """
+
+    lats = numpy.radians(lats)
+    lngs = numpy.radians(lngs)
+    return numpy.column_stack([
+        numpy.cos(lats) * numpy.cos(lngs),
+        numpy.cos(lats) * numpy.sin(lngs),
+        numpy.sin(lats)
+    ])
+
+
+class TestNearestGrid(unittest.TestCase):
+    """Test NearestGrid lookups against brute force.
+
+    """
+
+    def setUp(self):
+        """Index a copy of store-locations.csv with a grid.
+
+        """
+
+        self.tmp = tempfile.mkdtemp()
+        self.csv = os.path.join(self.tmp, 'stores.csv')
+        shutil.copy(STORES_CSV, self.csv)
+        self.sp = StoresParser(self.csv, grid=True)
+        self.sp.ingest()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def brute_force(self, sp, lat_lngs):
+        """Return the id of the closest store to each location.
+
+        Stores are shortlisted by the dot product of unit vectors, which
+        orders them like haversine distance, and the shortlist is ranked by
+        haversine distance and id.
+
+        """
+
+        lats = numpy.asarray(sp.stores.lats)
+        lngs = numpy.asarray(sp.stores.lngs)
+        ids = numpy.asarray(sp.stores.ids)
+        stores = unit_vectors(lats, lngs)
+        targets = numpy.array(lat_lngs).reshape(-1, 2)
+        shortlist = min(4, len(ids))
+        nearest = []
+        for start in range(0, len(targets), 2000):
+            chunk = targets[start:start + 2000]
+            dots = unit_vectors(chunk[:, 0], chunk[:, 1]).dot(stores.T)
+            rows = numpy.argpartition(-dots, shortlist - 1, axis=1)
+            rows = rows[:, :shortlist]
+            distances = haversine_distances(
+                chunk[:, 0:1], chunk[:, 1:2], lats[rows], lngs[rows]
+            )
+            for row, distance in zip(rows, distances):
+                best = numpy.lexsort((ids[row], distance))[0]
+                nearest.append(int(ids[row[best]]))
+        return nearest
+
+    def grid_ids(self, sp, lat_lngs):
+        """Return the id of the closest store the grid finds per location.
+
+        """
+
+        return [
+            found[0][1] for found in sp.grid_candidates(lat_lngs, 1, 'mi')
+        ]
+
+    def test_dense_grid_matches_brute_force(self):
+        """Test lookups on a dense grid of locations over the stores.
+
+        Every location's closest store must be listed in its cell, and a
+        sample of them is looked up end to end.
+
+        """
+
+        grid = self.sp.grid
+        self.assertIsNotNone(grid)
+        lats = numpy.linspace(
+            grid.lat0,
+            grid.lat0 + grid.shape[0] * grid.cell,
+            3 * grid.shape[0] + 1
+        )
+        lngs = numpy.linspace(
+            grid.lng0,
+            grid.lng0 + grid.shape[1] * grid.cell,
+            3 * grid.shape[1] + 1
+        )
+        lat_lngs = [
+            [lat, lng] for lat in lats.tolist() for lng in lngs.tolist()
+        ]
+        nearest = numpy.searchsorted(
+            self.sp.stores.ids, self.brute_force(self.sp, lat_lngs)
+        )
+        cells = grid.cells_of(
+            lats.repeat(len(lngs)), numpy.tile(lngs, len(lats))
+        )
+        inside = cells >= 0
+        n = len(self.sp.stores)
+        listed = numpy.repeat(
+            numpy.arange(len(grid)), numpy.diff(grid.starts)
+        ) * n + grid.rows
+        wanted = cells[inside] * n + nearest[inside]
+        positions = numpy.minimum(
+            numpy.searchsorted(listed, wanted), len(listed) - 1
+        )
+        self.assertTrue(numpy.all(listed[positions] == wanted))
+        self.assertGreater(inside.mean(), 0.9)
+        sample = lat_lngs[::7]
+        self.assertEqual(
+            self.grid_ids(self.sp, sample),
+            self.brute_force(self.sp, sample)
+        )
+
+    def test_random_locations_match_brute_force(self):
+        """Test random lookups, including ones off the grid.
+
+        """
+
+        rng = numpy.random.default_rng(7)
+        lat_lngs = numpy.column_stack([
+            rng.uniform(-60, 75, 2000), rng.uniform(-180, 180, 2000)
+        ]).tolist()
+        self.assertEqual(
+            self.grid_ids(self.sp, lat_lngs),
+            self.brute_force(self.sp, lat_lngs)
+        )
+        self.assertEqual(
+            self.sp.nearest_many(lat_lngs[:50]),
+            StoresParser.load(self.csv).nearest_many(lat_lngs[:50])
+        )
+
+    def test_grid_persisted(self):
+        """Test that the grid is saved with and loaded from the index file.
+
+        """
+
+        _, meta = read_index(self.csv + INDEX_SUFFIX)
+        self.assertEqual(meta['grid']['shape'], list(self.sp.grid.shape))
+        loaded = StoresParser.get_StoresParser(self.csv)
+        self.assertIsNotNone(loaded.grid)
+        self.assertEqual(
+            loaded.grid.rows.tolist(), self.sp.grid.rows.tolist()
+        )
+        self.assertIsNone(
+            StoresParser.get_StoresParser(self.csv, grid=False).grid
+        )
+        self.assertIsNone(StoresParser.get_StoresParser(self.csv).grid)
+
+    def test_grid_rebuilt_when_catalogue_changes(self):
+        """Test that the grid follows compacted updates and CSV edits.
+
+        """
+
+        lat_lng = [44.9778, -93.2650]
+        self.sp.add_store({
+            'Store Name': 'Hennepin Ave',
+            'Store Location': 'Hennepin Ave & 7th St',
+            'Address': '700 Hennepin Ave',
+            'City': 'Minneapolis',
+            'State': 'MN',
+            'Zip Code': '55403',
+            'Latitude': '44.9778',
+            'Longitude': '-93.2650',
+            'County': 'Hennepin County'
+        })
+        self.assertEqual(
+            self.sp.nearest(lat_lng)[0][0]['Store Name'], 'Hennepin Ave'
+        )
+        self.sp.compact()
+        self.assertEqual(
+            self.grid_ids(self.sp, [lat_lng]),
+            self.brute_force(self.sp, [lat_lng])
+        )
+        with open(self.csv, 'a') as f:
+            f.write(
+                '\rLake St,Lake St & 1st Ave,1 Lake St,Minneapolis,MN,55408,'
+                '44.9483,-93.2780,Hennepin County\r'
+            )
+        sp = StoresParser.get_StoresParser(self.csv)
+        self.assertIsNotNone(sp.grid)
+        self.assertEqual(
+            sp.nearest([44.9483, -93.2780])[0][0]['Store Name'], 'Lake St'
+        )
+
+    def test_larger_k_uses_tree(self):
+        """Test that lookups of more stores than the grid covers are exact.
+
+        """
+
+        lat_lng = [37.7857, -122.4376]
+        self.assertEqual(
+            self.sp.nearest(lat_lng, 5),
+            StoresParser.load(self.csv).nearest(lat_lng, 5)
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
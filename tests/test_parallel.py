@@ -0,0 +1,90 @@
+import numpy
+import os
+import shutil
+from storelocator.constants import (
+    INDEX_SUFFIX,
+    STORES_CSV
+)
+from storelocator.csv_parser import StoresParser
+from storelocator.parallel import ParallelExecutor
+import tempfile
+import unittest
+
+
+class TestParallelExecutor(unittest.TestCase):
+    """Test ParallelExecutor functionality.
+
+    """
+
+    def setUp(self):
+        """Copy store-locations.csv to a temporary directory.
+
+        """
+
+        self.tmp = tempfile.mkdtemp()
+        self.csv = os.path.join(self.tmp, 'stores.csv')
+        shutil.copy(STORES_CSV, self.csv)
+        rng = numpy.random.default_rng(0)
+        self.lat_lngs = numpy.column_stack([
+            rng.uniform(25, 49, 500), rng.uniform(-124, -67, 500)
+        ]).tolist()
+        self.lat_lngs[7] = None
+
+    def tearDown(self):
+        """Remove the temporary directory.
+
+        """
+
+        shutil.rmtree(self.tmp)
+
+    def test_matches_nearest_many(self):
+        """Test that chunked parallel results match in-process, in order.
+
+        """
+
+        sp = StoresParser.get_StoresParser(self.csv)
+        with ParallelExecutor(sp, 2, 37) as executor:
+            self.assertEqual(
+                executor.nearest_many(self.lat_lngs, 3, 'km'),
+                sp.nearest_many(self.lat_lngs, 3, 'km')
+            )
+            self.assertEqual(
+                list(executor.nearest_stream(iter(self.lat_lngs[:50]))),
+                sp.nearest_many(self.lat_lngs[:50])
+            )
+
+    def test_saves_pending_updates(self):
+        """Test that workers see updates made before the pool started.
+
+        """
+
+        sp = StoresParser(self.csv)
+        sp.get_stores()
+        sp.build_tree()
+        self.assertFalse(os.path.exists(self.csv + INDEX_SUFFIX))
+        store = dict(sp.get_store(0), Latitude='10.5', Longitude='20.5')
+        sp.add_store(store)
+        with ParallelExecutor(sp, 2) as executor:
+            nearest = executor.nearest_many([[10.5, 20.5]])
+        self.assertEqual(nearest[0][0], (store, 0.0))
+
+    def test_saves_compacted_updates(self):
+        """Test that workers see updates compacted before the pool started.
+
+        """
+
+        sp = StoresParser.get_StoresParser(self.csv)
+        store = dict(sp.get_store(0), Latitude='10', Longitude='10')
+        store['Store Name'] = 'New'
+        sp.add_store(store)
+        sp.compact()
+        self.assertFalse(sp.pending)
+        self.assertTrue(sp.dirty)
+        with ParallelExecutor(sp, 2) as executor:
+            nearest = executor.nearest_many([[10, 10]])
+        self.assertFalse(sp.dirty)
+        self.assertEqual(nearest, sp.nearest_many([[10, 10]]))
+        self.assertEqual(nearest[0][0][0]['Store Name'], 'New')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+import os
+import shutil
+from storelocator.geocache import GeocodeCache
+from storelocator.providers import (
+    GeocoderLibProvider,
+    GeocoderProvider,
+    GoogleProvider,
+    OfflineProvider,
+    get_provider
+)
+import storelocator.util as util
+import tempfile
+import unittest
+
+
+class CountingProvider(GeocoderProvider):
+    """Remote provider stub that counts its calls.
+
+    """
+
+    name = 'counting'
+
+    def __init__(self):
+        self.calls = 0
+
+    def geocode(self, query):
+        self.calls += 1
+        return [1.0, 2.0]
+
+
+class TestProviders(unittest.TestCase):
+    """Test geocoding providers.
+
+    """
+
+    def setUp(self):
+        """Write reference and zip centroid files to a temporary directory.
+
+        """
+
+        self.tmp = tempfile.mkdtemp()
+        self.csv = os.path.join(self.tmp, 'known.csv')
+        with open(self.csv, 'w') as f:
+            f.write('Address,Latitude,Longitude\n')
+            f.write('"1770 Union St, San Francisco",37.7979,-122.4280\n')
+            f.write('broken,north,west\n')
+        self.zips = os.path.join(self.tmp, 'zips.csv')
+        with open(self.zips, 'w') as f:
+            f.write('zip,lat,lng\n')
+            f.write('94115,37.7857,-122.4376\n')
+
+    def tearDown(self):
+        """Remove the temporary directory.
+
+        """
+
+        shutil.rmtree(self.tmp)
+
+    def test_offline(self):
+        """Test that the offline provider resolves addresses and zip codes.
+
+        """
+
+        provider = OfflineProvider(self.csv, self.zips)
+        self.assertFalse(provider.remote)
+        self.assertEqual(
+            provider.geocode('  1770 UNION st,  San Francisco'),
+            [37.7979, -122.4280]
+        )
+        self.assertEqual(provider.geocode('94115'), [37.7857, -122.4376])
+        self.assertIsNone(provider.geocode('broken'))
+        self.assertEqual(
+            provider.geocode_batch(['94115', 'Nowhere']),
+            [[37.7857, -122.4376], None]
+        )
+
+    def test_get_provider(self):
+        """Test that providers are created by name.
+
+        """
+
+        self.assertIsInstance(get_provider('google'), GoogleProvider)
+        self.assertIsInstance(
+            get_provider('offline', file_path=self.csv),
+            OfflineProvider
+        )
+        provider = get_provider('osm')
+        self.assertIsInstance(provider, GeocoderLibProvider)
+        self.assertEqual(provider.name, 'osm')
+
+    def test_geocode_provider(self):
+        """Test that geocode caches remote providers but not local ones.
+
+        """
+
+        cache = GeocodeCache()
+        remote = CountingProvider()
+        util.geocode('Main St', cache, remote)
+        util.geocode('Main St', cache, remote)
+        self.assertEqual(remote.calls, 1)
+        self.assertEqual(
+            util.geocode('1770 Union St, San Francisco', cache,
+                         OfflineProvider(self.csv)),
+            [37.7979, -122.4280]
+        )
+        self.assertEqual(cache.misses, 1)
+
+    def test_geocode_batch(self):
+        """Test that geocode_batch keeps the order of queries.
+
+        """
+
+        self.assertEqual(
+            util.geocode_batch(
+                ['Nowhere', '1770 Union St, San Francisco'],
+                OfflineProvider(self.csv)
+            ),
+            [None, [37.7979, -122.4280]]
+        )
+
+if __name__ == '__main__':
+    unittest.main()
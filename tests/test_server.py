@@ -0,0 +1,235 @@
+from http.client import HTTPConnection
+import json
+from storelocator.constants import STORES_CSV
+from storelocator.csv_parser import StoresParser
+from storelocator.server import StoreLocatorServer
+import threading
+import time
+import unittest
+from urllib.error import HTTPError
+from urllib.request import urlopen
+from storelocator.util import format_result
+
+
+class TestStoreLocatorServer(unittest.TestCase):
+    """Test StoreLocatorServer functionality.
+
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        """Start a StoreLocatorServer on a free port with a stub geocoder.
+
+        """
+
+        cls.sp = StoresParser(STORES_CSV)
+        cls.sp.get_stores()
+        cls.sp.build_tree()
+        cls.lat_lng = [37.7857, -122.4376]
+        cls.server = StoreLocatorServer(
+            cls.sp,
+            port=0,
+            workers=4,
+            geocoder=lambda query: cls.lat_lng if query == '94115' else None
+        )
+        cls.thread = threading.Thread(target=cls.server.serve_forever)
+        cls.thread.start()
+        cls.url = 'http://127.0.0.1:{}'.format(cls.server.server_address[1])
+
+    @classmethod
+    def tearDownClass(cls):
+        """Stop the StoreLocatorServer.
+
+        """
+
+        cls.server.shutdown()
+        cls.server.server_close()
+        cls.thread.join()
+
+    def get(self, path):
+        """Return the status and decoded JSON body of a GET request.
+
+        """
+
+        try:
+            with urlopen(self.url + path) as response:
+                return response.status, json.loads(response.read())
+        except HTTPError as e:
+            return e.code, json.loads(e.read())
+
+    def expected(self, k, units):
+        """Return format_result JSON objects of the k nearest stores.
+
+        """
+
+        return [
+            json.loads(format_result(result, distance, units, 'json'))
+            for result, distance in self.sp.nearest(self.lat_lng, k, units)
+        ]
+
+    def test_nearest_lat_lng(self):
+        """Test that /nearest by lat and lng matches format_result.
+
+        """
+
+        status, body = self.get('/nearest?lat=37.7857&lng=-122.4376')
+        self.assertEqual(status, 200)
+        self.assertEqual(body, self.expected(1, 'mi')[0])
+
+    def test_nearest_k_units(self):
+        """Test that /nearest with k returns an array of the k nearest stores.
+
+        """
+
+        status, body = self.get(
+            '/nearest?lat=37.7857&lng=-122.4376&k=3&units=km'
+        )
+        self.assertEqual(status, 200)
+        self.assertEqual(body, self.expected(3, 'km'))
+
+    def test_nearest_zip(self):
+        """Test that /nearest by zip geocodes the zip code.
+
+        """
+
+        status, body = self.get('/nearest?zip=94115')
+        self.assertEqual(status, 200)
+        self.assertEqual(body, self.expected(1, 'mi')[0])
+
+    def test_nearest_timings(self):
+        """Test that /nearest with timings=1 embeds per-stage timings.
+
+        """
+
+        status, body = self.get('/nearest?zip=94115&timings=1')
+        self.assertEqual(status, 200)
+        timings = body.pop('Timings')
+        self.assertEqual(body, self.expected(1, 'mi')[0])
+        self.assertEqual(
+            list(timings['stages']),
+            ['geocode', 'knn', 'ball', 'rank', 'distance', 'format']
+        )
+        self.assertGreaterEqual(timings['counts']['candidates'], 1)
+
+    def test_nearest_filters(self):
+        """Test that /nearest applies include and exclude filters.
+
+        """
+
+        status, body = self.get(
+            '/nearest?lat=37.7857&lng=-122.4376&k=2'
+            '&include=State%3DNV&exclude=County%3DWashoe%20County'
+        )
+        self.assertEqual(status, 200)
+        self.assertEqual(body, [
+            json.loads(format_result(result, distance, 'mi', 'json'))
+            for result, distance in self.sp.nearest(
+                self.lat_lng, 2, 'mi',
+                include={'State': 'NV'},
+                exclude={'County': 'Washoe County'}
+            )
+        ])
+        self.assertEqual(self.get(
+            '/nearest?lat=1&lng=2&include=Zip%20Code%3D94115'
+        )[0], 400)
+
+    def test_nearest_distance_model(self):
+        """Test that /nearest ranks and measures stores by the model given.
+
+        """
+
+        status, body = self.get(
+            '/nearest?lat=37.7857&lng=-122.4376&k=2&model=vincenty'
+        )
+        self.assertEqual(status, 200)
+        self.assertEqual(body, [
+            json.loads(format_result(result, distance, 'mi', 'json'))
+            for result, distance in self.sp.nearest(
+                self.lat_lng, 2, 'mi', model='vincenty'
+            )
+        ])
+        self.assertEqual(
+            self.get('/nearest?lat=1&lng=2&model=flat')[0], 400
+        )
+
+    def test_nearest_not_found(self):
+        """Test that /nearest returns 404 and {} when geocoding fails.
+
+        """
+
+        self.assertEqual(self.get('/nearest?address=nowhere'), (404, {}))
+
+    def test_nearest_invalid(self):
+        """Test that /nearest returns 400 for invalid parameters.
+
+        """
+
+        for path in [
+                '/nearest',
+                '/nearest?lat=1',
+                '/nearest?lat=1&lng=2&k=0',
+                '/nearest?lat=1&lng=2&units=ft',
+                '/nearest?lat=nan&lng=2',
+                '/nearest?lat=1&lng=inf',
+                '/nearest?lat=500&lng=2',
+                '/nearest?lat=1&lng=-181',
+                '/nearest?lat=1&lng=2&k=1000000']:
+            status, body = self.get(path)
+            self.assertEqual(status, 400)
+            self.assertIn('error', body)
+
+    def test_concurrent_requests(self):
+        """Test that concurrent requests all get the right answer.
+
+        """
+
+        results = []
+
+        def request():
+            results.append(self.get('/nearest?lat=37.7857&lng=-122.4376'))
+
+        threads = [threading.Thread(target=request) for _ in range(16)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, [(200, self.expected(1, 'mi')[0])] * 16)
+
+    def test_idle_keep_alive_connections(self):
+        """Test that idle keep-alive connections do not hold workers.
+
+        """
+
+        server = StoreLocatorServer(self.sp, port=0, workers=2)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        connections = [
+            HTTPConnection('127.0.0.1', server.server_address[1])
+            for _ in range(3)
+        ]
+        try:
+            for connection in connections[:2]:
+                connection.request('GET', '/nearest?lat=37.7857&lng=-122.4376')
+                response = connection.getresponse()
+                self.assertEqual(response.status, 200)
+                response.read()
+            start = time.perf_counter()
+            connections[2].request('GET', '/nearest?lat=37.7857&lng=-122.4376')
+            response = connections[2].getresponse()
+            self.assertEqual(response.status, 200)
+            response.read()
+            self.assertLess(time.perf_counter() - start, 2)
+            for connection in connections:
+                connection.request('GET', '/nearest?lat=1&lng=2&k=0')
+                response = connection.getresponse()
+                self.assertEqual(response.status, 400)
+                response.read()
+        finally:
+            for connection in connections:
+                connection.close()
+            server.shutdown()
+            server.server_close()
+            thread.join()
+
+if __name__ == '__main__':
+    unittest.main()
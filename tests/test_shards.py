@@ -0,0 +1,181 @@
+import numpy
+import os
+import shutil
+from storelocator.constants import (
+    SHARD_MANIFEST,
+    STORES_CSV
+)
+from storelocator.csv_parser import StoresParser
+from storelocator.index_file import StaleIndexError
+from storelocator.shards import (
+    ShardRouter,
+    build_shards,
+    geohash
+)
+from storelocator.util import find_nearest_store
+import tempfile
+import unittest
+
+
+class TestShards(unittest.TestCase):
+    """Test geohash shards and ShardRouter.
+
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        """Build shards of store-locations.csv in a temporary directory.
+
+        """
+
+        cls.tmp = tempfile.mkdtemp()
+        cls.csv = os.path.join(cls.tmp, 'stores.csv')
+        shutil.copy(STORES_CSV, cls.csv)
+        cls.sp = StoresParser(cls.csv)
+        cls.sp.get_stores()
+        cls.sp.build_tree()
+        cls.directory = os.path.join(cls.tmp, 'shards')
+        cls.cells = build_shards(cls.sp, cls.directory, 3)
+        rng = numpy.random.default_rng(0)
+        cls.lat_lngs = numpy.column_stack([
+            numpy.concatenate([
+                rng.uniform(25, 49, 300), rng.uniform(-90, 90, 100)
+            ]),
+            numpy.concatenate([
+                rng.uniform(-124, -67, 300), rng.uniform(-180, 180, 100)
+            ])
+        ]).tolist()
+
+    @classmethod
+    def tearDownClass(cls):
+        """Remove the temporary directory.
+
+        """
+
+        shutil.rmtree(cls.tmp)
+
+    def test_geohash(self):
+        """Test that geohash matches the reference encoding.
+
+        """
+
+        self.assertEqual(geohash(57.64911, 10.40744, 11), 'u4pruydqqvj')
+        self.assertEqual(geohash(37.7749, -122.4194, 5), '9q8yy')
+
+    def test_build_shards(self):
+        """Test that every store lands in the shard of its geohash.
+
+        """
+
+        self.assertTrue(
+            os.path.exists(os.path.join(self.directory, SHARD_MANIFEST))
+        )
+        router = ShardRouter(self.directory, self.csv)
+        self.assertEqual(len(router), len(self.cells))
+        ids = []
+        for cell in self.cells:
+            shard = router.shard(cell)
+            for lat, lng in zip(shard.stores.lats, shard.stores.lngs):
+                self.assertEqual(geohash(lat, lng, 3), cell)
+            ids.extend(shard.stores.ids.tolist())
+        self.assertEqual(sorted(ids), self.sp.stores.ids.tolist())
+
+    def test_router_matches_unsharded(self):
+        """Test that the router returns exactly what the unsharded index does.
+
+        """
+
+        router = ShardRouter(self.directory)
+        for k in [1, 4]:
+            for units in ['mi', 'km']:
+                self.assertEqual(
+                    router.nearest_many(self.lat_lngs + [None], k, units),
+                    self.sp.nearest_many(self.lat_lngs + [None], k, units)
+                )
+
+    def test_router_filters_match_unsharded(self):
+        """Test that the router applies filters like the unsharded index.
+
+        """
+
+        router = ShardRouter(self.directory)
+        for include, exclude in [
+                ({'State': ['MN', 'TX']}, None),
+                (None, {'State': 'CA'})]:
+            self.assertEqual(
+                router.nearest_many(
+                    self.lat_lngs, 3, 'mi',
+                    include=include, exclude=exclude
+                ),
+                self.sp.nearest_many(
+                    self.lat_lngs, 3, 'mi',
+                    include=include, exclude=exclude
+                )
+            )
+
+    def test_router_distance_model_matches_unsharded(self):
+        """Test that the router ranks by a distance model like the index.
+
+        """
+
+        router = ShardRouter(self.directory)
+        self.assertEqual(
+            router.nearest_many(self.lat_lngs, 3, 'km', model='vincenty'),
+            self.sp.nearest_many(self.lat_lngs, 3, 'km', model='vincenty')
+        )
+
+    def test_router_matches_find_nearest_store(self):
+        """Test that the router agrees with brute force find_nearest_store.
+
+        """
+
+        router = ShardRouter(self.directory)
+        stores = list(self.sp.stores)
+        for lat_lng in self.lat_lngs[::10]:
+            self.assertEqual(
+                router.nearest(lat_lng)[0],
+                find_nearest_store(lat_lng, stores, 'mi')
+            )
+
+    def test_router_range_queries_match_unsharded(self):
+        """Test that ShardRouter range queries match StoresParser's.
+
+        """
+
+        router = ShardRouter(self.directory)
+        queries = [
+            ('within_radius', ([37.7857, -122.4376], 250)),
+            ('within_bbox', ([30, -100, 40, -80],)),
+            ('within_bbox', ([-90, -180, 90, 180],)),
+            ('within_polygon', ([[37, -123], [45, -110], [30, -100]],))
+        ]
+        for name, args in queries:
+            self.assertEqual(
+                getattr(router, name)(*args, limit=40, offset=5),
+                getattr(self.sp, name)(*args, limit=40, offset=5)
+            )
+
+    def test_router_opens_shards_lazily(self):
+        """Test that a local query does not open every shard.
+
+        """
+
+        router = ShardRouter(self.directory)
+        router.nearest([37.7820964, -122.4464697])
+        self.assertLess(len(router._shards), len(self.cells))
+
+    def test_router_stale(self):
+        """Test that shards of an older version of the CSV are rejected.
+
+        """
+
+        with open(self.csv, 'a') as f:
+            f.write('\rNew Store,,,,,,37.7,-122.4,\r')
+        try:
+            with self.assertRaises(StaleIndexError):
+                ShardRouter(self.directory, self.csv)
+        finally:
+            shutil.copy(STORES_CSV, self.csv)
+
+if __name__ == '__main__':
+    unittest.main()
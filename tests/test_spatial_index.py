@@ -0,0 +1,105 @@
+import numpy
+from storelocator.spatial_index import (
+    BruteForceIndex,
+    CKDTreeIndex,
+    KDTreeIndex,
+    get_backend
+)
+import unittest
+
+
+class TestSpatialIndex(unittest.TestCase):
+    """Test SpatialIndex backends.
+
+    """
+
+    def setUp(self):
+        """Setup TestSpatialIndex with random coords.
+
+        """
+
+        rng = numpy.random.default_rng(0)
+        self.ecef = rng.uniform(-6000, 6000, (2000, 3))
+        self.targets = rng.uniform(-6000, 6000, (300, 3))
+
+    def test_backends_agree(self):
+        """Test that cKDTree and KDTree backends answer the same queries.
+
+        """
+
+        compiled = CKDTreeIndex.build(self.ecef)
+        fallback = KDTreeIndex.build(self.ecef)
+        self.assertEqual(len(compiled), len(self.ecef))
+        self.assertTrue(numpy.array_equal(
+            compiled.query(self.targets, 3)[1],
+            fallback.query(self.targets, 3)[1]
+        ))
+        self.assertEqual(
+            [sorted(rows) for rows in
+             compiled.query_ball_point(self.targets, 500)],
+            [sorted(rows) for rows in
+             fallback.query_ball_point(self.targets, 500)]
+        )
+
+    def test_arrays_round_trip(self):
+        """Test that a tree restored from its arrays answers like the original.
+
+        """
+
+        for backend in [CKDTreeIndex, KDTreeIndex]:
+            index = backend.build(self.ecef)
+            arrays, meta = index.to_arrays()
+            restored = backend.from_arrays(arrays, meta, self.ecef)
+            self.assertIs(type(restored.tree), backend.tree_class())
+            self.assertTrue(numpy.array_equal(
+                restored.query(self.targets, 2)[1],
+                index.query(self.targets, 2)[1]
+            ))
+
+    def test_other_backend_rebuilds(self):
+        """Test that arrays saved by another backend are rebuilt, not used.
+
+        """
+
+        arrays, meta = KDTreeIndex.build(self.ecef).to_arrays()
+        restored = CKDTreeIndex.from_arrays(arrays, meta, self.ecef)
+        self.assertIs(type(restored.tree), CKDTreeIndex.tree_class())
+        self.assertIsNone(CKDTreeIndex.from_arrays(arrays, meta, None))
+
+    def test_get_backend(self):
+        """Test that backends are looked up by name.
+
+        """
+
+        self.assertIs(get_backend('ckdtree'), CKDTreeIndex)
+        self.assertIs(get_backend('kdtree'), KDTreeIndex)
+        self.assertIs(get_backend('brute'), BruteForceIndex)
+        self.assertIs(get_backend('auto', 100), BruteForceIndex)
+        self.assertIs(get_backend('auto', 10 ** 9), CKDTreeIndex)
+        with self.assertRaises(ValueError):
+            get_backend('rtree')
+
+    def test_brute_force_matches_tree(self):
+        """Test that BruteForceIndex answers like cKDTree.
+
+        """
+
+        tree = CKDTreeIndex.build(self.ecef)
+        brute = BruteForceIndex.from_arrays({}, None, self.ecef)
+        self.assertEqual(len(brute), len(self.ecef))
+        for k in [1, 5]:
+            distances, indices = brute.query(self.targets, k)
+            expected_distances, expected_indices = tree.query(self.targets, k)
+            self.assertTrue(numpy.array_equal(indices, expected_indices))
+            self.assertTrue(numpy.allclose(distances, expected_distances))
+        radii = numpy.linspace(0, 3000, len(self.targets))
+        self.assertEqual(
+            [sorted(rows) for rows in
+             brute.query_ball_point(self.targets, radii)],
+            [sorted(rows) for rows in
+             tree.query_ball_point(self.targets, radii)]
+        )
+        self.assertEqual(brute.query_ball_point(self.ecef[:1], 0), [[0]])
+
+if __name__ == '__main__':
+    unittest.main()
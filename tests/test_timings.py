@@ -0,0 +1,161 @@
+from argparse import Namespace
+import io
+import json
+from storelocator.constants import (
+    INC_RADIUS,
+    INITIAL_RADIUS,
+    STORES_CSV
+)
+from storelocator.csv_parser import StoresParser
+from storelocator.geocache import GeocodeCache
+from storelocator.providers import GeocoderProvider
+from storelocator.timings import (
+    Timings,
+    embed_timings,
+    profile
+)
+import unittest
+from storelocator.util import (
+    filter_stores,
+    geocode,
+    geodetic2ecef,
+    validate_args
+)
+
+
+class CountingProvider(GeocoderProvider):
+    """Remote provider stub that resolves every query to one location.
+
+    """
+
+    name = 'counting'
+
+    def geocode(self, query):
+        return [45.7833, -108.5007]
+
+
+class TestTimings(unittest.TestCase):
+    """Test Timings functionality.
+
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        """Load store-locations.csv and build its tree.
+
+        """
+
+        cls.sp = StoresParser(STORES_CSV)
+        cls.sp.get_stores()
+        cls.sp.build_tree()
+
+    def test_stages_and_counts(self):
+        """Test that stages accumulate and call the callback.
+
+        """
+
+        calls = []
+        timings = Timings(callback=lambda name, seconds: calls.append(name))
+        timings.add('load', 0.5)
+        timings.add('load', 0.25)
+        with timings.stage('search'):
+            pass
+        timings.count('candidates', 3)
+        timings.count('candidates')
+        result = timings.to_dict()
+        self.assertEqual(list(result['stages']), ['load', 'search'])
+        self.assertEqual(result['stages']['load'], 750.0)
+        self.assertEqual(result['counts'], {'candidates': 4})
+        self.assertEqual(calls, ['load', 'load', 'search'])
+        self.assertIn('candidates', str(timings))
+
+    def test_nearest_records_stages(self):
+        """Test that nearest records its stages without changing results.
+
+        """
+
+        timings = Timings()
+        lat_lng = [45.7833, -108.5007]
+        self.assertEqual(
+            self.sp.nearest(lat_lng, 3, 'mi', timings),
+            self.sp.nearest(lat_lng, 3, 'mi')
+        )
+        self.assertEqual(
+            list(timings.stages), ['knn', 'ball', 'rank', 'distance']
+        )
+        self.assertGreaterEqual(timings.counts['candidates'], 3)
+
+    def test_filter_stores_counts_radius_iterations(self):
+        """Test that filter_stores counts how often it grew the radius.
+
+        """
+
+        timings = Timings()
+        stores = filter_stores(
+            self.sp,
+            geodetic2ecef(45.7833, -108.5007),
+            INITIAL_RADIUS,
+            INC_RADIUS,
+            timings
+        )
+        self.assertGreaterEqual(timings.counts['radius_iterations'], 1)
+        self.assertEqual(timings.counts['candidates'], len(stores))
+
+    def test_geocode_counts_cache_hits(self):
+        """Test that geocode counts cache misses and hits.
+
+        """
+
+        timings = Timings()
+        cache = GeocodeCache()
+        provider = CountingProvider()
+        for _ in range(3):
+            geocode('Billings, MT', cache, provider, timings)
+        self.assertEqual(
+            timings.counts, {'cache_misses': 1, 'cache_hits': 2}
+        )
+
+    def test_embed_timings(self):
+        """Test that embed_timings adds a Timings field to a json result.
+
+        """
+
+        timings = Timings()
+        timings.add('load', 0.001)
+        embedded = json.loads(embed_timings('{"Store Name": "A"}', timings))
+        self.assertEqual(embedded['Store Name'], 'A')
+        self.assertEqual(embedded['Timings'], timings.to_dict())
+        self.assertIn('Timings', json.loads(embed_timings({}, timings)))
+
+    def test_timings_rejected_with_serve(self):
+        """Test that --timings is rejected for --serve, not ignored.
+
+        """
+
+        args = Namespace(
+            address=None, zip=None, units=None, output=None, serve=True,
+            timings=True
+        )
+        self.assertFalse(validate_args(args)['is_valid'])
+        args.timings = False
+        self.assertTrue(validate_args(args)['is_valid'])
+
+    def test_profile(self):
+        """Test that profile reports with either profiler.
+
+        """
+
+        for mode, expected in [
+                ('cprofile', 'function calls'),
+                ('tracemalloc', 'Peak traced memory')]:
+            stream = io.StringIO()
+            with profile(mode, stream):
+                self.sp.nearest([45.7833, -108.5007])
+            self.assertIn(expected, stream.getvalue())
+        with self.assertRaises(ValueError):
+            with profile('perf'):
+                pass
+
+
+if __name__ == '__main__':
+    unittest.main()
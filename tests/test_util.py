@@ -1,10 +1,39 @@
+from argparse import Namespace
 from decimal import Decimal
+import numpy
+import random
 import unittest
+from storelocator.constants import (
+    A,
+    B,
+    SPHERICAL_ERROR,
+    STORES_CSV
+)
+from storelocator.csv_parser import StoresParser
+from storelocator.geodesic import (
+    karney_distances,
+    vincenty_distances
+)
+import importlib.util
 from storelocator.util import (
+    bbox_circle,
     calculate_distance,
+    distance_function,
     find_nearest_store,
+    find_nearest_stores,
+    find_nearest_stores_batch,
     format_distance,
-    format_result
+    format_result,
+    geodetic2ecef,
+    haversine_distances,
+    in_bbox,
+    parse_bbox,
+    parse_distance_model,
+    parse_filters,
+    parse_polygon,
+    points_in_polygon,
+    polygon_bbox,
+    validate_args
 )
 
 
@@ -103,6 +132,438 @@ class TestFindNearestStore(unittest.TestCase):
         )
 
 
+class TestFindNearestStores(unittest.TestCase):
+    """Test find_nearest_stores function.
+
+    """
+
+    def setUp(self):
+        """Setup TestFindNearestStores with a StoresParser and coords.
+
+        """
+
+        self.sp = StoresParser(STORES_CSV)
+        self.sp.get_stores()
+        self.lat_lngs = [
+            [45.5576428, -108.3942141],
+            None,
+            [37.7989666, -122.4425364]
+        ]
+
+    def test_find_nearest_stores_matches_find_nearest_store(self):
+        """Test that find_nearest_stores matches find_nearest_store per coords.
+
+        """
+
+        results = find_nearest_stores(self.lat_lngs, self.sp.stores, 'km')
+        for lat_lng, result in zip(self.lat_lngs, results):
+            self.assertEqual(
+                result,
+                find_nearest_store(lat_lng, self.sp.stores, 'km')
+            )
+
+    def test_find_nearest_stores_stores_None(self):
+        """Test that find_nearest_stores returns (None, None) per coords.
+
+        """
+
+        self.assertEqual(
+            find_nearest_stores(self.lat_lngs, None, 'mi'),
+            [(None, None)] * 3
+        )
+
+
+class TestHaversineDistances(unittest.TestCase):
+    """Test haversine_distances function.
+
+    """
+
+    def setUp(self):
+        """Setup TestHaversineDistances with random coords.
+
+        """
+
+        rng = random.Random(0)
+        self.lat_lngs_a = [
+            [rng.uniform(-90, 90), rng.uniform(-180, 180)] for _ in range(50)
+        ]
+        self.lat_lngs_b = [
+            [rng.uniform(-90, 90), rng.uniform(-180, 180)] for _ in range(40)
+        ]
+
+    def test_haversine_distances_match_calculate_distance(self):
+        """Test that haversine_distances matches calculate_distance (km).
+
+        """
+
+        a = numpy.array(self.lat_lngs_a)
+        b = numpy.array(self.lat_lngs_b)
+        distances = haversine_distances(
+            a[:, 0:1], a[:, 1:2], b[:, 0], b[:, 1], 'km'
+        )
+        self.assertEqual(distances.shape, (50, 40))
+        for i, lat_lng_a in enumerate(self.lat_lngs_a):
+            for j, lat_lng_b in enumerate(self.lat_lngs_b):
+                self.assertAlmostEqual(
+                    distances[i, j],
+                    calculate_distance(lat_lng_a, lat_lng_b, 'km'),
+                    delta=1e-9
+                )
+
+    def test_haversine_distances_mi(self):
+        """Test that haversine_distances returns correct distance (mi).
+
+        """
+
+        self.assertAlmostEqual(
+            float(haversine_distances(
+                45.7711784, -108.582727, 45.5576428, -108.3942141, 'mi'
+            )),
+            17.33592977022824,
+            delta=1e-9
+        )
+
+
+class TestDistanceModels(unittest.TestCase):
+    """Test the ellipsoidal distance models.
+
+    """
+
+    def setUp(self):
+        """Setup TestDistanceModels with random pairs of nearby coords.
+
+        """
+
+        rng = numpy.random.default_rng(3)
+        self.lats_a = rng.uniform(-89, 89, 2000)
+        self.lngs_a = rng.uniform(-180, 180, 2000)
+        spread = rng.choice([0.001, 0.1, 1.0, 20.0], 2000)
+        self.lats_b = numpy.clip(
+            self.lats_a + rng.normal(0, 1, 2000) * spread, -90, 90
+        )
+        self.lngs_b = self.lngs_a + rng.normal(0, 1, 2000) * spread
+
+    def test_vincenty_known_distance(self):
+        """Test Vincenty's distance from Flinders Peak to Buninyong.
+
+        """
+
+        self.assertAlmostEqual(
+            float(vincenty_distances(
+                -37.95103341, 144.42486789, -37.65282113, 143.92649554, 'km'
+            )),
+            54.972271,
+            delta=1e-6
+        )
+
+    def test_vincenty_within_spherical_error(self):
+        """Test that Vincenty's distances are within SPHERICAL_ERROR.
+
+        """
+
+        vincenty = vincenty_distances(
+            self.lats_a, self.lngs_a, self.lats_b, self.lngs_b, 'km'
+        )
+        haversine = haversine_distances(
+            self.lats_a, self.lngs_a, self.lats_b, self.lngs_b, 'km'
+        )
+        self.assertTrue(numpy.all(
+            numpy.abs(vincenty - haversine) <= SPHERICAL_ERROR * haversine
+        ))
+
+    def test_vincenty_arrays_match_calculate_distance(self):
+        """Test that vincenty_distances matches calculate_distance.
+
+        """
+
+        distances = vincenty_distances(
+            self.lats_a[:50], self.lngs_a[:50],
+            self.lats_b[:50], self.lngs_b[:50], 'mi'
+        )
+        for i in range(50):
+            self.assertAlmostEqual(
+                distances[i],
+                calculate_distance(
+                    [self.lats_a[i], self.lngs_a[i]],
+                    [self.lats_b[i], self.lngs_b[i]],
+                    'mi',
+                    'vincenty'
+                ),
+                delta=1e-9
+            )
+
+    def test_find_nearest_store_by_model(self):
+        """Test a store nearest on the sphere but not on the ellipsoid.
+
+        One degree of latitude is shorter at the equator than one degree
+        of longitude, so the store to the north is nearer on the ellipsoid.
+
+        """
+
+        stores = [
+            {'Latitude': '0.0', 'Longitude': '0.9975'},
+            {'Latitude': '1.0', 'Longitude': '0.0'}
+        ]
+        self.assertIs(find_nearest_store([0, 0], stores, 'km')[0], stores[0])
+        store, distance = find_nearest_store(
+            [0, 0], stores, 'km', 'vincenty'
+        )
+        self.assertIs(store, stores[1])
+        self.assertAlmostEqual(distance, 110.574, delta=1e-3)
+        self.assertEqual(
+            find_nearest_stores([[0, 0], None], stores, 'km', 'vincenty'),
+            [(store, distance), (None, None)]
+        )
+
+    @unittest.skipUnless(
+        importlib.util.find_spec('geographiclib'), 'needs geographiclib'
+    )
+    def test_karney_matches_vincenty(self):
+        """Test that Karney's and Vincenty's distances agree.
+
+        """
+
+        numpy.testing.assert_allclose(
+            karney_distances(
+                self.lats_a, self.lngs_a, self.lats_b, self.lngs_b, 'km'
+            ),
+            vincenty_distances(
+                self.lats_a, self.lngs_a, self.lats_b, self.lngs_b, 'km'
+            ),
+            rtol=0,
+            atol=1e-6
+        )
+
+    def test_unknown_distance_model(self):
+        """Test that unknown distance models raise ValueError.
+
+        """
+
+        with self.assertRaises(ValueError):
+            distance_function('flat')
+        with self.assertRaises(ValueError):
+            parse_distance_model('flat')
+        self.assertEqual(parse_distance_model('vincenty'), 'vincenty')
+
+
+class TestGeodetic2Ecef(unittest.TestCase):
+    """Test geodetic2ecef function.
+
+    """
+
+    def test_geodetic2ecef_wgs84(self):
+        """Test that the equator and poles land on the WGS84 axes.
+
+        """
+
+        x, y, z = geodetic2ecef(0, 0)
+        self.assertAlmostEqual(x, A, delta=1e-9)
+        self.assertAlmostEqual(z, 0, delta=1e-9)
+        x, y, z = geodetic2ecef(90, 0)
+        self.assertAlmostEqual(z, B, delta=1e-6)
+        x, y, z = geodetic2ecef(-90, 0)
+        self.assertAlmostEqual(z, -B, delta=1e-6)
+
+    def test_geodetic2ecef_arrays_match_scalar(self):
+        """Test that arrays convert to an (N, 3) array matching floats.
+
+        """
+
+        rng = random.Random(0)
+        lat_lngs = [
+            [rng.uniform(-90, 90), rng.uniform(-180, 180)] for _ in range(50)
+        ]
+        lat_lngs = numpy.array(lat_lngs)
+        ecef = geodetic2ecef(lat_lngs[:, 0], lat_lngs[:, 1])
+        self.assertEqual(ecef.shape, (50, 3))
+        for (lat, lng), xyz in zip(lat_lngs.tolist(), ecef):
+            numpy.testing.assert_allclose(
+                xyz, geodetic2ecef(lat, lng), rtol=0, atol=1e-9
+            )
+        self.assertEqual(geodetic2ecef([], []).shape, (0, 3))
+
+
+class TestRegions(unittest.TestCase):
+    """Test bounding box and polygon helpers.
+
+    """
+
+    def test_in_bbox(self):
+        """Test in_bbox, including boxes across the antimeridian.
+
+        """
+
+        lats = [10, 10, 10, 30]
+        lngs = [175, -175, 0, 179]
+        self.assertEqual(
+            in_bbox(lats, lngs, [0, 170, 20, -170]).tolist(),
+            [True, True, False, False]
+        )
+        self.assertEqual(
+            in_bbox(lats, lngs, [0, -10, 20, 10]).tolist(),
+            [False, False, True, False]
+        )
+
+    def test_bbox_circle_encloses_bbox(self):
+        """Test that every point of a box is within bbox_circle's radius.
+
+        """
+
+        random.seed(4)
+        for _ in range(50):
+            lat = random.uniform(-80, 70)
+            lng = random.uniform(-180, 180)
+            bbox = [
+                lat, lng,
+                min(90, lat + random.uniform(0, 20)),
+                (lng + random.uniform(0, 180) + 180) % 360 - 180
+            ]
+            center, radius = bbox_circle(bbox)
+            lats = numpy.random.uniform(bbox[0], bbox[2], 200)
+            lngs = bbox[1] + numpy.random.uniform(0, 1, 200) * (
+                (bbox[3] - bbox[1]) % 360
+            )
+            self.assertTrue(numpy.all(haversine_distances(
+                center[0], center[1], lats, lngs, 'km'
+            ) <= radius + 1e-6))
+        self.assertIsNone(bbox_circle([0, -170, 10, 170])[1])
+
+    def test_points_in_polygon(self):
+        """Test points_in_polygon on a concave polygon.
+
+        """
+
+        polygon = [[0, 0], [0, 10], [10, 10], [5, 5], [10, 0]]
+        self.assertEqual(
+            points_in_polygon(
+                [2, 8, 8, 5, 11], [5, 1, 5, 8, 5], polygon
+            ).tolist(),
+            [True, True, False, True, False]
+        )
+        self.assertEqual(polygon_bbox(polygon), [0, 0, 10, 10])
+
+    def test_parse_bbox(self):
+        """Test that parse_bbox reads and validates a bounding box.
+
+        """
+
+        self.assertEqual(parse_bbox('1,2,3,4'), [1, 2, 3, 4])
+        for text in ['1,2,3', 'a,b,c,d', '3,2,1,4', '1,200,3,4']:
+            with self.assertRaises(ValueError):
+                parse_bbox(text)
+
+    def test_parse_polygon(self):
+        """Test that parse_polygon reads and validates a polygon.
+
+        """
+
+        self.assertEqual(
+            parse_polygon('1,2; 3,4; 5,6'), [[1, 2], [3, 4], [5, 6]]
+        )
+        for text in ['1,2;3,4', '1,2;3,4;5', '1,2;3,4;95,6']:
+            with self.assertRaises(ValueError):
+                parse_polygon(text)
+
+    def test_parse_filters(self):
+        """Test that parse_filters groups values by categorical field.
+
+        """
+
+        self.assertEqual(
+            parse_filters(['State=MN', 'State = WI', 'County=Polk County']),
+            {'State': ['MN', 'WI'], 'County': ['Polk County']}
+        )
+        for pairs in [['State'], ['=MN'], ['Zip Code=55401']]:
+            with self.assertRaises(ValueError):
+                parse_filters(pairs)
+
+
+class TestValidateArgs(unittest.TestCase):
+    """Test validate_args checks of numeric options.
+
+    """
+
+    def args(self, **kwargs):
+        """Return arguments of a zip code lookup, with kwargs set.
+
+        """
+
+        return Namespace(
+            address=None, zip='94115', units=None, output=None, **kwargs
+        )
+
+    def test_processes(self):
+        for processes, is_valid in [(None, True), (0, True), (4, True),
+                                    (-2, False)]:
+            self.assertEqual(
+                validate_args(self.args(processes=processes))['is_valid'],
+                is_valid
+            )
+
+    def test_workers(self):
+        for workers, is_valid in [(1, True), (8, True), (0, False),
+                                  (-1, False)]:
+            self.assertEqual(
+                validate_args(self.args(workers=workers))['is_valid'],
+                is_valid
+            )
+
+    def test_concurrency_and_rate(self):
+        for concurrency, rate, is_valid in [
+                (8, 50.0, True), (1, 0.5, True), (0, 50.0, False),
+                (8, 0.0, False), (8, -1.0, False), (8, float('nan'), False)]:
+            self.assertEqual(
+                validate_args(
+                    self.args(concurrency=concurrency, rate=rate)
+                )['is_valid'],
+                is_valid
+            )
+
+
+class TestFindNearestStoresBatch(unittest.TestCase):
+    """Test find_nearest_stores_batch function.
+
+    """
+
+    def setUp(self):
+        """Setup TestFindNearestStoresBatch with a StoresParser and coords.
+
+        """
+
+        self.sp = StoresParser(STORES_CSV)
+        self.sp.get_stores()
+        self.sp.build_tree()
+        self.lat_lngs = [
+            [45.5576428, -108.3942141],
+            None,
+            [37.7989666, -122.4425364],
+            [44.977753, -93.2650108]
+        ]
+
+    def test_find_nearest_stores_batch_matches_brute_force(self):
+        """Test that batch results match a brute-force search of all stores.
+
+        """
+
+        results = find_nearest_stores_batch(self.sp, self.lat_lngs, 'mi')
+        self.assertEqual(len(results), len(self.lat_lngs))
+        for lat_lng, result in zip(self.lat_lngs, results):
+            if lat_lng is None:
+                self.assertEqual(result, (None, None))
+            else:
+                self.assertEqual(
+                    result,
+                    find_nearest_store(lat_lng, self.sp.stores, 'mi')
+                )
+
+    def test_find_nearest_stores_batch_empty(self):
+        """Test that find_nearest_stores_batch returns [] for no coords.
+
+        """
+
+        self.assertEqual(find_nearest_stores_batch(self.sp, [], 'mi'), [])
+
+
 class TestCalculateDistance(unittest.TestCase):
     """Test calculate_distance function.
 
@@ -301,6 +762,15 @@ class TestFormatResult(unittest.TestCase):
             '{"Store Name": "Test Store Name", "Store Location": "Test Store Location", "Address": "Test Address", "City": "Test City", "State": "Test State", "Zip Code": "Test Zip Code", "Latitude": "Test Latitude", "Longitude": "Test Longitude", "County": "Test County", "Distance": "2.11 km"}'
         )
 
+    def test_format_result_json_leaves_result(self):
+        """Test that format_result does not add Distance to the result.
+
+        """
+
+        result = dict(self.result)
+        format_result(result, 2.1111, 'km', 'json')
+        self.assertEqual(result, self.result)
+
     def test_format_result_result_None_text(self):
         """Test that format_result returns correct text output for None result.
 
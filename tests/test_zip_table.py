@@ -0,0 +1,121 @@
+import os
+import shutil
+from storelocator.constants import INDEX_SUFFIX
+from storelocator.geocache import GeocodeCache
+import storelocator.util as util
+from storelocator.zip_table import (
+    ZipTable,
+    get_zip_table,
+    parse_zip
+)
+import tempfile
+import unittest
+
+
+class TestZipTable(unittest.TestCase):
+    """Test ZipTable functionality.
+
+    """
+
+    def setUp(self):
+        """Write zip,lat,lng and gazetteer files to a temporary directory.
+
+        """
+
+        self.tmp = tempfile.mkdtemp()
+        self.csv = os.path.join(self.tmp, 'zips.csv')
+        with open(self.csv, 'w') as f:
+            f.write('zip,lat,lng\n')
+            f.write('94115,37.7857,-122.4376\n')
+            f.write('00601,18.180555,-66.749961\n')
+            f.write('55428,45.0632,-93.3811\n')
+            f.write('bad,1,2\n')
+        self.gazetteer = os.path.join(self.tmp, 'gazetteer.txt')
+        with open(self.gazetteer, 'w') as f:
+            f.write('GEOID\tALAND\tINTPTLAT\tINTPTLONG                 \n')
+            f.write('94115\t2\t37.7857\t-122.4376\n')
+
+    def tearDown(self):
+        """Remove the temporary directory.
+
+        """
+
+        shutil.rmtree(self.tmp)
+
+    def test_parse_zip(self):
+        """Test that zip codes and ZIP+4 are recognized and addresses are not.
+
+        """
+
+        self.assertEqual(parse_zip('94115'), 94115)
+        self.assertEqual(parse_zip(' 00601 '), 601)
+        self.assertEqual(parse_zip('94115-1234'), 94115)
+        self.assertEqual(parse_zip(94115), 94115)
+        self.assertIsNone(parse_zip('1770 Union St, San Francisco'))
+        self.assertIsNone(parse_zip('9411'))
+
+    def test_lookup(self):
+        """Test that lookup finds centroids and misses unknown zip codes.
+
+        """
+
+        table = ZipTable.from_csv(self.csv)
+        self.assertEqual(len(table), 3)
+        self.assertEqual(table.lookup('94115'), [37.7857, -122.4376])
+        self.assertEqual(table.lookup('00601'), [18.180555, -66.749961])
+        self.assertEqual(table.lookup('55428-3507'), [45.0632, -93.3811])
+        self.assertIsNone(table.lookup('10001'))
+        self.assertIsNone(table.lookup('Main St'))
+
+    def test_gazetteer(self):
+        """Test that the Census gazetteer's columns are recognized.
+
+        """
+
+        table = ZipTable.from_csv(self.gazetteer)
+        self.assertEqual(table.lookup(94115), [37.7857, -122.4376])
+
+    def test_load_compiles_index(self):
+        """Test that load saves sorted arrays and rebuilds them on change.
+
+        """
+
+        table = ZipTable.load(self.csv)
+        self.assertTrue(os.path.exists(self.csv + INDEX_SUFFIX))
+        self.assertEqual(table.lookup('94115'), [37.7857, -122.4376])
+        with open(self.csv, 'a') as f:
+            f.write('10001,40.7506,-73.9972\n')
+        self.assertEqual(
+            ZipTable.load(self.csv).lookup('10001'),
+            [40.7506, -73.9972]
+        )
+
+    def test_get_zip_table_missing(self):
+        """Test that get_zip_table returns None when the file is missing.
+
+        """
+
+        self.assertIsNone(get_zip_table(os.path.join(self.tmp, 'none.csv')))
+        self.assertIsNone(get_zip_table(None))
+
+    def test_geocode_uses_zip_table(self):
+        """Test that geocode answers zip codes from the table offline.
+
+        """
+
+        cache = GeocodeCache()
+        cache.set('10001', None)
+        previous = util.zip_centroids_csv
+        util.set_zip_centroids(self.csv)
+        try:
+            self.assertEqual(
+                util.geocode('94115', cache),
+                [37.7857, -122.4376]
+            )
+            self.assertIsNone(util.geocode('10001', cache))
+            self.assertEqual((cache.hits, cache.misses), (1, 0))
+        finally:
+            util.set_zip_centroids(previous)
+
+if __name__ == '__main__':
+    unittest.main()